@@ -0,0 +1,694 @@
+# Precompiled pincode boundary artifact
+#
+#   python boundary_store.py [All_India_pincode_Boundary-19312.geojson] [--levels 2000 500 100] [--workers N]
+#                            [--static-dir static/geometry]
+#
+# Parsing the raw GeoJSON (PIN column detection, reprojection to EPSG:3857,
+# simplification, reprojection back) costs many seconds on the first
+# "Generate map" of every fresh Streamlit process. This module does that work
+# once and writes a normalized, PIN-keyed GeoParquet next to the GeoJSON, plus a
+# small JSON manifest with the content hashes of the source and the artifact.
+# The build also ingests the boundaries: invalid geometries are repaired and
+# duplicate features of one pincode are dissolved into a single (multi)polygon,
+# so the store holds exactly one row per PIN, indexed by the integer PIN.
+# Repair, dissolve and simplification are spread over all cores.
+# A per-pincode framing table (bbox, centroid, area) is written alongside, so a
+# state's bbox / centre / zoom is a lookup rather than a geometry scan.
+# Several simplification tolerances (a "pyramid") are built from one parse so
+# the renderer can ship coarse outlines for All India and sharp ones per state.
+# Each level also gets a shared-arc TopoJSON (geo_encode.py) whose arcs are
+# simplified after sharing, so neighbouring pincodes stay gap-free.
+# Each level is also written as flat arrays (coordinates, ring / part /
+# feature offsets, PINs) in one file that server processes memory-map
+# read-only: the OS shares its pages, and shapely geometries are only rebuilt
+# for the rows a map needs (FlatBoundaries).
+# A level's TopoJSON can be published as a static asset under a content-hashed
+# name (`--static-dir static/geometry`), so browsers fetch and cache geometry
+# once and each map ships only its values.
+# The apps load the artifact through Arrow and only fall back to the raw
+# GeoJSON when it is missing or stale.
+# Several server processes may write the cache at once (the runtime fallback):
+# files are written under per-process temporary names and moved into place and
+# recorded in the manifest as one step under a lock file; every file is checked
+# against its manifest record (size / mtime, else sha256) before it is used.
+import os, re, json, math, time, shutil, hashlib, argparse
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from geo_encode import build_topology
+
+BOUNDARY_CACHE_DIR = "boundary_cache"   # created next to the GeoJSON
+MANIFEST_FORMAT = 1
+PIN_COL_CANDIDATES = ["pincode", "pin", "postalcode", "postcode"]
+DEFAULT_LEVELS_M = [2000, 500, 100]     # coarse -> fine simplification tolerances
+PIN_INDEX = "pin"                       # integer PIN index of ingested stores
+STATIC_GEOMETRY_DIR = os.path.join("static", "geometry")   # Streamlit serves ./static at /app/static
+MANIFEST_LOCK_STALE_S = 30              # a manifest lock this old was left by a writer that died
+MANIFEST_LOCK_TIMEOUT_S = 60            # longest wait for another process's manifest update
+
+
+# ================= Hashing / paths =================
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def cache_dir_for(geojson_path: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(geojson_path)), BOUNDARY_CACHE_DIR)
+
+def manifest_path_for(geojson_path: str) -> str:
+    stem = os.path.splitext(os.path.basename(geojson_path))[0]
+    return os.path.join(cache_dir_for(geojson_path), f"{stem}.manifest.json")
+
+def artifact_path_for(geojson_path: str, simplify_m: int) -> str:
+    stem = os.path.splitext(os.path.basename(geojson_path))[0]
+    return os.path.join(cache_dir_for(geojson_path), f"{stem}.s{int(simplify_m or 0)}.parquet")
+
+def frames_path_for(geojson_path: str) -> str:
+    stem = os.path.splitext(os.path.basename(geojson_path))[0]
+    return os.path.join(cache_dir_for(geojson_path), f"{stem}.frames.parquet")
+
+def topology_path_for(geojson_path: str, simplify_m: int) -> str:
+    return os.path.splitext(artifact_path_for(geojson_path, simplify_m))[0] + ".topo.json"
+
+def flat_path_for(geojson_path: str, simplify_m: int) -> str:
+    return os.path.splitext(artifact_path_for(geojson_path, simplify_m))[0] + ".flat"
+
+def _tmp_path(path: str) -> str:
+    """Per-process temporary name next to `path`: concurrent writers never share one."""
+    return f"{path}.{os.getpid()}.tmp"
+
+def read_manifest(geojson_path: str):
+    try:
+        with open(manifest_path_for(geojson_path), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("format") == MANIFEST_FORMAT else None
+
+def _write_manifest(geojson_path: str, manifest: dict):
+    path = manifest_path_for(geojson_path)
+    tmp = _tmp_path(path)
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+@contextmanager
+def manifest_lock(geojson_path: str, timeout_s: float = MANIFEST_LOCK_TIMEOUT_S):
+    """Hold the boundary cache's manifest exclusively (across processes) for a read-modify-write.
+
+    The lock is a file created with O_EXCL next to the manifest; one older than
+    MANIFEST_LOCK_STALE_S was left by a writer that died and is taken over.
+    """
+    path = manifest_path_for(geojson_path) + ".lock"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    deadline = time.monotonic() + timeout_s
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > MANIFEST_LOCK_STALE_S:
+                    os.remove(path)
+                    continue
+            except OSError:
+                continue   # released meanwhile
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{path} is held by another process")
+            time.sleep(0.05)
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        yield
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _file_entry(path: str) -> dict:
+    """Manifest record of a cache file: name, content hash, and size / mtime for the fast check."""
+    st_ = os.stat(path)
+    return {"file": os.path.basename(path), "sha256": file_sha256(path),
+            "size": st_.st_size, "mtime_ns": st_.st_mtime_ns}
+
+@lru_cache(maxsize=64)
+def _sha256_of(path: str, size: int, mtime_ns: int) -> str:
+    return file_sha256(path)
+
+def file_is_current(path: str, entry: dict) -> bool:
+    """True when `path` is the file its manifest `entry` recorded.
+    Size + mtime is the fast path; the content hash is only recomputed (once per version) when they differ."""
+    try:
+        st_ = os.stat(path)
+    except OSError:
+        return False
+    if entry.get("size") == st_.st_size and entry.get("mtime_ns") == st_.st_mtime_ns:
+        return True
+    return entry.get("sha256") == _sha256_of(path, st_.st_size, st_.st_mtime_ns)
+
+def _source_stat(geojson_path: str) -> dict:
+    st_ = os.stat(geojson_path)
+    return {"source_size": st_.st_size, "source_mtime_ns": st_.st_mtime_ns}
+
+def source_is_current(geojson_path: str, manifest) -> bool:
+    """True when the manifest was built from the GeoJSON currently on disk.
+    Size + mtime is the fast path; the content hash is only recomputed when they differ."""
+    if not manifest:
+        return False
+    if not os.path.exists(geojson_path):
+        return True  # artifact-only deploy: nothing newer to compare against
+    stat = _source_stat(geojson_path)
+    if all(manifest.get(k) == v for k, v in stat.items()):
+        return True
+    return manifest.get("source_sha256") == file_sha256(geojson_path)
+
+
+# ================= Normalization =================
+def normalize_pin_series(s: pd.Series) -> pd.Series:
+    return s.astype(str).str.extract(r"(\d{6})", expand=False)
+
+def detect_pin_column(gdf) -> str:
+    def _n(x): return re.sub(r"[^a-z0-9]", "", x.lower())
+    props = [c for c in gdf.columns if c != "geometry"]
+    cand = {_n(c): c for c in props}
+    for k in PIN_COL_CANDIDATES:
+        if k in cand: return cand[k]
+    for c in props:
+        if gdf[c].astype(str).str.fullmatch(r"\d{6}", na=False).mean() > 0.6:
+            return c
+    raise ValueError("Could not detect a 6-digit PIN column in GeoJSON.")
+
+def read_raw_geojson(path: str):
+    try:
+        return gpd.read_file(path, engine="pyogrio")
+    except Exception:
+        return gpd.read_file(path)
+
+def normalize_boundaries(gdf, pin_col: str):
+    """Normalize PINs, drop rows without one and make sure the frame is EPSG:4326."""
+    gdf[pin_col] = normalize_pin_series(gdf[pin_col])
+    gdf = gdf.dropna(subset=[pin_col])
+    if gdf.crs is None:
+        gdf = gdf.set_crs(epsg=4326, allow_override=True)
+    elif gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(epsg=4326)
+    return gdf
+
+def simplify_boundaries(gdf, simplify_m: int, workers: int = 1):
+    """Simplify in metres (EPSG:3857) and come back to EPSG:4326."""
+    if not simplify_m or simplify_m <= 0:
+        return gdf
+    g2 = gdf.to_crs(epsg=3857)
+    parts = _pmap(_simplify_chunk, [(c, simplify_m) for c in _split(g2.geometry.values, workers)], workers)
+    g2["geometry"] = np.concatenate(parts) if parts else g2.geometry.values
+    return g2.to_crs(epsg=4326)
+
+def load_raw_boundaries(path: str, simplify_m: int):
+    """The original slow path: parse, detect, normalize and simplify the raw GeoJSON."""
+    gdf = read_raw_geojson(path)
+    pin_col = detect_pin_column(gdf)
+    gdf = normalize_boundaries(gdf, pin_col)
+    return simplify_boundaries(gdf, simplify_m), pin_col
+
+
+# ================= Ingestion (parallel) =================
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+def _split(values, workers: int):
+    """Chunks for the process pool: a few per worker to even out slow chunks."""
+    n = max(1, min(len(values), workers * 4)) if workers > 1 else 1
+    return [c for c in np.array_split(np.asarray(values, dtype=object), n) if len(c)]
+
+def _pmap(fn, items, workers: int):
+    if workers <= 1 or len(items) < 2:
+        return [fn(x) for x in items]
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        return list(ex.map(fn, items))
+
+def _simplify_chunk(args):
+    geoms, simplify_m = args
+    return shapely.simplify(geoms, simplify_m, preserve_topology=True)
+
+def _polygonal(geom):
+    """Polygonal part of a repaired geometry (make_valid may emit lines/points)."""
+    if geom is None or shapely.get_type_id(geom) in (3, 6):
+        return geom
+    parts = [p for p in shapely.get_parts(geom) if shapely.get_type_id(p) in (3, 6)]
+    return shapely.union_all(parts) if parts else None
+
+def _repair_chunk(geoms):
+    bad = ~shapely.is_valid(geoms)
+    out = geoms.copy()
+    out[bad] = [_polygonal(g) for g in shapely.make_valid(geoms[bad])]
+    return out, int(bad.sum())
+
+def _dissolve_chunk(groups):
+    return [shapely.union_all(g) for g in groups]
+
+def ingest_boundaries(gdf, pin_col: str, workers: int = 1):
+    """Repair invalid geometries and dissolve duplicate PINs into one feature each.
+
+    Returns (frame indexed by integer PIN and sorted by it, report dict).
+    """
+    n_in = len(gdf)
+    chunks = _pmap(_repair_chunk, _split(gdf.geometry.values, workers), workers)
+    geoms = np.concatenate([c for c, _ in chunks]) if chunks else np.array([], dtype=object)
+    repaired = sum(n for _, n in chunks)
+    keep = ~shapely.is_empty(geoms) & pd.notna(geoms)
+    pins, geoms = gdf[pin_col].to_numpy()[keep], geoms[keep]
+
+    order = np.argsort(pins, kind="stable")
+    pins, geoms = pins[order], geoms[order]
+    uniq, start, counts = np.unique(pins, return_index=True, return_counts=True)
+    merged = geoms[start].copy()
+    dup = np.flatnonzero(counts > 1)
+    if len(dup):
+        groups = np.empty(len(dup), dtype=object)
+        for j, i in enumerate(dup):
+            groups[j] = geoms[start[i]:start[i] + counts[i]]
+        merged[dup] = np.concatenate(_pmap(_dissolve_chunk, _split(groups, workers), workers))
+
+    out = gpd.GeoDataFrame({pin_col: uniq}, geometry=merged, crs=gdf.crs,
+                           index=pd.Index(uniq.astype(np.int32), name=PIN_INDEX))
+    report = {"features_in": int(n_in), "repaired": int(repaired), "dropped_empty": int((~keep).sum()),
+              "pins_dissolved": int(len(dup)), "features_out": int(len(out)), "workers": int(workers)}
+    return out, report
+
+
+# ================= Build / load =================
+def write_artifact(geojson_path: str, gdf, pin_col: str, simplify_m: int, source_sha256: str = None,
+                   keep_existing: bool = False) -> dict:
+    """Write one simplified level as GeoParquet and record it in the manifest.
+
+    The level's other files (topojson, flat) stay recorded: they come from the same
+    source. With `keep_existing` (the runtime fallback) a level that another process
+    recorded for this source in the meantime is left as it is.
+    """
+    os.makedirs(cache_dir_for(geojson_path), exist_ok=True)
+    if source_sha256 is None:
+        source_sha256 = file_sha256(geojson_path)
+    key = str(int(simplify_m or 0))
+    out = artifact_path_for(geojson_path, simplify_m)
+    tmp = _tmp_path(out)
+    frame = gdf[[pin_col, "geometry"]]
+    if frame.index.name != PIN_INDEX:
+        frame = frame.reset_index(drop=True)
+    frame.to_parquet(tmp, compression="zstd")
+
+    with manifest_lock(geojson_path):
+        manifest = read_manifest(geojson_path)
+        if not manifest or manifest.get("source_sha256") != source_sha256:
+            manifest = {"format": MANIFEST_FORMAT, "levels": {}}
+        elif keep_existing and key in manifest["levels"]:
+            os.remove(tmp)
+            return manifest
+        os.replace(tmp, out)
+        manifest.update(_source_stat(geojson_path))
+        manifest.update({
+            "source": os.path.basename(geojson_path),
+            "source_sha256": source_sha256,
+            "pin_col": pin_col,
+        })
+        manifest["levels"].setdefault(key, {}).update(_file_entry(out), features=int(len(gdf)))
+        _write_manifest(geojson_path, manifest)
+    return manifest
+
+def build_artifact(geojson_path: str, simplify_m: int) -> dict:
+    gdf, pin_col = load_raw_boundaries(geojson_path, simplify_m)
+    return write_artifact(geojson_path, gdf, pin_col, simplify_m)
+
+def write_topology(geojson_path: str, base, pin_col: str, simplify_m: int) -> dict:
+    """Write the shared-arc TopoJSON for one level (arcs simplified after sharing).
+
+    Must run after `write_artifact` for the same level, which owns the manifest entry.
+    """
+    topo = build_topology(base.geometry.values, simplify_m=simplify_m, ids=base[pin_col].tolist())
+    out = topology_path_for(geojson_path, simplify_m)
+    tmp = _tmp_path(out)
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(topo, f, separators=(",", ":"))
+
+    with manifest_lock(geojson_path):
+        os.replace(tmp, out)
+        manifest = read_manifest(geojson_path)
+        manifest["levels"][str(int(simplify_m or 0))]["topojson"] = dict(_file_entry(out), arcs=len(topo["arcs"]))
+        _write_manifest(geojson_path, manifest)
+    return manifest
+
+def build_pyramid(geojson_path: str, levels=DEFAULT_LEVELS_M, topology: bool = True,
+                  workers: int = None, flat: bool = True) -> dict:
+    """Parse and ingest the GeoJSON once, then write one artifact per simplification level."""
+    workers = workers or default_workers()
+    raw, pin_col = load_raw_boundaries(geojson_path, 0)
+    base, report = ingest_boundaries(raw, pin_col, workers)
+    source_sha256 = file_sha256(geojson_path)
+    manifest = None
+    for simplify_m in levels:
+        gdf = simplify_boundaries(base, simplify_m, workers)
+        manifest = write_artifact(geojson_path, gdf, pin_col, simplify_m, source_sha256)
+        if topology:
+            manifest = write_topology(geojson_path, base, pin_col, simplify_m)
+        if flat:
+            manifest = write_flat(geojson_path, gdf, pin_col, simplify_m)
+    write_frame_index(geojson_path, build_frame_index(base, pin_col))
+    with manifest_lock(geojson_path):
+        manifest = read_manifest(geojson_path)
+        manifest["ingest"] = report
+        _write_manifest(geojson_path, manifest)
+    return manifest
+
+def load_artifact(geojson_path: str, simplify_m: int):
+    """Return (gdf, pin_col) from a fresh artifact, or None if it is missing or stale."""
+    manifest = read_manifest(geojson_path)
+    level = (manifest or {}).get("levels", {}).get(str(int(simplify_m or 0)))
+    path = artifact_path_for(geojson_path, simplify_m)
+    if not level or not file_is_current(path, level) or not source_is_current(geojson_path, manifest):
+        return None
+    try:
+        gdf = gpd.read_parquet(path)
+    except Exception:
+        return None
+    return gdf, manifest["pin_col"]
+
+def load_topology(geojson_path: str, simplify_m: int):
+    """Return the precomputed TopoJSON for a level, or None if missing or stale."""
+    manifest = read_manifest(geojson_path)
+    level = (manifest or {}).get("levels", {}).get(str(int(simplify_m or 0)), {})
+    path = topology_path_for(geojson_path, simplify_m)
+    if "topojson" not in level or not file_is_current(path, level["topojson"]) \
+            or not source_is_current(geojson_path, manifest):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def boundary_version(geojson_path: str, simplify_m: int) -> str:
+    """Cheap token that changes whenever load_boundaries() would return different data.
+
+    The level's artifact hash when the cache is fresh, else the source size and mtime.
+    Used to key process-wide shared frames (st.cache_resource) so a rebuilt cache
+    or a new GeoJSON is picked up without restarting the server.
+    """
+    manifest = read_manifest(geojson_path)
+    level = (manifest or {}).get("levels", {}).get(str(int(simplify_m or 0)))
+    if level and source_is_current(geojson_path, manifest):
+        return level["sha256"]
+    if not os.path.exists(geojson_path):
+        return "missing"
+    stat = _source_stat(geojson_path)
+    return f"raw:{stat['source_size']}:{stat['source_mtime_ns']}"
+
+def load_boundaries(geojson_path: str, simplify_m: int):
+    """Fast path for the apps' `load_geojson`.
+
+    Loads the precompiled artifact when it is present and built from the current
+    GeoJSON; otherwise parses the raw file and (best effort) writes the artifact
+    so the next process starts fast.
+    """
+    loaded = load_artifact(geojson_path, simplify_m)
+    if loaded is not None:
+        return loaded
+    gdf, pin_col = load_raw_boundaries(geojson_path, simplify_m)
+    try:
+        # another process may have built the level while this one parsed: keep theirs
+        write_artifact(geojson_path, gdf, pin_col, simplify_m, keep_existing=True)
+    except OSError:
+        pass  # read-only deploys (or a manifest lock that is not released) still work, just without the cache
+    return gdf, pin_col
+
+
+# ================= Flat shared store =================
+FLAT_ALIGN = 64   # byte alignment of each array in the .flat file
+
+def _pins_of(gdf, pin_col: str) -> np.ndarray:
+    if gdf.index.name == PIN_INDEX:
+        return gdf.index.to_numpy().astype(np.int32)
+    return gdf[pin_col].astype(np.int32).to_numpy()
+
+def write_flat(geojson_path: str, gdf, pin_col: str, simplify_m: int) -> dict:
+    """Write one level as flat arrays in a single memory-mappable file.
+
+    Arrays: coords (n, 2) float64, ring_offsets (into coords), part_offsets (into
+    rings), geom_offsets (into parts) and pins int32 -- shapely's ragged
+    MultiPolygon layout. Must run after `write_artifact` for the same level,
+    which owns the manifest entry.
+    """
+    kind, coords, offsets = shapely.to_ragged_array(np.asarray(gdf.geometry.values))
+    if kind == shapely.GeometryType.POLYGON:     # no MultiPolygons: one part per feature
+        offsets = (*offsets, np.arange(len(offsets[1]), dtype=offsets[1].dtype))
+    arrays = {"coords": coords, "ring_offsets": offsets[0], "part_offsets": offsets[1],
+              "geom_offsets": offsets[2], "pins": _pins_of(gdf, pin_col)}
+
+    out = flat_path_for(geojson_path, simplify_m)
+    tmp, layout, pos = _tmp_path(out), {}, 0
+    with open(tmp, "wb") as f:
+        for name, a in arrays.items():
+            a = np.ascontiguousarray(a)
+            pad = -pos % FLAT_ALIGN
+            f.write(b"\0" * pad)
+            pos += pad
+            layout[name] = {"offset": pos, "dtype": a.dtype.str, "shape": list(a.shape)}
+            f.write(a.tobytes())
+            pos += a.nbytes
+
+    with manifest_lock(geojson_path):
+        os.replace(tmp, out)
+        manifest = read_manifest(geojson_path)
+        manifest["levels"][str(int(simplify_m or 0))]["flat"] = dict(_file_entry(out), layout=layout)
+        _write_manifest(geojson_path, manifest)
+    return manifest
+
+def _take_ragged(offsets: np.ndarray, idx: np.ndarray):
+    """Offsets of the sub-ranges `idx` laid end to end, and the child positions they cover."""
+    starts, lengths = offsets[idx], offsets[idx + 1] - offsets[idx]
+    new = np.zeros(len(idx) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new[1:])
+    children = np.repeat(starts - new[:-1], lengths) + np.arange(new[-1])
+    return new, children
+
+class FlatBoundaries:
+    """Zero-copy, read-only view of one level's .flat file.
+
+    The file is memory-mapped, so every process that opens it shares the same
+    page-cache pages; shapely geometries exist only for the rows asked for, for
+    as long as the caller holds them.
+    """
+
+    def __init__(self, path: str, layout: dict, pin_col: str):
+        self.path, self.pin_col = path, pin_col
+        buf = np.memmap(path, mode="r", dtype=np.uint8)
+        for name, spec in layout.items():
+            shape = tuple(spec["shape"])
+            arr = np.frombuffer(buf, dtype=np.dtype(spec["dtype"]), count=math.prod(shape), offset=spec["offset"])
+            setattr(self, name, arr.reshape(shape))
+
+    def __len__(self) -> int:
+        return len(self.pins)
+
+    def pin_strings(self) -> pd.Series:
+        """PINs as the 6-character strings the frames carry in `pin_col`."""
+        return pd.Series(self.pins.astype(str), name=self.pin_col)
+
+    def geometries(self, rows=None) -> np.ndarray:
+        """Shapely geometries for `rows` (positions; all when None), single-part ones as Polygons."""
+        geom_offsets, part_offsets, ring_offsets, coords = \
+            self.geom_offsets, self.part_offsets, self.ring_offsets, self.coords
+        if rows is not None:
+            geom_offsets, parts = _take_ragged(self.geom_offsets, np.asarray(rows, dtype=np.int64))
+            part_offsets, rings = _take_ragged(self.part_offsets, parts)
+            ring_offsets, points = _take_ragged(self.ring_offsets, rings)
+            coords = self.coords[points]
+        geoms = shapely.from_ragged_array(shapely.GeometryType.MULTIPOLYGON, np.asarray(coords),
+                                          (ring_offsets, part_offsets, geom_offsets))
+        single = shapely.get_num_geometries(geoms) == 1
+        geoms[single] = shapely.get_geometry(geoms[single], 0)
+        return geoms
+
+    def frame(self, rows=None):
+        """(GeoDataFrame, pin_col) for `rows`, shaped like load_boundaries() output."""
+        pins = self.pins if rows is None else self.pins[np.asarray(rows, dtype=np.int64)]
+        return gpd.GeoDataFrame({self.pin_col: pins.astype(str)}, geometry=self.geometries(rows), crs="EPSG:4326",
+                                index=pd.Index(pins, name=PIN_INDEX)), self.pin_col
+
+def load_flat(geojson_path: str, simplify_m: int):
+    """FlatBoundaries for a level, or None if its .flat file is missing or stale."""
+    manifest = read_manifest(geojson_path)
+    level = (manifest or {}).get("levels", {}).get(str(int(simplify_m or 0)), {})
+    path = flat_path_for(geojson_path, simplify_m)
+    if "flat" not in level or not file_is_current(path, level["flat"]) \
+            or not source_is_current(geojson_path, manifest):
+        return None
+    try:
+        return FlatBoundaries(path, level["flat"]["layout"], manifest["pin_col"])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+# ================= State partitions =================
+def build_state_index(pins: pd.Series, membership: pd.DataFrame,
+                      pin_col: str = "pincode", state_col: str = "state") -> dict:
+    """state -> sorted row positions into a boundary frame, from PIN -> state membership.
+
+    `pins` is the boundary frame's (normalized) PIN column; `membership` is e.g.
+    v_pincode_master. A PIN listed under several states belongs to each of them.
+    """
+    rows = pd.DataFrame({pin_col: pins.to_numpy(), "_pos": np.arange(len(pins))})
+    m = membership[[pin_col, state_col]].dropna().drop_duplicates()
+    joined = m.merge(rows, on=pin_col, how="inner")
+    return {s: np.sort(grp["_pos"].to_numpy()) for s, grp in joined.groupby(state_col)}
+
+
+# ================= Framing =================
+def build_frame_index(gdf, pin_col: str) -> pd.DataFrame:
+    """Per-pincode bbox, centroid and (approximate) area, one row per boundary row."""
+    bounds = gdf.geometry.bounds
+    merc = gdf.geometry.to_crs(epsg=3857)
+    cent = merc.centroid.to_crs(epsg=4326)
+    # Web-Mercator area inflates by 1/cos²(lat); undo it for centroid weighting
+    area_km2 = merc.area.to_numpy() * np.cos(np.radians(cent.y.to_numpy())) ** 2 / 1e6
+    return pd.DataFrame({
+        "pincode": gdf[pin_col].to_numpy(),
+        "minx": bounds["minx"].to_numpy(), "miny": bounds["miny"].to_numpy(),
+        "maxx": bounds["maxx"].to_numpy(), "maxy": bounds["maxy"].to_numpy(),
+        "cx": cent.x.to_numpy(), "cy": cent.y.to_numpy(), "area_km2": area_km2,
+    })
+
+def write_frame_index(geojson_path: str, frames: pd.DataFrame) -> dict:
+    """Write the framing table and record it in the manifest (after the levels' `write_artifact`)."""
+    out = frames_path_for(geojson_path)
+    tmp = _tmp_path(out)
+    frames.to_parquet(tmp, index=False)
+    with manifest_lock(geojson_path):
+        os.replace(tmp, out)
+        manifest = read_manifest(geojson_path)
+        manifest["frames"] = dict(_file_entry(out), rows=int(len(frames)))
+        _write_manifest(geojson_path, manifest)
+    return manifest
+
+def load_frame_index(geojson_path: str):
+    """Per-pincode framing table from the boundary cache, or None if missing or stale."""
+    manifest = read_manifest(geojson_path)
+    path = frames_path_for(geojson_path)
+    if not manifest or "frames" not in manifest or not file_is_current(path, manifest["frames"]) \
+            or not source_is_current(geojson_path, manifest):
+        return None
+    return pd.read_parquet(path)
+
+def fit_zoom(bounds, width_px: int = 1000, height_px: int = 720, padding_px: int = 20,
+             min_zoom: int = 3, max_zoom: int = 12) -> int:
+    """Deepest integer Web-Mercator zoom at which (minx, miny, maxx, maxy) fits the viewport."""
+    minx, miny, maxx, maxy = bounds
+    merc_y = lambda lat: math.log(math.tan(math.pi / 4 + math.radians(max(min(lat, 85.0), -85.0)) / 2))
+    x_frac = max((maxx - minx) / 360.0, 1e-9)
+    y_frac = max((merc_y(maxy) - merc_y(miny)) / (2 * math.pi), 1e-9)
+    zx = math.log2((width_px - 2 * padding_px) / 256.0 / x_frac)
+    zy = math.log2((height_px - 2 * padding_px) / 256.0 / y_frac)
+    return int(max(min_zoom, min(max_zoom, math.floor(min(zx, zy)))))
+
+def frame_for(frames: pd.DataFrame, **fit_kwargs) -> dict:
+    """bbox / area-weighted centre / recommended zoom for a set of framing rows."""
+    bounds = (float(frames["minx"].min()), float(frames["miny"].min()),
+              float(frames["maxx"].max()), float(frames["maxy"].max()))
+    w = frames["area_km2"].to_numpy()
+    w = w if w.sum() > 0 else np.ones(len(frames))
+    center = [float(np.average(frames["cy"], weights=w)), float(np.average(frames["cx"], weights=w))]
+    return {
+        "bounds": [[bounds[1], bounds[0]], [bounds[3], bounds[2]]],   # Leaflet [[s, w], [n, e]]
+        "center": center,
+        "zoom": fit_zoom(bounds, **fit_kwargs),
+    }
+
+def state_frames(frames: pd.DataFrame, membership: pd.DataFrame, **fit_kwargs) -> dict:
+    """state -> frame_for() over the state's pincodes, plus an "All States" entry."""
+    out = {"All States": frame_for(frames, **fit_kwargs)}
+    joined = membership[["pincode", "state"]].dropna().drop_duplicates().merge(frames, on="pincode")
+    for state, rows in joined.groupby("state"):
+        out[state] = frame_for(rows, **fit_kwargs)
+    return out
+
+
+# ================= Static geometry asset =================
+def static_geometry_name(geojson_path: str, simplify_m: int):
+    """Content-hashed file name of a level's TopoJSON asset, or None if the level has no fresh TopoJSON."""
+    manifest = read_manifest(geojson_path)
+    level = (manifest or {}).get("levels", {}).get(str(int(simplify_m or 0)), {})
+    if "topojson" not in level or not file_is_current(topology_path_for(geojson_path, simplify_m), level["topojson"]) \
+            or not source_is_current(geojson_path, manifest):
+        return None
+    return f"pincodes-{int(simplify_m or 0)}m-{level['topojson']['sha256'][:16]}.topo.json"
+
+def publish_static_geometry(geojson_path: str, simplify_m: int, static_dir: str = STATIC_GEOMETRY_DIR):
+    """Copy a level's TopoJSON into `static_dir` under its content-hashed name; return the name.
+
+    The name changes whenever the geometry does, so browsers and proxies can keep
+    the file indefinitely. An existing copy is left as is; older names are kept
+    for pages that still reference them. None when the level has no TopoJSON.
+    """
+    name = static_geometry_name(geojson_path, simplify_m)
+    if name is None:
+        return None
+    out = os.path.join(static_dir, name)
+    if not os.path.exists(out):
+        os.makedirs(static_dir, exist_ok=True)
+        tmp = _tmp_path(out)
+        shutil.copyfile(topology_path_for(geojson_path, simplify_m), tmp)
+        os.replace(tmp, out)
+    return name
+
+
+# ================= Level selection =================
+def metres_per_pixel(zoom: float, lat: float = 22.0) -> float:
+    """Web-Mercator ground resolution of one 256px-tile pixel."""
+    return 156543.03392 * math.cos(math.radians(lat)) / (2 ** zoom)
+
+def pick_simplify_level(levels, sharp_to_zoom: float, lat: float = 22.0) -> int:
+    """Coarsest tolerance that is still below one pixel at `sharp_to_zoom`.
+
+    Falls back to the finest level when every level is too coarse.
+    """
+    levels = sorted(int(l) for l in levels)
+    budget = metres_per_pixel(sharp_to_zoom, lat)
+    fitting = [l for l in levels if l <= budget]
+    return fitting[-1] if fitting else levels[0]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Build the precompiled pincode boundary artifact.")
+    ap.add_argument("geojson", nargs="?", default="All_India_pincode_Boundary-19312.geojson")
+    ap.add_argument("--levels", type=int, nargs="+", default=DEFAULT_LEVELS_M,
+                    help="simplification tolerances in metres (0 = unsimplified)")
+    ap.add_argument("--no-topojson", action="store_true", help="skip the shared-arc TopoJSON per level")
+    ap.add_argument("--no-flat", action="store_true", help="skip the memory-mapped flat arrays per level")
+    ap.add_argument("--workers", type=int, default=default_workers(), help="processes (default: all cores)")
+    ap.add_argument("--static-dir", help="also publish each level's TopoJSON here under a content-hashed name")
+    args = ap.parse_args(argv)
+
+    manifest = build_pyramid(args.geojson, args.levels, topology=not args.no_topojson, workers=args.workers,
+                             flat=not args.no_flat)
+    rep = manifest["ingest"]
+    print(f"ingested {rep['features_in']} features -> {rep['features_out']} pincodes "
+          f"({rep['repaired']} repaired, {rep['pins_dissolved']} PINs dissolved, {rep['workers']} workers)")
+    for simplify_m in args.levels:
+        level = manifest["levels"][str(simplify_m)]
+        print(f"wrote {os.path.join(cache_dir_for(args.geojson), level['file'])} "
+              f"({level['features']} features, sha256 {level['sha256'][:12]}…)")
+        if args.static_dir and not args.no_topojson:
+            name = publish_static_geometry(args.geojson, simplify_m, args.static_dir)
+            print(f"published {os.path.join(args.static_dir, name)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# KPI colour scales
+#
+#   python -m pytest tests/test_color_scale.py    # every KPI_CONFIG entry against the per-feature rule and the legend
+#
+# One bucketing engine for every KPI_CONFIG entry. compile_scale(cfg) turns
+# bins / colors / discrete_counts / zero_is_missing into a sorted array of
+# bucket upper edges plus a bucket -> palette index table, once per distinct
+# config; ColorScale.index() then buckets a whole value column with one
+# np.searchsorted. Index 0 of the palette is the missing grey, so the result
+# is exactly what RowTable and the vector tile table consume, and
+# legend_items() describes the same buckets.
+#
+# Rules (unchanged from the per-feature color_for_value):
+#   continuous      first colour whose upper edge is >= x, else the last colour;
+#                   0 is grey unless zero_is_missing=False
+#   discrete_counts round(x) = k picks colour k, the last colour is ">= last";
+#                   negative counts are grey, 0 only with zero_is_missing=True
+#
+# diverging_scale() builds a continuous scale for month-over-month changes:
+# decline colours below 0, one neutral bucket around 0, growth colours above.
+from functools import lru_cache
+
+import numpy as np
+
+MISSING_COLOR = "#d9d9d9"
+# decline -> neutral -> growth
+DIVERGING_COLORS = ["#8B0000", "#D73027", "#F46D43", "#FDAE61", "#F7F7F7", "#A6D96A", "#66BD63", "#1A9850", "#006400"]
+
+
+class ColorScale:
+    """A compiled KPI colour rule: `palette[index(x)]` is the fill for value x."""
+
+    def __init__(self, bins, colors, discrete: bool = False, zero_is_missing: bool = None):
+        self.bins = list(bins)
+        self.colors = list(colors)
+        self.discrete = bool(discrete)
+        self.zero_is_missing = (not self.discrete) if zero_is_missing is None else bool(zero_is_missing)
+        if not self.colors:
+            raise ValueError("a colour scale needs at least one colour")
+        if np.any(np.diff(np.asarray(self.bins, dtype=float)) < 0):
+            raise ValueError(f"bins must be non-decreasing: {bins}")
+
+        m = len(self.colors)
+        if self.discrete:
+            # bucket k holds the count k; counts past the last colour share it
+            self.edges = np.arange(m - 1, dtype=float)
+            self.lowest = 0.0
+            bucket_color = np.arange(m)
+        else:
+            n = min(len(self.bins) - 1, m)
+            self.edges = np.asarray(self.bins[1:n + 1], dtype=float)
+            self.lowest = -np.inf
+            bucket_color = np.r_[np.arange(n), m - 1]
+        self.palette = [MISSING_COLOR] + self.colors
+        # searchsorted bucket (0..len(edges)) -> palette index (1..m)
+        self.lut = (bucket_color + 1).astype(np.int8)
+
+    def index(self, values) -> np.ndarray:
+        """int8 palette index per value; 0 (grey) for NaN / None and values the rule treats as missing."""
+        x = np.asarray(values, dtype=float)
+        if self.discrete:
+            x = np.round(x)
+        idx = self.lut[np.searchsorted(self.edges, x, side="left")]
+        missing = np.isnan(x) | (x < self.lowest)
+        if self.zero_is_missing:
+            missing |= x == 0
+        idx[missing] = 0
+        return idx
+
+    def fills(self, values) -> np.ndarray:
+        """Fill colour per value (object array of '#rrggbb')."""
+        return np.asarray(self.palette, dtype=object)[self.index(values)]
+
+    def legend_items(self, fmt_edge=None, labels=None) -> list:
+        """[(colour, label)] for the legend, grey chip first.
+
+        `labels` (KPI_CONFIG legend_labels) are used verbatim, one per colour.
+        Otherwise discrete scales list one count per bin plus "≥ last", and
+        continuous ones list "lo – hi" ranges plus "> last" with `fmt_edge`.
+        """
+        fmt_edge = fmt_edge or (lambda v: f"{int(v)}")
+        items = [(MISSING_COLOR, "0 / missing" if self.zero_is_missing else "missing")]
+        bins, colors = self.bins, self.colors
+        if labels:
+            items += list(zip(colors, labels))
+        elif self.discrete:
+            items += [(colors[i], f"{int(bins[i])}") for i in range(len(bins) - 1)]
+            items.append((colors[-1], f"≥ {int(bins[-1])}"))
+        else:
+            items += [(colors[i - 1], f"{fmt_edge(bins[i - 1])} – {fmt_edge(bins[i])}") for i in range(1, len(bins))]
+            items.append((colors[-1], f"> {fmt_edge(bins[-1])}"))
+        return items
+
+
+@lru_cache(maxsize=64)
+def _compiled(bins: tuple, colors: tuple, discrete: bool, zero_is_missing) -> ColorScale:
+    return ColorScale(bins, colors, discrete, zero_is_missing)
+
+def compile_scale(cfg: dict) -> ColorScale:
+    """The ColorScale for one KPI_CONFIG entry, compiled once per distinct bucketing config."""
+    return _compiled(tuple(cfg["bins"]), tuple(cfg["colors"]), bool(cfg.get("discrete_counts", False)),
+                     cfg.get("zero_is_missing"))
+
+def diverging_scale(steps, colors=DIVERGING_COLORS) -> ColorScale:
+    """Scale for changes: `steps` (ascending, > 0) bound the buckets on each side of 0.
+
+    The middle colour is -steps[0] < x <= steps[0]; 0 is a value, only NaN is grey.
+    """
+    steps = [float(s) for s in steps]
+    if len(colors) != 2 * len(steps) + 1:
+        raise ValueError(f"{len(steps)} steps need {2 * len(steps) + 1} colours, got {len(colors)}")
+    if steps[0] <= 0:
+        raise ValueError(f"steps must be positive: {steps}")
+    return _compiled((-np.inf, *(-s for s in reversed(steps)), *steps), tuple(colors), False, False)
+
+def diverging_labels(steps, fmt=None) -> list:
+    """Legend labels of diverging_scale(steps), one per colour, with `fmt` for the bounds."""
+    fmt = fmt or (lambda v: f"{v:g}")
+    lo = [f"≤ -{fmt(steps[-1])}"] + [f"-{fmt(b)} – -{fmt(a)}" for a, b in zip(steps[:-1], steps[1:])][::-1]
+    hi = [f"{fmt(a)} – {fmt(b)}" for a, b in zip(steps[:-1], steps[1:])] + [f"> {fmt(steps[-1])}"]
+    return lo + [f"±{fmt(steps[0])}"] + hi
+
@@ -0,0 +1,303 @@
+# Compact geometry encodings for the choropleth layer
+#
+# Neighbouring pincodes share almost every edge, so GeoDataFrame.to_json()
+# writes each border twice at full float precision. `build_topology` turns a
+# GeoSeries into quantized TopoJSON: shared borders become one delta-encoded
+# arc referenced by both polygons, and (optionally) arcs are simplified after
+# sharing so neighbours stay gap- and sliver-free. Leaflet decodes it in the
+# browser through folium.TopoJson (topojson-client).
+#
+# `round_coordinates` is the lighter option for plain GeoJSON: float64 prints
+# ~15 digits (sub-millimetre) where 5 decimals (~1 m) is plenty at zoom 5-10.
+#
+#   python geo_encode.py [geojson] [--level 500]    # before/after size report
+import sys, json, math, argparse
+
+import numpy as np
+import shapely
+
+DEFAULT_QUANTIZATION = 100_000   # ~30 m grid over India's extent
+METRES_PER_DEG = 111_320.0
+
+
+# ================= Coordinate precision =================
+def round_coordinates(geoms, decimals: int):
+    """Round (Multi)Polygon vertices to `decimals` and drop the consecutive
+    duplicates that rounding creates. Rings that collapse are removed (a part
+    whose exterior collapses is dropped); non-polygons come back as None.
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    out = np.full(len(geoms), None, dtype=object)
+    polys, poly_geom = shapely.get_parts(geoms, return_index=True)
+    is_poly = shapely.get_type_id(polys) == 3
+    polys, poly_geom = polys[is_poly], poly_geom[is_poly]
+    if len(polys) == 0:
+        return out
+    rings, ring_poly = shapely.get_rings(polys, return_index=True)
+    coords, pt_ring = shapely.get_coordinates(rings, return_index=True)
+    coords = np.round(coords, decimals)
+
+    first = np.r_[True, pt_ring[1:] != pt_ring[:-1]]
+    keep = first | np.r_[False, (coords[1:] != coords[:-1]).any(axis=1)]
+    coords, pt_ring = coords[keep], pt_ring[keep]
+
+    ring_ok = np.bincount(pt_ring, minlength=len(rings)) >= 4
+    is_shell = np.r_[True, ring_poly[1:] != ring_poly[:-1]]
+    poly_ok = np.zeros(len(polys), dtype=bool)
+    poly_ok[ring_poly[is_shell & ring_ok]] = True
+    ring_keep = ring_ok & poly_ok[ring_poly]
+    pt_keep = ring_keep[pt_ring]
+
+    _, pt_ring_c = np.unique(pt_ring[pt_keep], return_inverse=True)
+    new_rings = shapely.linearrings(coords[pt_keep], indices=pt_ring_c)
+    _, ring_poly_c = np.unique(ring_poly[ring_keep], return_inverse=True)
+    new_polys = shapely.polygons(new_rings, indices=ring_poly_c)
+
+    owner = poly_geom[poly_ok]
+    counts = np.bincount(owner, minlength=len(geoms))
+    single = counts[owner] == 1
+    out[owner[single]] = new_polys[single]
+    if (~single).any():
+        multi_owner = owner[~single]
+        uniq, multi_c = np.unique(multi_owner, return_inverse=True)
+        out[uniq] = shapely.multipolygons(new_polys[~single], indices=multi_c)
+    return out
+
+
+# ================= Ring extraction =================
+def _quantized_rings(geoms, quantization: int):
+    """Explode geometries into closed-ring-free, de-duplicated quantized rings.
+
+    Returns (q, ring_start, ring_len, ring_poly, poly_geom, ring_is_hole, transform)
+    where q is an (N, 2) int64 array of all ring vertices (closing vertex removed).
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    polys, poly_geom = shapely.get_parts(geoms, return_index=True)
+    keep = shapely.get_type_id(polys) == 3           # Polygon parts only
+    polys, poly_geom = polys[keep], poly_geom[keep]
+    rings, ring_poly = shapely.get_rings(polys, return_index=True)
+    ring_is_hole = np.r_[False, ring_poly[1:] == ring_poly[:-1]]
+    coords, pt_ring = shapely.get_coordinates(rings, return_index=True)
+
+    x0, y0 = coords.min(axis=0) if len(coords) else (0.0, 0.0)
+    x1, y1 = coords.max(axis=0) if len(coords) else (1.0, 1.0)
+    sx = (x1 - x0) / (quantization - 1) or 1.0
+    sy = (y1 - y0) / (quantization - 1) or 1.0
+    q = np.rint((coords - [x0, y0]) / [sx, sy]).astype(np.int64)
+
+    # drop the closing vertex and consecutive duplicates created by rounding
+    first = np.r_[True, pt_ring[1:] != pt_ring[:-1]]
+    last = np.r_[pt_ring[1:] != pt_ring[:-1], True]
+    dup = np.r_[False, (q[1:] == q[:-1]).all(axis=1)] & ~first
+    keep = ~last & ~dup
+    q, pt_ring = q[keep], pt_ring[keep]
+
+    # a rounded ring may now end on its own start vertex
+    n_rings = len(rings)
+    ring_len = np.bincount(pt_ring, minlength=n_rings)
+    ring_start = np.r_[0, np.cumsum(ring_len)[:-1]]
+    nonempty = ring_len > 0
+    wrap = np.zeros(n_rings, dtype=bool)
+    s, e = ring_start[nonempty], ring_start[nonempty] + ring_len[nonempty] - 1
+    wrap[nonempty] = (q[s] == q[e]).all(axis=1) & (e > s)
+    if wrap.any():
+        drop = np.zeros(len(q), dtype=bool)
+        drop[(ring_start + ring_len - 1)[wrap]] = True
+        q, pt_ring = q[~drop], pt_ring[~drop]
+        ring_len = np.bincount(pt_ring, minlength=n_rings)
+        ring_start = np.r_[0, np.cumsum(ring_len)[:-1]]
+
+    transform = {"scale": [float(sx), float(sy)], "translate": [float(x0), float(y0)]}
+    return q, ring_start, ring_len, ring_poly, poly_geom, ring_is_hole, transform
+
+
+def _junctions(q, ring_start, ring_len, quantization: int):
+    """Vertices where the set of neighbours differs between occurrences."""
+    n = len(q)
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+    key = q[:, 0] * quantization + q[:, 1]
+    idx = np.arange(n)
+    ring_of = np.repeat(np.arange(len(ring_len)), ring_len)
+    start, length = ring_start[ring_of], ring_len[ring_of]
+    prev_i = start + (idx - start - 1) % length
+    next_i = start + (idx - start + 1) % length
+    kp, kn = key[prev_i], key[next_i]
+    lo, hi = np.minimum(kp, kn), np.maximum(kp, kn)
+
+    triples = np.unique(np.stack([key, lo, hi], axis=1), axis=0)
+    uk, counts = np.unique(triples[:, 0], return_counts=True)
+    return np.isin(key, uk[counts > 1])
+
+
+# ================= Arc construction =================
+def _simplify_arcs(arcs, transform, simplify_m: float):
+    """Douglas–Peucker each shared arc (endpoints fixed) in approximate metres."""
+    sx, sy = transform["scale"]
+    x0, y0 = transform["translate"]
+    lat = y0 + sy * np.mean([a[:, 1].mean() for a in arcs]) if arcs else 0.0
+    kx = sx * METRES_PER_DEG * math.cos(math.radians(lat))
+    ky = sy * METRES_PER_DEG
+
+    lens = np.array([len(a) for a in arcs])
+    pts = np.concatenate(arcs).astype(float) * [kx, ky]
+    lines = shapely.linestrings(pts, indices=np.repeat(np.arange(len(arcs)), lens))
+    simple = shapely.simplify(lines, simplify_m, preserve_topology=True)
+
+    out = []
+    for arc, line in zip(arcs, simple):
+        s = np.rint(shapely.get_coordinates(line) / [kx, ky]).astype(np.int64)
+        closed = (arc[0] == arc[-1]).all()
+        out.append(arc if (closed and len(s) < 4) or len(s) < 2 else s)
+    return out
+
+
+def build_topology(geoms, quantization: int = DEFAULT_QUANTIZATION, simplify_m: float = 0,
+                   ids=None, object_name: str = "pincodes") -> dict:
+    """Encode a sequence of (Multi)Polygons as quantized TopoJSON with shared arcs.
+
+    Geometries keep their input order; `ids` (e.g. the PIN column) are stored as
+    TopoJSON ids so a cached topology can be matched against a merged frame.
+    """
+    q, ring_start, ring_len, ring_poly, poly_geom, ring_is_hole, transform = \
+        _quantized_rings(geoms, quantization)
+    is_j = _junctions(q, ring_start, ring_len, quantization)
+    key = q[:, 0] * quantization + q[:, 1] if len(q) else np.zeros(0, dtype=np.int64)
+
+    arcs, index = [], {}
+    def _arc_ref(arc):
+        fwd = arc.tobytes()
+        if fwd in index: return index[fwd]
+        rev = arc[::-1].tobytes()
+        if rev in index: return ~index[rev]
+        index[fwd] = len(arcs); arcs.append(arc)
+        return index[fwd]
+
+    ring_arcs = [None] * len(ring_len)
+    for r, (s, n) in enumerate(zip(ring_start, ring_len)):
+        if n < 3:
+            continue
+        pts, jpos = q[s:s + n], np.flatnonzero(is_j[s:s + n])
+        if len(jpos) == 0:
+            k = int(np.argmin(key[s:s + n]))
+            ring = np.roll(pts, -k, axis=0)
+            ring_arcs[r] = [_arc_ref(np.vstack([ring, ring[:1]]))]
+            continue
+        ring = np.roll(pts, -jpos[0], axis=0)
+        ring = np.vstack([ring, ring[:1]])
+        cuts = np.r_[jpos - jpos[0], n]
+        ring_arcs[r] = [_arc_ref(ring[a:b + 1]) for a, b in zip(cuts[:-1], cuts[1:])]
+
+    if simplify_m and simplify_m > 0 and arcs:
+        arcs = _simplify_arcs(arcs, transform, simplify_m)
+
+    # (multi)polygon arc references in input order
+    polys = {}
+    for r, refs in enumerate(ring_arcs):
+        p = ring_poly[r]
+        if refs is None:
+            if not ring_is_hole[r]:
+                polys[p] = None     # degenerate exterior: drop the whole part
+            continue
+        if p in polys and polys[p] is None:
+            continue
+        polys.setdefault(p, []).append(refs)
+    by_geom = {}
+    for p, rings in polys.items():
+        if rings:
+            by_geom.setdefault(int(poly_geom[p]), []).append(rings)
+
+    geometries = []
+    for i in range(len(geoms)):
+        parts = by_geom.get(i, [])
+        if not parts: geom = {"type": None}
+        elif len(parts) == 1: geom = {"type": "Polygon", "arcs": parts[0]}
+        else: geom = {"type": "MultiPolygon", "arcs": parts}
+        if ids is not None: geom["id"] = ids[i]
+        geometries.append(geom)
+
+    return {
+        "type": "Topology",
+        "transform": transform,
+        "objects": {object_name: {"type": "GeometryCollection", "geometries": geometries}},
+        "arcs": [np.vstack([a[:1], np.diff(a, axis=0)]).tolist() for a in arcs],
+    }
+
+
+def topojson_document(topology: dict, properties, object_name: str = "pincodes") -> dict:
+    """Attach per-feature properties (same order as the geometries) to a topology.
+
+    The cached topology is not modified; geometry ids are dropped from the output.
+    """
+    geometries = topology["objects"][object_name]["geometries"]
+    return {
+        "type": "Topology",
+        "transform": topology["transform"],
+        "objects": {object_name: {
+            "type": "GeometryCollection",
+            "geometries": [
+                {"type": g["type"], "arcs": g["arcs"], "properties": p} if g["type"]
+                else {"type": None, "properties": p}
+                for g, p in zip(geometries, properties)
+            ],
+        }},
+        "arcs": topology["arcs"],
+    }
+
+
+def topology_ids(topology: dict, object_name: str = "pincodes"):
+    return [g.get("id") for g in topology["objects"][object_name]["geometries"]]
+
+
+def subset_topology(topology: dict, positions, object_name: str = "pincodes") -> dict:
+    """Keep only the geometries at `positions` and the arcs they reference (renumbered)."""
+    geometries = topology["objects"][object_name]["geometries"]
+    picked = [geometries[i] for i in positions]
+
+    def _rings(g):
+        if g["type"] == "Polygon": return g["arcs"]
+        if g["type"] == "MultiPolygon": return [r for p in g["arcs"] for r in p]
+        return []
+    used = sorted({r if r >= 0 else ~r for g in picked for ring in _rings(g) for r in ring})
+    remap = {old: new for new, old in enumerate(used)}
+    def _ring(ring): return [remap[r] if r >= 0 else ~remap[~r] for r in ring]
+
+    out = []
+    for g in picked:
+        g2 = dict(g)
+        if g["type"] == "Polygon": g2["arcs"] = [_ring(r) for r in g["arcs"]]
+        elif g["type"] == "MultiPolygon": g2["arcs"] = [[_ring(r) for r in p] for p in g["arcs"]]
+        out.append(g2)
+    return {
+        "type": "Topology",
+        "transform": topology["transform"],
+        "objects": {object_name: {"type": "GeometryCollection", "geometries": out}},
+        "arcs": [topology["arcs"][i] for i in used],
+    }
+
+
+def main(argv=None):
+    import geopandas as gpd
+    from boundary_store import load_boundaries
+
+    ap = argparse.ArgumentParser(description="Size report for the choropleth geometry encodings.")
+    ap.add_argument("geojson", nargs="?", default="All_India_pincode_Boundary-19312.geojson")
+    ap.add_argument("--level", type=int, default=500, help="simplification level (metres)")
+    args = ap.parse_args(argv)
+
+    gdf, pin_col = load_boundaries(args.geojson, args.level)
+    gdf = gdf[[pin_col, "geometry"]]
+    base = len(gdf.to_json())
+    print(f"{'encoding':<28}{'bytes':>14}{'vs full':>10}")
+    print(f"{'GeoJSON (full precision)':<28}{base:>14,}{1:>10.2f}")
+    for d in (6, 5, 4):
+        rounded = gpd.GeoDataFrame(gdf[[pin_col]], geometry=round_coordinates(gdf.geometry.values, d), crs=gdf.crs)
+        n = len(rounded.to_json())
+        print(f"{f'GeoJSON ({d} decimals)':<28}{n:>14,}{n / base:>10.2f}")
+    topo = build_topology(gdf.geometry.values)
+    n = len(json.dumps(topojson_document(topo, [{pin_col: p} for p in gdf[pin_col]]), separators=(",", ":")))
+    print(f"{'TopoJSON (quantized)':<28}{n:>14,}{n / base:>10.2f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,543 @@
+# KPI definitions shared by map_app_v2.py and the checks in tests/
+#
+# KPI_CONFIG: per KPI its value column, unit, tooltip formatter, colour bins /
+# colours (color_scale.compile_scale), BigQuery SQL (@month, @state) and the
+# change-map settings (delta_sql with @month_a / @month_b, delta_steps). Kept
+# free of heavy imports: the app's sidebar reads it before pandas is loaded.
+import math
+
+
+def _isna(x):
+    # pandas is loaded by the time values are formatted, not when this module is imported
+    import pandas as pd
+    return x is None or pd.isna(x)
+
+def fmt_int(x):   return "—" if _isna(x) else f"{int(x):,}"
+def fmt_lakh_from_rupees(x):
+    if _isna(x): return "—"
+    return f"{x/100000:,.2f} L"
+def fmt_lakh_value(x):
+    if _isna(x): return "—"
+    return f"{x:,.2f} L"
+
+def fmt_int_or_dash(x):
+    if x is None or (isinstance(x, float) and math.isnan(x)):
+        return "0"          # or "—" if you prefer a dash
+    return f"{int(round(x))}"
+
+# Vectorized twin of each formatter (a value_format.VECTORIZED name, identical output)
+fmt_int.vectorized = "format_int"
+fmt_lakh_from_rupees.vectorized = "format_lakh_from_rupees"
+fmt_lakh_value.vectorized = "format_lakh_value"
+fmt_int_or_dash.vectorized = "format_rounded_int"
+
+
+KPI_CONFIG = {
+    "Trxn_SMAs": {
+        "value_col": "Trxn_SMAs",
+        "unit_name": "Transacting SMAs",
+        "unit_fmt": fmt_int,
+        "bins": [0, 3, 8, 15, 20, 25, 35, 50, 100],
+        'colors':  ["#8B0000","#B22222","#FF0000","#FF4500","#FF7F00",
+                   "#FFA500","#FFD700","#90EE90","#32CD32","#006400"],
+        # "colors": R2G8,
+        "sql": """
+        WITH all_pincodes AS (
+          SELECT DISTINCT pincode
+          FROM `spicemoney-dwh.analytics_dwh.v_pincode_master`
+        ),
+        trxn_sma_data AS (
+          SELECT pincode, COUNT(DISTINCT agent_id) AS Trxn_SMAs
+          FROM (
+            SELECT t1.agent_id, t2.final_pincode AS pincode
+            FROM (
+              SELECT agent_id
+              FROM `spicemoney-dwh.analytics_dwh.csp_monthly_timeline_with_tu`
+              WHERE month_year = @month AND total_gtv_amt > 0
+            ) AS t1
+            LEFT JOIN `spicemoney-dwh.analytics_dwh.v_client_pincode` AS t2
+              ON t1.agent_id = t2.retailer_id
+            {state_clause}  -- WHERE t2.final_state = @state
+          )
+          GROUP BY pincode
+        )
+        SELECT t1.pincode, COALESCE(Trxn_SMAs,0) AS Trxn_SMAs
+        FROM all_pincodes AS t1
+        LEFT JOIN trxn_sma_data AS t2
+          ON t1.pincode = t2.pincode
+        """,
+        # both months in one scan (delta map): value_a = @month_a, value_b = @month_b
+        "delta_steps": [1, 3, 8, 15],
+        "delta_sql": """
+        WITH all_pincodes AS (
+          SELECT DISTINCT pincode
+          FROM `spicemoney-dwh.analytics_dwh.v_pincode_master`
+        ),
+        trxn_sma_data AS (
+          SELECT pincode,
+                 COUNT(DISTINCT IF(month_year = @month_a, agent_id, NULL)) AS value_a,
+                 COUNT(DISTINCT IF(month_year = @month_b, agent_id, NULL)) AS value_b
+          FROM (
+            SELECT t1.agent_id, t1.month_year, t2.final_pincode AS pincode
+            FROM (
+              SELECT agent_id, month_year
+              FROM `spicemoney-dwh.analytics_dwh.csp_monthly_timeline_with_tu`
+              WHERE month_year IN (@month_a, @month_b) AND total_gtv_amt > 0
+            ) AS t1
+            LEFT JOIN `spicemoney-dwh.analytics_dwh.v_client_pincode` AS t2
+              ON t1.agent_id = t2.retailer_id
+            {state_clause}  -- WHERE t2.final_state = @state
+          )
+          GROUP BY pincode
+        )
+        SELECT t1.pincode, COALESCE(value_a,0) AS value_a, COALESCE(value_b,0) AS value_b
+        FROM all_pincodes AS t1
+        LEFT JOIN trxn_sma_data AS t2
+          ON t1.pincode = t2.pincode
+        """
+    },
+    "AEPS_GTV_IN_LACS": {
+        "value_col": "AEPS_GTV_IN_LACS",
+        "unit_name": "AEPS GTV (Lakhs)",
+        "unit_fmt": fmt_int,
+        "bins": [0, 2, 5, 10, 15, 20, 25, 30, 50, 100],
+        "colors": ["#8B0000","#B22222","#FF0000","#FF4500","#FF7F00",
+                   "#FFA500","#FFD700","#90EE90","#32CD32","#006400"],
+        "sql": """
+        WITH all_pincodes AS (
+          SELECT DISTINCT pincode, state
+          FROM `spicemoney-dwh.analytics_dwh.v_pincode_master`
+        ),
+        aeps_gtv_data AS (
+          SELECT pincode, SUM(AEPS_GTV) AS AEPS_GTV
+          FROM (
+            SELECT t1.agent_id, AEPS_GTV, t2.final_pincode AS pincode
+            FROM (
+              SELECT agent_id, aeps_gtv_success AS AEPS_GTV
+              FROM `spicemoney-dwh.analytics_dwh.csp_monthly_timeline_with_tu`
+              WHERE month_year = @month AND total_gtv_amt > 0
+            ) AS t1
+            LEFT JOIN `spicemoney-dwh.analytics_dwh.v_client_pincode` AS t2
+              ON t1.agent_id = t2.retailer_id
+            {state_clause}  -- WHERE t2.final_state = @state
+          )
+          GROUP BY pincode
+        )
+        SELECT t1.pincode,
+               ROUND(COALESCE(AEPS_GTV,0)/100000, 2) AS AEPS_GTV_IN_LACS
+        FROM all_pincodes AS t1
+        LEFT JOIN aeps_gtv_data AS t2
+          ON t1.pincode = t2.pincode
+        """,
+        "delta_steps": [1, 2, 5, 10],
+        "delta_sql": """
+        WITH all_pincodes AS (
+          SELECT DISTINCT pincode, state
+          FROM `spicemoney-dwh.analytics_dwh.v_pincode_master`
+        ),
+        aeps_gtv_data AS (
+          SELECT pincode,
+                 SUM(IF(month_year = @month_a, AEPS_GTV, 0)) AS value_a,
+                 SUM(IF(month_year = @month_b, AEPS_GTV, 0)) AS value_b
+          FROM (
+            SELECT t1.agent_id, t1.month_year, AEPS_GTV, t2.final_pincode AS pincode
+            FROM (
+              SELECT agent_id, month_year, aeps_gtv_success AS AEPS_GTV
+              FROM `spicemoney-dwh.analytics_dwh.csp_monthly_timeline_with_tu`
+              WHERE month_year IN (@month_a, @month_b) AND total_gtv_amt > 0
+            ) AS t1
+            LEFT JOIN `spicemoney-dwh.analytics_dwh.v_client_pincode` AS t2
+              ON t1.agent_id = t2.retailer_id
+            {state_clause}  -- WHERE t2.final_state = @state
+          )
+          GROUP BY pincode
+        )
+        SELECT t1.pincode,
+               ROUND(COALESCE(value_a,0)/100000, 2) AS value_a,
+               ROUND(COALESCE(value_b,0)/100000, 2) AS value_b
+        FROM all_pincodes AS t1
+        LEFT JOIN aeps_gtv_data AS t2
+          ON t1.pincode = t2.pincode
+        """
+    },
+    "CMS_GTV_IN_LACS": {
+        "value_col": "CMS_GTV_IN_LACS",
+        "unit_name": "CMS GTV (Lakhs)",
+        "unit_fmt": fmt_int,   
+        "bins": [0, 2, 5, 10, 15, 20, 25, 30, 50, 100],
+        # "bins": [0, 2e5, 5e5, 1e6, 1.5e6, 2e6, 3e6, 5e6, 1e7, 1e12],
+        "colors": ["#8B0000","#B22222","#FF0000","#FF7F00","#FFD700",
+                   "#ADFF2F","#90EE90","#32CD32","#006400"],
+        "sql": """
+        WITH all_pincodes AS (
+          SELECT DISTINCT pincode
+          FROM `spicemoney-dwh.analytics_dwh.v_pincode_master`
+        ),
+        cms_gtv_data AS (
+          SELECT pincode, SUM(CMS_GTV) AS CMS_GTV
+          FROM (
+            SELECT t1.agent_id, CMS_GTV, t2.final_pincode AS pincode
+            FROM (
+              SELECT agent_id, cms_gtv_success AS CMS_GTV
+              FROM `spicemoney-dwh.analytics_dwh.csp_monthly_timeline_with_tu`
+              WHERE month_year = @month AND total_gtv_amt > 0
+            ) AS t1
+            LEFT JOIN `spicemoney-dwh.analytics_dwh.v_client_pincode` AS t2
+              ON t1.agent_id = t2.retailer_id
+            {state_clause}  -- WHERE t2.final_state = @state
+          )
+          GROUP BY pincode
+        )
+        SELECT t1.pincode, ROUND(COALESCE(CMS_GTV,0)/100000, 2) AS CMS_GTV_IN_LACS
+        FROM all_pincodes AS t1
+        LEFT JOIN cms_gtv_data AS t2
+          ON t1.pincode = t2.pincode
+        """,
+        "delta_steps": [1, 2, 5, 10],
+        "delta_sql": """
+        WITH all_pincodes AS (
+          SELECT DISTINCT pincode
+          FROM `spicemoney-dwh.analytics_dwh.v_pincode_master`
+        ),
+        cms_gtv_data AS (
+          SELECT pincode,
+                 SUM(IF(month_year = @month_a, CMS_GTV, 0)) AS value_a,
+                 SUM(IF(month_year = @month_b, CMS_GTV, 0)) AS value_b
+          FROM (
+            SELECT t1.agent_id, t1.month_year, CMS_GTV, t2.final_pincode AS pincode
+            FROM (
+              SELECT agent_id, month_year, cms_gtv_success AS CMS_GTV
+              FROM `spicemoney-dwh.analytics_dwh.csp_monthly_timeline_with_tu`
+              WHERE month_year IN (@month_a, @month_b) AND total_gtv_amt > 0
+            ) AS t1
+            LEFT JOIN `spicemoney-dwh.analytics_dwh.v_client_pincode` AS t2
+              ON t1.agent_id = t2.retailer_id
+            {state_clause}  -- WHERE t2.final_state = @state
+          )
+          GROUP BY pincode
+        )
+        SELECT t1.pincode,
+               ROUND(COALESCE(value_a,0)/100000, 2) AS value_a,
+               ROUND(COALESCE(value_b,0)/100000, 2) AS value_b
+        FROM all_pincodes AS t1
+        LEFT JOIN cms_gtv_data AS t2
+          ON t1.pincode = t2.pincode
+        """
+    },
+
+
+
+    ########### Added on 26th Nov 2025 By Vinolin ########33
+    "GROSS_ADDS": {
+    "value_col": "GROSS_ADDS",
+    "unit_name": "Gross Adds (count)",
+    # "unit_fmt": fmt_int,
+    "unit_fmt": fmt_int_or_dash,
+
+    "bins": [0, 1, 2, 3, 4, 5, 6, 7, 8],
+    # Colors (0 is dark red; grey reserved ONLY for NaN/missing)
+    "colors": [
+        "#8B0000",  # 0
+        "#B22222",  # 1
+        "#FF0000",  # 2
+        "#FF7F00",  # 3
+        "#FFD700",  # 4
+        "#ADFF2F",  # 5
+        "#7FFF00",  # 6
+        "#32CD32",  # 7
+        "#006400",  # ≥8
+    ],
+
+    "discrete_counts": False,
+    "legend_labels": ["1", "2", "3", "4", "5", "6", "7", "8", "> 8"],   # optional; if present overrides the mode above
+
+    "sql": """
+        WITH all_pincodes AS (
+        SELECT DISTINCT pincode
+        FROM `spicemoney-dwh.analytics_dwh.v_pincode_master`
+        ),
+
+        gross_adds_data AS (
+        SELECT
+            pincode,
+            COUNT(DISTINCT agent_id) AS GROSS_ADDS
+        FROM (
+            SELECT
+            t1.retailer_id AS agent_id,
+            t2.final_pincode AS pincode
+            FROM `spicemoney-dwh.prod_dwh.client_details` AS t1
+            LEFT JOIN `spicemoney-dwh.analytics_dwh.v_client_pincode` AS t2
+            ON t1.retailer_id = t2.retailer_id
+            {state_clause}    -- WHERE t2.final_state = @state
+            AND t1.client_type = 'retailer'
+            AND DATE_TRUNC(DATE(t1.creation_date), MONTH) = @month
+            
+        )
+        GROUP BY pincode
+        )
+
+        SELECT
+        t1.pincode,
+        COALESCE(t2.GROSS_ADDS, 0) AS GROSS_ADDS
+        FROM all_pincodes AS t1
+        LEFT JOIN gross_adds_data AS t2
+        ON t1.pincode = t2.pincode
+        """,
+    "delta_steps": [0.5, 1, 2, 4],
+    "delta_sql": """
+        WITH all_pincodes AS (
+        SELECT DISTINCT pincode
+        FROM `spicemoney-dwh.analytics_dwh.v_pincode_master`
+        ),
+
+        gross_adds_data AS (
+        SELECT
+            pincode,
+            COUNT(DISTINCT IF(month_year = @month_a, agent_id, NULL)) AS value_a,
+            COUNT(DISTINCT IF(month_year = @month_b, agent_id, NULL)) AS value_b
+        FROM (
+            SELECT
+            t1.retailer_id AS agent_id,
+            DATE_TRUNC(DATE(t1.creation_date), MONTH) AS month_year,
+            t2.final_pincode AS pincode
+            FROM `spicemoney-dwh.prod_dwh.client_details` AS t1
+            LEFT JOIN `spicemoney-dwh.analytics_dwh.v_client_pincode` AS t2
+            ON t1.retailer_id = t2.retailer_id
+            {state_clause}    -- WHERE t2.final_state = @state
+            AND t1.client_type = 'retailer'
+            AND DATE_TRUNC(DATE(t1.creation_date), MONTH) IN (@month_a, @month_b)
+
+        )
+        GROUP BY pincode
+        )
+
+        SELECT
+        t1.pincode,
+        COALESCE(t2.value_a, 0) AS value_a,
+        COALESCE(t2.value_b, 0) AS value_b
+        FROM all_pincodes AS t1
+        LEFT JOIN gross_adds_data AS t2
+        ON t1.pincode = t2.pincode
+        """
+        },
+
+    "SPs": {
+    "value_col": "SPs",
+    "unit_name": "SP Count (≥ 2.5L GTV)",
+    "unit_fmt": fmt_int,
+    "discrete_counts": False,
+    "legend_labels": None,
+    "bins": [0, 1, 4, 9, 16, 21, 26, 36, 51],
+    "colors": ["#8B0000", "#B22222", "#FF0000", "#FFF700", "#FFD700",
+               "#ADFF2F", "#90EE90", "#32CD32", "#006400"],
+
+  
+    "sql": """
+                    WITH all_pincodes AS (
+            SELECT DISTINCT pincode
+            FROM `spicemoney-dwh.analytics_dwh.v_pincode_master`
+            ),
+
+            sps_data AS (
+            SELECT
+                t2.final_pincode as pincode,
+                COUNT(DISTINCT base.group_id) AS SPs
+            FROM (
+                SELECT
+                a.agent_id,
+                sg.group_id
+                FROM (
+                SELECT agent_id, total_gtv_amt
+                FROM `spicemoney-dwh.analytics_dwh.csp_monthly_timeline_with_tu`
+                WHERE month_year = @month
+                    AND total_gtv_amt >= 250000
+                ) AS a
+                LEFT JOIN `spicemoney-dwh.analytics_dwh.sma_group` AS sg
+                ON a.agent_id = sg.client_id
+            ) AS base
+            LEFT JOIN `spicemoney-dwh.analytics_dwh.v_client_pincode` AS t2
+                ON base.group_id = t2.retailer_id
+            {state_clause}    -- WHERE t2.final_state = @state
+            AND base.group_id IS NOT NULL
+                
+            GROUP BY pincode
+            )
+
+            SELECT
+            t1.pincode,
+            COALESCE(t2.SPs, 0) AS SPs
+            FROM all_pincodes AS t1
+            LEFT JOIN sps_data AS t2
+            ON t1.pincode = t2.pincode
+            """,
+    "delta_steps": [0.5, 1, 3, 5],
+    "delta_sql": """
+            WITH all_pincodes AS (
+            SELECT DISTINCT pincode
+            FROM `spicemoney-dwh.analytics_dwh.v_pincode_master`
+            ),
+
+            sps_data AS (
+            SELECT
+                t2.final_pincode as pincode,
+                COUNT(DISTINCT IF(base.month_year = @month_a, base.group_id, NULL)) AS value_a,
+                COUNT(DISTINCT IF(base.month_year = @month_b, base.group_id, NULL)) AS value_b
+            FROM (
+                SELECT
+                a.agent_id,
+                a.month_year,
+                sg.group_id
+                FROM (
+                SELECT agent_id, month_year, total_gtv_amt
+                FROM `spicemoney-dwh.analytics_dwh.csp_monthly_timeline_with_tu`
+                WHERE month_year IN (@month_a, @month_b)
+                    AND total_gtv_amt >= 250000
+                ) AS a
+                LEFT JOIN `spicemoney-dwh.analytics_dwh.sma_group` AS sg
+                ON a.agent_id = sg.client_id
+            ) AS base
+            LEFT JOIN `spicemoney-dwh.analytics_dwh.v_client_pincode` AS t2
+                ON base.group_id = t2.retailer_id
+            {state_clause}    -- WHERE t2.final_state = @state
+            AND base.group_id IS NOT NULL
+
+            GROUP BY pincode
+            )
+
+            SELECT
+            t1.pincode,
+            COALESCE(t2.value_a, 0) AS value_a,
+            COALESCE(t2.value_b, 0) AS value_b
+            FROM all_pincodes AS t1
+            LEFT JOIN sps_data AS t2
+            ON t1.pincode = t2.pincode
+            """
+            },
+
+
+    "SP_USAGE_CHURN": {
+    "value_col": "SP_USAGE_CHURN",
+    "unit_name": "SP Usage Churn (count)",
+    # Discrete churn levels: 0,1,2,3,4,5 and >5
+    # Keep bins as the exact cut points; the last bucket is "> last"
+    "bins": [0, 1, 2, 3, 4, 5],                   # 6 edges → 7 buckets
+    "discrete_counts": True,                      # IMPORTANT
+    # Labels must match the number of buckets: len(bins) + 1
+    "legend_labels": ["0", "1", "2", "3", "4", "5", ">5"],
+    # Colors (left→right is 0,1,2,3,4,5,>5). 0 should be green; higher = red.
+    "colors": [
+    "#006400",  # 0  : DarkGreen
+    "#FFF176",  # 1  : Light Yellow (Amber 300)
+    "#FFA726",  # 2  : Orange (Orange 400)
+    "#EF5350",  # 3  : Light Red (Red 400)
+    "#E53935",  # 4  : Darker Red (Red 600)
+    "#C62828",  # 5  : Darker Red (Red 800)
+    "#8B0000",  # >5 : Darkest Red (DarkRed)
+],
+    "unit_fmt": fmt_int_or_dash,
+    "zero_is_missing": False,                    # <- tell the app: 0 is NOT gray
+    "show_zero_grey_in_legend": False,          # <- don’t print “0 / missing” chip
+    # The query fixes its own month window (2025-10-01), it does not take @month:
+    # no change map or month comparison (map_app_v2.kpi_follows_month)
+    # "bins": [0, 1, 4, 9, 16, 21, 26, 36, 51],
+    # "colors": ["#8B0000", "#B22222", "#FF0000", "#FFF700", "#FFD700",
+            #    "#ADFF2F", "#90EE90", "#32CD32", "#006400"],
+    "sql": """
+                WITH all_pincodes AS (
+                SELECT DISTINCT pincode
+                FROM `spicemoney-dwh.analytics_dwh.v_pincode_master`
+                ),
+
+                -- Map retailer -> PIN (filtered by state when provided)
+                pin_data AS (
+                SELECT
+                    t2.retailer_id AS agent_id,
+                    t2.final_pincode AS pincode
+                FROM `spicemoney-dwh.analytics_dwh.v_client_pincode` AS t2
+                
+                
+                ),
+
+                -- 3-month window ending at previous month: min/max/avg GTV (net of CMS success)
+                agg_data AS (
+                SELECT
+                    t.agent_id,
+                    ROUND(MIN(t.total_gtv_amt - t.cms_gtv_success), 1) AS gtv_min,
+                    ROUND(MAX(t.total_gtv_amt - t.cms_gtv_success), 1) AS gtv_max,
+                    ROUND(AVG(t.total_gtv_amt - t.cms_gtv_success), 1) AS gtv_avg
+                FROM `spicemoney-dwh.analytics_dwh.csp_monthly_timeline_with_tu` AS t
+                WHERE t.month_year IN (
+                    DATE_SUB("2025-10-01", INTERVAL 2 MONTH),
+                    DATE_SUB("2025-10-01", INTERVAL 1 MONTH),
+                    DATE_SUB("2025-10-01", INTERVAL 0 MONTH)
+                )
+                GROUP BY t.agent_id
+                ),
+
+                -- Previous month net GTV to keep only meaningful bases
+                prev_month_data AS (
+                SELECT
+                    t.agent_id,
+                    ROUND(t.total_gtv_amt - t.cms_gtv_success, 1) AS gtv_prev
+                FROM `spicemoney-dwh.analytics_dwh.csp_monthly_timeline_with_tu` AS t
+                WHERE t.month_year = DATE_SUB("2025-10-01", INTERVAL 1 MONTH)
+                ),
+
+                -- Keep agents with prev month >= 2.5e5
+                agg_data2 AS (
+                SELECT a.*
+                FROM agg_data a
+                LEFT JOIN prev_month_data p USING (agent_id)
+                WHERE p.gtv_prev >= 250000
+                ),
+
+                -- Focus-month realized net GTV
+                focus_month_txn_data AS (
+                SELECT
+                    t.agent_id,
+                    ROUND(t.total_gtv_amt - t.cms_gtv_success, 1) AS gtv_focus
+                FROM `spicemoney-dwh.analytics_dwh.csp_monthly_timeline_with_tu` AS t
+                WHERE t.month_year = "2025-10-01"
+                ),
+
+                -- Final per-agent performance classification
+                final_data AS (
+                SELECT
+                    pd.pincode,
+                    ad.agent_id,
+                    ROUND(COALESCE(SAFE_DIVIDE(fm.gtv_focus, NULLIF(ad.gtv_max, 0)), 0), 4) AS ratio
+                FROM agg_data2 ad
+                LEFT JOIN focus_month_txn_data fm USING (agent_id)
+                JOIN pin_data pd ON pd.agent_id = ad.agent_id
+                ),
+
+                churn_data AS (
+                SELECT
+                    pincode,
+                    COUNT(DISTINCT IF(ratio <= 0.2, agent_id, NULL)) AS SP_USAGE_CHURN
+                FROM final_data
+                GROUP BY pincode
+                )
+
+        select t1.*
+        from
+        (
+                SELECT
+                t1.pincode,
+                COALESCE(t2.SP_USAGE_CHURN, 0) AS SP_USAGE_CHURN
+                FROM all_pincodes AS t1
+                LEFT JOIN churn_data AS t2
+                ON t1.pincode = t2.pincode
+        ) as t1 left join 
+        (
+            SELECT DISTINCT pincode as final_pincode, state as final_state
+            FROM `spicemoney-dwh.analytics_dwh.v_pincode_master`
+        ) as t2
+        on t1.pincode = t2.final_pincode
+        {state_clause}   -- WHERE t2.final_state = @state
+        """
+        }
+
+
+
+} ### DICT end
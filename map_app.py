@@ -1,13 +1,9 @@
 # streamlit run app.py
-import re, json
-import pandas as pd
-import geopandas as gpd
+from __future__ import annotations
 import streamlit as st
-import folium
-from streamlit_folium import st_folium
 
-from google.cloud import bigquery
-from google.oauth2 import service_account
+# pandas / folium / BigQuery and the boundary helpers are imported on the
+# "Generate map" path only, so the sidebar renders without them.
 
 # ================= CONFIG (edit paths only) =================
 GEOJSON_PATH = "All_India_pincode_Boundary-19312.geojson"
@@ -25,6 +21,11 @@ def fmt_lakh_value(x):
     if x is None or pd.isna(x): return "—"
     return f"{x:,.2f} L"
 
+# Vectorized twin of each formatter (a value_format.VECTORIZED name, identical output)
+fmt_int.vectorized = "format_int"
+fmt_lakh_from_rupees.vectorized = "format_lakh_from_rupees"
+fmt_lakh_value.vectorized = "format_lakh_value"
+
 KPI_CONFIG = {
     # 1) Trxn_SMAs
     "Trxn_SMAs": {
@@ -170,6 +171,7 @@ STATES = [
 
 # ================= Auth =================
 def get_bq_client():
+    from google.cloud import bigquery
     client = bigquery.Client(credentials= credentials,project=credentials.project_id)
     return client
 
@@ -177,42 +179,22 @@ def get_bq_client():
 def normalize_pin_series(s: pd.Series) -> pd.Series:
     return s.astype(str).str.extract(r"(\d{6})", expand=False)
 
-@st.cache_data(show_spinner=False)
-def load_geojson(path: str, simplify_m: int):
-    try:
-        gdf = gpd.read_file(path, engine="pyogrio")
-    except Exception:
-        gdf = gpd.read_file(path)
-
-    # detect PIN column
-    def _n(x): return re.sub(r"[^a-z0-9]", "", x.lower())
-    props = [c for c in gdf.columns if c != "geometry"]
-    cand = {_n(c): c for c in props}
-    pin_col = None
-    for k in ["pincode","pin","postalcode","postcode"]:
-        if k in cand: pin_col = cand[k]; break
-    if pin_col is None:
-        for c in props:
-            if gdf[c].astype(str).str.fullmatch(r"\d{6}", na=False).mean() > 0.6:
-                pin_col = c; break
-    if pin_col is None:
-        raise ValueError("Could not detect a 6-digit PIN column in GeoJSON.")
+# One process-wide GeoDataFrame shared by every session (not a per-call st.cache_data
+# copy): read-only, merge/copy it, never assign into it. `version` re-keys it after a rebuild.
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _shared_boundaries(path: str, simplify_m: int, version: str):
+    # Precompiled GeoParquet (boundary_store.py) when fresh, raw GeoJSON otherwise
+    from boundary_store import load_boundaries
+    return load_boundaries(path, simplify_m)
 
-    gdf[pin_col] = normalize_pin_series(gdf[pin_col])
-    gdf = gdf.dropna(subset=[pin_col])
-    if gdf.crs is None:
-        gdf = gdf.set_crs(epsg=4326, allow_override=True)
-    elif gdf.crs.to_epsg() != 4326:
-        gdf = gdf.to_crs(epsg=4326)
-    if simplify_m and simplify_m > 0:
-        g2 = gdf.to_crs(epsg=3857)
-        g2["geometry"] = g2.geometry.simplify(simplify_m, preserve_topology=True)
-        gdf = g2.to_crs(epsg=4326)
-    return gdf, pin_col
+def load_geojson(path: str, simplify_m: int):
+    from boundary_store import boundary_version
+    return _shared_boundaries(path, simplify_m, boundary_version(path, simplify_m))
 
 # ================= Data layer =================
 @st.cache_data(show_spinner=False)
 def run_query_cached(sql: str, month_date: str, state_name: str) -> pd.DataFrame:
+    from google.cloud import bigquery
     job_cfg = bigquery.QueryJobConfig(
         query_parameters=[
             bigquery.ScalarQueryParameter("month", "DATE", month_date),
@@ -279,6 +261,11 @@ else:
 
 # When we should run, do all heavy work inside a spinner
 if should_run:
+    import pandas as pd
+    import folium
+    from streamlit_folium import st_folium
+    from value_format import format_column
+
     cfg = KPI_CONFIG[kpi_key]
     value_col = cfg["value_col"]; bins = cfg["bins"]; colors = cfg["colors"]
     unit_fmt = cfg["unit_fmt"]; unit_name = cfg["unit_name"]
@@ -296,7 +283,7 @@ if should_run:
         # Merge
         g = gdf.merge(df[["pincode", value_col]], left_on=pin_col, right_on="pincode",
                       how="left", validate="m:1")
-        g["_val_fmt"] = g[value_col].apply(unit_fmt)
+        g["_val_fmt"] = format_column(unit_fmt, g[value_col])
 
         # Center / zoom
         if state == "All States":
@@ -1,17 +1,18 @@
 # streamlit run app.py -FINAL
-import re, json, calendar
+from __future__ import annotations
+from startup_budget import StartupProbe
+STARTUP = StartupProbe()
+
+import os, json, calendar, math
 from datetime import date
 from dateutil.relativedelta import relativedelta
-import numpy as np
-import os
-import pandas as pd
-import geopandas as gpd
+
 import streamlit as st
-import folium
 from streamlit.components.v1 import html as st_html
 
-from google.cloud import bigquery
-from google.oauth2 import service_account
+# numpy / pandas / folium / BigQuery and the boundary helpers are imported where
+# they are used (map generation, queries), not here: the sidebar must render
+# without them. See startup_budget.py.
 
 SHOW_DEBUG = False  # <- set True only when you want to see auth/status tiles
 
@@ -19,14 +20,11 @@ SHOW_DEBUG = False  # <- set True only when you want to see auth/status tiles
 # ================= CONFIG =================
 GEOJSON_PATH = "All_India_pincode_Boundary-19312.geojson"
 SIMPLIFY_TOLERANCE_M = 500  # 0 disables
+STARTUP_BUDGET_MS = 150     # script start -> sidebar rendered; shown/flagged when SHOW_DEBUG
 
 # Colors: dark red -> dark green
 R2G8 = ["#8B0000","#B22222","#FF0000","#FF4500","#FF7F00",
         "#FFD700","#90EE90","#006400"]
-import os, json
-import streamlit as st
-from google.cloud import bigquery
-from google.oauth2 import service_account
 
 # For Python 3.11+, tomllib is built-in. If you are on 3.10 use:  pip install tomli
 try:
@@ -35,7 +33,7 @@ except Exception:
     import tomli as tomllib  # py310 fallback
 
 def _load_sa_from_toml_files():
-    """
+    r"""
     Try to read gcp_service_account from a secrets.toml file on disk:
       1) %USERPROFILE%\.streamlit\secrets.toml
       2) <CWD>\.streamlit\secrets.toml
@@ -68,6 +66,9 @@ def make_bq_client():
       D) Local hardcoded path (your laptop only)
     Returns: (client, source_str)
     """
+    from google.cloud import bigquery
+    from google.oauth2 import service_account
+
     # A) Streamlit Secrets (Cloud or local .streamlit/secrets.toml recognized by Streamlit)
     sa_info = None
     try:
@@ -124,14 +125,6 @@ def bq_healthcheck(show=False):
         st.stop()
 
 
-
-
-BQ_CLIENT = bq_healthcheck(show=SHOW_DEBUG)
-
-
-
-
-
 # def fmt_int(x):   return "—" if x is None or pd.isna(x) else f"{int(x):,}"
 # def fmt_lakh_from_rupees(x):
 #     if x is None or pd.isna(x): return "—"
@@ -148,13 +141,17 @@ def fmt_lakh_value(x):
     if x is None or pd.isna(x): return "—"
     return f"{x:,.2f} L"
 
-import math
-
 def fmt_int_or_dash(x):
     if x is None or (isinstance(x, float) and math.isnan(x)):
         return "0"          # or "—" if you prefer a dash
     return f"{int(round(x))}"
 
+# Vectorized twin of each formatter (a value_format.VECTORIZED name, identical output)
+fmt_int.vectorized = "format_int"
+fmt_lakh_from_rupees.vectorized = "format_lakh_from_rupees"
+fmt_lakh_value.vectorized = "format_lakh_value"
+fmt_int_or_dash.vectorized = "format_rounded_int"
+
 
 KPI_CONFIG = {
     "Trxn_SMAs": {
@@ -284,7 +281,7 @@ KPI_CONFIG = {
     ],
 
     "discrete_counts": False,
-    "legend_labels": [ "1", "2", "3", "4", "5", "6", "7", "≥ 8"],   # optional; if present overrides the mode above
+    "legend_labels": ["1", "2", "3", "4", "5", "6", "7", "8", "> 8"],   # optional; if present overrides the mode above
 
     "sql": """
         WITH all_pincodes AS (
@@ -640,26 +637,12 @@ STATES = [
 # =============== Auth & Cache ===============
 
 
-
-import os, json
-import streamlit as st
-from google.cloud import bigquery
-from google.oauth2 import service_account
-
-
 # ====== BigQuery Client (robust) ======
-import os, json
-import streamlit as st
-from google.cloud import bigquery
-from google.oauth2 import service_account
-
-
-# Build once, show status in the sidebar, fail fast if broken
-# BQ_CLIENT = bq_healthcheck()
-
+# Built once per process on the first query, not at import: the sidebar renders without it
+@st.cache_resource(show_spinner=False)
 def get_bq_client():
     """Back-compat: return the verified, singleton BigQuery client."""
-    return BQ_CLIENT
+    return bq_healthcheck(show=SHOW_DEBUG)
 
 
 # def get_bq_client():
@@ -711,41 +694,21 @@ def get_bq_client():
 def normalize_pin_series(s: pd.Series) -> pd.Series:
     return s.astype(str).str.extract(r"(\d{6})", expand=False)
 
-@st.cache_data(show_spinner=False)
+# One process-wide GeoDataFrame shared by every session (not a per-call st.cache_data
+# copy): read-only, merge/copy it, never assign into it. `version` re-keys it after a rebuild.
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _shared_boundaries(path: str, simplify_m: int, version: str):
+    # Precompiled GeoParquet (boundary_store.py) when fresh, raw GeoJSON otherwise
+    from boundary_store import load_boundaries
+    return load_boundaries(path, simplify_m)
+
 def load_geojson(path: str, simplify_m: int):
-    try:
-        gdf = gpd.read_file(path, engine="pyogrio")
-    except Exception:
-        gdf = gpd.read_file(path)
-
-    # Detect PIN column
-    def _n(x): return re.sub(r"[^a-z0-9]", "", x.lower())
-    props = [c for c in gdf.columns if c != "geometry"]
-    cand = {_n(c): c for c in props}
-    pin_col = None
-    for k in ["pincode","pin","postalcode","postcode"]:
-        if k in cand: pin_col = cand[k]; break
-    if pin_col is None:
-        for c in props:
-            if gdf[c].astype(str).str.fullmatch(r"\d{6}", na=False).mean() > 0.6:
-                pin_col = c; break
-    if pin_col is None:
-        raise ValueError("Could not detect a 6-digit PIN column in GeoJSON.")
-
-    gdf[pin_col] = normalize_pin_series(gdf[pin_col])
-    gdf = gdf.dropna(subset=[pin_col])
-    if gdf.crs is None:
-        gdf = gdf.set_crs(epsg=4326, allow_override=True)
-    elif gdf.crs.to_epsg() != 4326:
-        gdf = gdf.to_crs(epsg=4326)
-    if simplify_m and simplify_m > 0:
-        g2 = gdf.to_crs(epsg=3857)
-        g2["geometry"] = g2.geometry.simplify(simplify_m, preserve_topology=True)
-        gdf = g2.to_crs(epsg=4326)
-    return gdf, pin_col
+    from boundary_store import boundary_version
+    return _shared_boundaries(path, simplify_m, boundary_version(path, simplify_m))
 
 @st.cache_data(show_spinner=False)
 def run_query_cached(sql: str, month_date: str, state_name: str) -> pd.DataFrame:
+    from google.cloud import bigquery
     job_cfg = bigquery.QueryJobConfig(
         query_parameters=[
             bigquery.ScalarQueryParameter("month", "DATE", month_date),
@@ -799,6 +762,8 @@ with st.sidebar:
     state = st.selectbox("State", STATES, index=0, on_change=mark_changed)
     clicked = st.button("Generate map", type="primary")
 
+STARTUP.report(STARTUP_BUDGET_MS, show=SHOW_DEBUG)
+
 def render_header_and_button():
     """Render title (left) and orange download button (right) above the map."""
     meta   = st.session_state.last_map_meta or {"kpi": "map", "month": "", "state": ""}
@@ -839,6 +804,13 @@ if st.session_state.last_map_html and not clicked and not st.session_state.pendi
 
 # Generate map only on click
 if clicked:
+    import numpy as np
+    import pandas as pd
+    import folium
+    from color_scale import compile_scale
+    from value_format import format_column
+    from map_layers import map_document, RowTable, row_table
+
     cfg = KPI_CONFIG[kpi_key]
     value_col = cfg["value_col"]; bins = cfg["bins"]; colors = cfg["colors"]
     unit_fmt = cfg["unit_fmt"]; unit_name = cfg["unit_name"]
@@ -851,48 +823,12 @@ if clicked:
         df[value_col] = pd.to_numeric(df[value_col], errors="coerce")
         g = gdf.merge(df[["pincode", value_col]], left_on=pin_col, right_on="pincode",
                       how="left", validate="m:1")
-        g["_val_fmt"] = g[value_col].apply(unit_fmt)
-
-        vals = g[value_col].astype(float)
-
-        if cfg.get("discrete_counts", False):
-            # edges: [-0.5, 0.5, 1.5, 2.5, ..., 5.5, +inf]
-            base  = cfg["bins"]                 # [0,1,2,3,4,5,6]
-            edges = np.r_[ -0.5, np.array(base[:-1]) + 0.5, np.inf ]
-
-            # idx ∈ {0,1,2,3,4,5,6}   (0→0, 1→1, 2→2, …, >5→6)
-            idx = np.digitize(vals.to_numpy(), edges, right=False) - 1
-
-            # mark missing separately (these will be grey, not mixed with 0)
-            missing_mask = vals.isna().to_numpy()
-
-            # clamp (safety)
-            idx[idx < 0] = 0
-            idx[idx > (len(cfg["colors"]) - 1)] = len(cfg["colors"]) - 1
-
-            g["_bucket_idx"] = idx
-            g["_is_missing"] = missing_mask
-        else:
-            # continuous KPIs: keep your existing pd.cut path if you need it
-            bucket = pd.cut(
-                vals,
-                bins=cfg["bins"],
-                labels=False,
-                right=False,
-                include_lowest=True
-            )
-            g["_bucket_idx"] = bucket.fillna(-1).astype(int).to_numpy()
-            g["_is_missing"] = bucket.isna().to_numpy()
+        g["_val_fmt"] = format_column(unit_fmt, g[value_col])
 
+        # Fill colour per pincode as an index into scale.palette, bucketed for the whole column at once
+        scale = compile_scale(cfg)
+        g["_c"] = scale.index(g[value_col].astype(float))
 
-        # COlors
-        # colors = cfg["colors"]
-        # missing_color = "#d9d9d9"
-
-        # ---- after you've set g["_bucket_idx"] and g["_is_missing"] ----
-        colors = cfg["colors"]                 # from KPI_CONFIG
-        missing_color = "#d9d9d9"              # keep your existing grey
-            
         # View
         if state == "All States":
             center, zoom = [22.0, 79.0], 5
@@ -900,125 +836,30 @@ if clicked:
             bb = g.total_bounds
             center = [(bb[1]+bb[3])/2, (bb[0]+bb[2])/2]; zoom = 6
 
-        # color fn
-        def color_for_value(x, edges, cols):
-            cfg = KPI_CONFIG[kpi_key]
-
-            # NaN / None -> grey
-            if x is None or (isinstance(x, float) and np.isnan(x)):
-                return "#d9d9d9"
-
-            # ----- DISCRETE COUNTS FIX -----
-            if cfg.get("discrete_counts", False):
-                k = int(round(x)) if x is not None else -1
-                if cfg.get("zero_is_missing", False) and k == 0:
-                    return "#d9d9d9"
-                if k < 0:
-                    return "#d9d9d9"
-                # last color is the ">= last" bucket
-                return cols[-1] if k >= (len(cols) - 1) else cols[k]
-            # --------------------------------
-
-            # Continuous behaviour (unchanged)
-            if x == 0 and cfg.get("zero_is_missing", True):
-                return "#d9d9d9"
-
-            for hi, col in zip(edges[1:], cols):
-                if x <= hi:
-                    return col
-            return cols[-1]
-
-            
-        # def color_for_value(x, edges, cols):
-        #     import math
-        #     if x is None or (isinstance(x, float) and (math.isnan(x))) or x == 0:
-        #         return "#d9d9d9"
-        #     for hi, col in zip(edges[1:], cols):
-        #         if x <= hi: return col
-        #     return cols[-1]
-
         # Folium map
         m = folium.Map(location=center, zoom_start=zoom, tiles="cartodbpositron")
+        # Features carry only their row `k`; colour and tooltip text come from one table
         folium.GeoJson(
-            g[[pin_col, value_col, "_val_fmt", "geometry"]].to_json(),
+            g[["geometry"]].assign(k=np.arange(len(g))).to_json(drop_id=True),
             name="choropleth",
-            style_function=lambda f: {
-                "fillColor": color_for_value(f["properties"].get(value_col, None), bins, colors),
-                "color": "black", "weight": 0.25, "fillOpacity": 0.88, "opacity": 0.7
-            },
             highlight_function=lambda _: {"weight": 1.0, "color": "black"},
-            tooltip=folium.GeoJsonTooltip(
-                fields=[pin_col, "_val_fmt"],
-                aliases=["PIN", unit_name],
-                localize=True
-            ),
+        ).add_child(
+            RowTable(g[pin_col], {unit_name: row_table(g["_c"], g["_val_fmt"], scale.palette, unit_name)})
         ).add_to(m)
 
 
 
         
         # -------- Legend: top-right, scrollable, never clipped --------
-        # -------- Legend: top-right, scrollable, never clipped --------
-        # Bind the selected KPI's config for this render
-        cfg = KPI_CONFIG[kpi_key]      # <-- kpi_key is your currently selected KPI
-
-
-        legend_items = []
-        # show only a 'missing' chip (no “0 / …”) when this KPI says zero is not missing
-        if cfg.get("zero_is_missing", True):
-            legend_items.append(("#d9d9d9", "0 / missing"))
-        else:
-            legend_items.append(( "#d9d9d9", "missing"))  # optional; remove if you don’t want it
-
-
-        # legend_items = [("#d9d9d9", "0 / missing")]
-
         # Per-KPI edge formatter used ONLY for continuous/range legends
         def _fmt_edge(v):
-            print("^^^^^^^^^^^^^^^^", kpi_key)
-            # keep the existing special-cases you had
-            if kpi_key == "NA":   # values are in rupees; show in Lakhs
-                return f"{v/100000:.0f} L"
             if kpi_key in ("Trxn_SMAs",  "SPs", "GROSS_ADDS","AEPS_GTV_IN_LACS", "CMS_GTV_IN_LACS"):
-                print("&&&&&&&&&&&&&", kpi_key)
                 return f"{int(v)}"
-            # default (used by other continuous KPIs)
+            # default (values in rupees; show in Lakhs)
             return f"{v/100000:.0f} L"
 
-        colors = cfg["colors"]
-        bins   = cfg["bins"]
-
-        # 1) If explicit legend labels are provided in the KPI config, use them verbatim
-        explicit_labels = cfg.get("legend_labels")
-        if explicit_labels:
-            # Make sure lengths match colors
-            for c, lbl in zip(colors, explicit_labels):
-                legend_items.append((c, lbl))
-
-        # 2) Else if this KPI is a discrete count (0,1,2,..., ≥N), build one label per bin
-        elif cfg.get("discrete_counts", False):
-            # Expect bins like [0,1,2,3,4,5,6,7,8] (last is the threshold for ≥)
-            # First N bins: exact integers; Last color: "≥ last"
-            for i in range(0, len(bins) - 1):
-                legend_items.append((colors[i], f"{int(bins[i])}"))
-            legend_items.append((colors[-1], f"≥ {int(bins[-1])}"))
-
-        # 3) Otherwise: continuous ranges (your original behavior)
-        else:
-            for i in range(1, len(bins)):
-                legend_items.append((colors[i-1], f"{_fmt_edge(bins[i-1])} – {_fmt_edge(bins[i])}"))
-            legend_items.append((colors[-1], f"> {_fmt_edge(bins[-1])}"))
-
-            
-        # legend_items = [("#d9d9d9", "0 / missing")]
-        # def _fmt_edge(v):
-        #     if kpi_key == "AEPS_GTV_IN_LACS": return f"{v:.0f} L"
-        #     if kpi_key == "Trxn_SMAs": return f"{int(v)}"
-        #     return f"{v/100000:.0f} L"
-
-        # for i in range(1, len(bins)-1):
-        #     legend_items.append((colors[i-1], f"{_fmt_edge(bins[i-1])} – {_fmt_edge(bins[i])}"))
-        # legend_items.append((colors[-1], f"> {_fmt_edge(bins[-2])}"))
+        # Same buckets as the fill: grey chip, then explicit labels / counts / ranges
+        legend_items = scale.legend_items(_fmt_edge, cfg.get("legend_labels"))
 
         legend_html = f"""
         <div id="map-legend"
@@ -1052,7 +893,7 @@ if clicked:
 
         # Save in session
         title_md = f"### {kpi_key} • {month_label} • {state}"
-        html_str = m._repr_html_()
+        html_str = map_document(m)   # the document itself, not _repr_html_'s escaped iframe
         st.session_state.last_map_title = title_md
         st.session_state.last_map_html  = html_str
         st.session_state.last_map_meta  = {"kpi": kpi_key, "month": month_label, "state": state}
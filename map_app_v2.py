@@ -2,30 +2,53 @@
 #################### Nov 26th 2025 - Addition / Updation - BY vinolin ##############
 
 # streamlit run app.py -FINAL
-import re, json, calendar
+from __future__ import annotations
+from startup_budget import StartupProbe
+STARTUP = StartupProbe()
+
+import os, json, time, calendar
 from datetime import date
 from dateutil.relativedelta import relativedelta
 
-import numpy as np
-import os, json
-import pandas as pd
-import geopandas as gpd
 import streamlit as st
-import folium
 from streamlit.components.v1 import html as st_html
 
-from google.cloud import bigquery
-from google.oauth2 import service_account
+from kpi_config import KPI_CONFIG   # KPI columns, formatters, colour bins and SQL
+
+# numpy / pandas / geopandas / folium / BigQuery and the boundary helpers are
+# imported where they are used (map generation, queries), not here: the sidebar
+# must render without them. See startup_budget.py.
 
 SHOW_DEBUG = False  # <- set True only when you want to see auth/status tiles
 
 # ================= CONFIG =================
 GEOJSON_PATH = "All_India_pincode_Boundary-19312.geojson"
-SIMPLIFY_TOLERANCE_M = 500  # 0 disables
-
-# Colors: dark red -> dark green
-R2G8 = ["#8B0000","#B22222","#FF0000","#FF4500","#FF7F00",
-        "#FFD700","#90EE90","#006400"]
+# Simplification pyramid (metres), precomputed by `python boundary_store.py --levels ...`.
+# A view uses the coarsest level that is still sub-pixel at its "sharp to" zoom.
+SIMPLIFY_LEVELS_M = [2000, 500, 100]
+SHARP_TO_ZOOM = {"All States": 6}   # national view: stays crisp one zoom-in deep
+SHARP_TO_ZOOM_STATE = 9             # single state: users zoom in to districts
+# Choropleth geometry encoding: plain GeoJSON, quantized TopoJSON with shared arcs,
+# vector tiles from `python vector_tiles.py serve` (or a `vector_tiles.py build` archive),
+# or the level's TopoJSON published once under ./static (values-only maps)
+GEOMETRY_ENCODINGS = ["GeoJSON", "TopoJSON (shared arcs)", "Vector tiles (MVT endpoint)",
+                      "Static geometry asset (values only)"]
+# Leaflet renderer for the polygons: SVG (one DOM node per pincode) or one canvas;
+# both keep hover highlight and tooltips (canvas hit-tests in JS)
+RENDERERS = ["SVG", "Canvas"]
+GEOJSON_DECIMALS = 5   # coordinate decimals in the emitted GeoJSON (~1 m); None = full float64
+VECTOR_TILE_URL = os.environ.get("PINCODE_TILE_URL", "http://localhost:8765/tiles/{z}/{x}/{y}.pbf")
+# Where ./static/geometry is served (needs server.enableStaticServing, see .streamlit/config.toml)
+STATIC_GEOMETRY_URL = os.environ.get("PINCODE_GEOMETRY_URL", "/app/static/geometry/")
+# Rendered maps and downloads, keyed by their inputs (map_cache.py); shared by every process
+MAP_CACHE_DIR = os.environ.get("PINCODE_MAP_CACHE", "map_cache")
+# Modules whose code shapes the map: a change to any of them re-keys the cache
+MAP_CODE_FILES = [os.path.join(os.path.dirname(os.path.abspath(__file__)), f)
+                  for f in ("kpi_config.py", "map_layers.py", "geo_encode.py", "color_scale.py", "value_format.py",
+                            "static_map.py", "map_export.py")]
+# Delta map colour buckets for % change, mirrored around 0 (absolute change: KPI_CONFIG delta_steps)
+DELTA_PCT_STEPS = [2, 10, 25, 50]
+STARTUP_BUDGET_MS = 150   # script start -> sidebar rendered; shown/flagged when SHOW_DEBUG
 
 
 # For Python 3.11+, tomllib is built-in. If you are on 3.10 use:  pip install tomli
@@ -68,6 +91,9 @@ def make_bq_client():
       D) Local hardcoded path (your laptop only)
     Returns: (client, source_str)
     """
+    from google.cloud import bigquery
+    from google.oauth2 import service_account
+
     # A) Streamlit Secrets (Cloud or local .streamlit/secrets.toml recognized by Streamlit)
     sa_info = None
     try:
@@ -125,367 +151,6 @@ def bq_healthcheck(show=False):
 
 
 
-
-BQ_CLIENT = bq_healthcheck(show=SHOW_DEBUG)
-
-
-def fmt_int(x):   return "—" if x is None or pd.isna(x) else f"{int(x):,}"
-def fmt_lakh_from_rupees(x):
-    if x is None or pd.isna(x): return "—"
-    return f"{x/100000:,.2f} L"
-def fmt_lakh_value(x):
-    if x is None or pd.isna(x): return "—"
-    return f"{x:,.2f} L"
-
-import math
-
-def fmt_int_or_dash(x):
-    if x is None or (isinstance(x, float) and math.isnan(x)):
-        return "0"          # or "—" if you prefer a dash
-    return f"{int(round(x))}"
-
-
-KPI_CONFIG = {
-    "Trxn_SMAs": {
-        "value_col": "Trxn_SMAs",
-        "unit_name": "Transacting SMAs",
-        "unit_fmt": fmt_int,
-        "bins": [0, 3, 8, 15, 20, 25, 35, 50, 100],
-        'colors':  ["#8B0000","#B22222","#FF0000","#FF4500","#FF7F00",
-                   "#FFA500","#FFD700","#90EE90","#32CD32","#006400"],
-        # "colors": R2G8,
-        "sql": """
-        WITH all_pincodes AS (
-          SELECT DISTINCT pincode
-          FROM `spicemoney-dwh.analytics_dwh.v_pincode_master`
-        ),
-        trxn_sma_data AS (
-          SELECT pincode, COUNT(DISTINCT agent_id) AS Trxn_SMAs
-          FROM (
-            SELECT t1.agent_id, t2.final_pincode AS pincode
-            FROM (
-              SELECT agent_id
-              FROM `spicemoney-dwh.analytics_dwh.csp_monthly_timeline_with_tu`
-              WHERE month_year = @month AND total_gtv_amt > 0
-            ) AS t1
-            LEFT JOIN `spicemoney-dwh.analytics_dwh.v_client_pincode` AS t2
-              ON t1.agent_id = t2.retailer_id
-            {state_clause}  -- WHERE t2.final_state = @state
-          )
-          GROUP BY pincode
-        )
-        SELECT t1.pincode, COALESCE(Trxn_SMAs,0) AS Trxn_SMAs
-        FROM all_pincodes AS t1
-        LEFT JOIN trxn_sma_data AS t2
-          ON t1.pincode = t2.pincode
-        """
-    },
-    "AEPS_GTV_IN_LACS": {
-        "value_col": "AEPS_GTV_IN_LACS",
-        "unit_name": "AEPS GTV (Lakhs)",
-        "unit_fmt": fmt_int,
-        "bins": [0, 2, 5, 10, 15, 20, 25, 30, 50, 100],
-        "colors": ["#8B0000","#B22222","#FF0000","#FF4500","#FF7F00",
-                   "#FFA500","#FFD700","#90EE90","#32CD32","#006400"],
-        "sql": """
-        WITH all_pincodes AS (
-          SELECT DISTINCT pincode, state
-          FROM `spicemoney-dwh.analytics_dwh.v_pincode_master`
-        ),
-        aeps_gtv_data AS (
-          SELECT pincode, SUM(AEPS_GTV) AS AEPS_GTV
-          FROM (
-            SELECT t1.agent_id, AEPS_GTV, t2.final_pincode AS pincode
-            FROM (
-              SELECT agent_id, aeps_gtv_success AS AEPS_GTV
-              FROM `spicemoney-dwh.analytics_dwh.csp_monthly_timeline_with_tu`
-              WHERE month_year = @month AND total_gtv_amt > 0
-            ) AS t1
-            LEFT JOIN `spicemoney-dwh.analytics_dwh.v_client_pincode` AS t2
-              ON t1.agent_id = t2.retailer_id
-            {state_clause}  -- WHERE t2.final_state = @state
-          )
-          GROUP BY pincode
-        )
-        SELECT t1.pincode,
-               ROUND(COALESCE(AEPS_GTV,0)/100000, 2) AS AEPS_GTV_IN_LACS
-        FROM all_pincodes AS t1
-        LEFT JOIN aeps_gtv_data AS t2
-          ON t1.pincode = t2.pincode
-        """
-    },
-    "CMS_GTV_IN_LACS": {
-        "value_col": "CMS_GTV_IN_LACS",
-        "unit_name": "CMS GTV (Lakhs)",
-        "unit_fmt": fmt_int,   
-        "bins": [0, 2, 5, 10, 15, 20, 25, 30, 50, 100],
-        # "bins": [0, 2e5, 5e5, 1e6, 1.5e6, 2e6, 3e6, 5e6, 1e7, 1e12],
-        "colors": ["#8B0000","#B22222","#FF0000","#FF7F00","#FFD700",
-                   "#ADFF2F","#90EE90","#32CD32","#006400"],
-        "sql": """
-        WITH all_pincodes AS (
-          SELECT DISTINCT pincode
-          FROM `spicemoney-dwh.analytics_dwh.v_pincode_master`
-        ),
-        cms_gtv_data AS (
-          SELECT pincode, SUM(CMS_GTV) AS CMS_GTV
-          FROM (
-            SELECT t1.agent_id, CMS_GTV, t2.final_pincode AS pincode
-            FROM (
-              SELECT agent_id, cms_gtv_success AS CMS_GTV
-              FROM `spicemoney-dwh.analytics_dwh.csp_monthly_timeline_with_tu`
-              WHERE month_year = @month AND total_gtv_amt > 0
-            ) AS t1
-            LEFT JOIN `spicemoney-dwh.analytics_dwh.v_client_pincode` AS t2
-              ON t1.agent_id = t2.retailer_id
-            {state_clause}  -- WHERE t2.final_state = @state
-          )
-          GROUP BY pincode
-        )
-        SELECT t1.pincode, ROUND(COALESCE(CMS_GTV,0)/100000, 2) AS CMS_GTV_IN_LACS
-        FROM all_pincodes AS t1
-        LEFT JOIN cms_gtv_data AS t2
-          ON t1.pincode = t2.pincode
-        """
-    },
-
-
-
-    ########### Added on 26th Nov 2025 By Vinolin ########33
-    "GROSS_ADDS": {
-    "value_col": "GROSS_ADDS",
-    "unit_name": "Gross Adds (count)",
-    # "unit_fmt": fmt_int,
-    "unit_fmt": fmt_int_or_dash,
-
-    "bins": [0, 1, 2, 3, 4, 5, 6, 7, 8],
-    # Colors (0 is dark red; grey reserved ONLY for NaN/missing)
-    "colors": [
-        "#8B0000",  # 0
-        "#B22222",  # 1
-        "#FF0000",  # 2
-        "#FF7F00",  # 3
-        "#FFD700",  # 4
-        "#ADFF2F",  # 5
-        "#7FFF00",  # 6
-        "#32CD32",  # 7
-        "#006400",  # ≥8
-    ],
-
-    "discrete_counts": False,
-    "legend_labels": [ "1", "2", "3", "4", "5", "6", "7", "≥ 8"],   # optional; if present overrides the mode above
-
-    "sql": """
-        WITH all_pincodes AS (
-        SELECT DISTINCT pincode
-        FROM `spicemoney-dwh.analytics_dwh.v_pincode_master`
-        ),
-
-        gross_adds_data AS (
-        SELECT
-            pincode,
-            COUNT(DISTINCT agent_id) AS GROSS_ADDS
-        FROM (
-            SELECT
-            t1.retailer_id AS agent_id,
-            t2.final_pincode AS pincode
-            FROM `spicemoney-dwh.prod_dwh.client_details` AS t1
-            LEFT JOIN `spicemoney-dwh.analytics_dwh.v_client_pincode` AS t2
-            ON t1.retailer_id = t2.retailer_id
-            {state_clause}    -- WHERE t2.final_state = @state
-            AND t1.client_type = 'retailer'
-            AND DATE_TRUNC(DATE(t1.creation_date), MONTH) = @month
-            
-        )
-        GROUP BY pincode
-        )
-
-        SELECT
-        t1.pincode,
-        COALESCE(t2.GROSS_ADDS, 0) AS GROSS_ADDS
-        FROM all_pincodes AS t1
-        LEFT JOIN gross_adds_data AS t2
-        ON t1.pincode = t2.pincode
-        """
-        },
-
-    "SPs": {
-    "value_col": "SPs",
-    "unit_name": "SP Count (≥ 2.5L GTV)",
-    "unit_fmt": fmt_int,
-    "discrete_counts": False,
-    "legend_labels": None,
-    "bins": [0, 1, 4, 9, 16, 21, 26, 36, 51],
-    "colors": ["#8B0000", "#B22222", "#FF0000", "#FFF700", "#FFD700",
-               "#ADFF2F", "#90EE90", "#32CD32", "#006400"],
-
-  
-    "sql": """
-                    WITH all_pincodes AS (
-            SELECT DISTINCT pincode
-            FROM `spicemoney-dwh.analytics_dwh.v_pincode_master`
-            ),
-
-            sps_data AS (
-            SELECT
-                t2.final_pincode as pincode,
-                COUNT(DISTINCT base.group_id) AS SPs
-            FROM (
-                SELECT
-                a.agent_id,
-                sg.group_id
-                FROM (
-                SELECT agent_id, total_gtv_amt
-                FROM `spicemoney-dwh.analytics_dwh.csp_monthly_timeline_with_tu`
-                WHERE month_year = @month
-                    AND total_gtv_amt >= 250000
-                ) AS a
-                LEFT JOIN `spicemoney-dwh.analytics_dwh.sma_group` AS sg
-                ON a.agent_id = sg.client_id
-            ) AS base
-            LEFT JOIN `spicemoney-dwh.analytics_dwh.v_client_pincode` AS t2
-                ON base.group_id = t2.retailer_id
-            {state_clause}    -- WHERE t2.final_state = @state
-            AND base.group_id IS NOT NULL
-                
-            GROUP BY pincode
-            )
-
-            SELECT
-            t1.pincode,
-            COALESCE(t2.SPs, 0) AS SPs
-            FROM all_pincodes AS t1
-            LEFT JOIN sps_data AS t2
-            ON t1.pincode = t2.pincode
-            """
-            },
-
-
-    "SP_USAGE_CHURN": {
-    "value_col": "SP_USAGE_CHURN",
-    "unit_name": "SP Usage Churn (count)",
-    # Discrete churn levels: 0,1,2,3,4,5 and >5
-    # Keep bins as the exact cut points; the last bucket is "> last"
-    "bins": [0, 1, 2, 3, 4, 5],                   # 6 edges → 7 buckets
-    "discrete_counts": True,                      # IMPORTANT
-    # Labels must match the number of buckets: len(bins) + 1
-    "legend_labels": ["0", "1", "2", "3", "4", "5", ">5"],
-    # Colors (left→right is 0,1,2,3,4,5,>5). 0 should be green; higher = red.
-    "colors": [
-    "#006400",  # 0  : DarkGreen
-    "#FFF176",  # 1  : Light Yellow (Amber 300)
-    "#FFA726",  # 2  : Orange (Orange 400)
-    "#EF5350",  # 3  : Light Red (Red 400)
-    "#E53935",  # 4  : Darker Red (Red 600)
-    "#C62828",  # 5  : Darker Red (Red 800)
-    "#8B0000",  # >5 : Darkest Red (DarkRed)
-],
-    "unit_fmt": fmt_int_or_dash,
-    "zero_is_missing": False,                    # <- tell the app: 0 is NOT gray
-    "show_zero_grey_in_legend": False,          # <- don’t print “0 / missing” chip
-    # "bins": [0, 1, 4, 9, 16, 21, 26, 36, 51],
-    # "colors": ["#8B0000", "#B22222", "#FF0000", "#FFF700", "#FFD700",
-            #    "#ADFF2F", "#90EE90", "#32CD32", "#006400"],
-    "sql": """
-                WITH all_pincodes AS (
-                SELECT DISTINCT pincode
-                FROM `spicemoney-dwh.analytics_dwh.v_pincode_master`
-                ),
-
-                -- Map retailer -> PIN (filtered by state when provided)
-                pin_data AS (
-                SELECT
-                    t2.retailer_id AS agent_id,
-                    t2.final_pincode AS pincode
-                FROM `spicemoney-dwh.analytics_dwh.v_client_pincode` AS t2
-                
-                
-                ),
-
-                -- 3-month window ending at previous month: min/max/avg GTV (net of CMS success)
-                agg_data AS (
-                SELECT
-                    t.agent_id,
-                    ROUND(MIN(t.total_gtv_amt - t.cms_gtv_success), 1) AS gtv_min,
-                    ROUND(MAX(t.total_gtv_amt - t.cms_gtv_success), 1) AS gtv_max,
-                    ROUND(AVG(t.total_gtv_amt - t.cms_gtv_success), 1) AS gtv_avg
-                FROM `spicemoney-dwh.analytics_dwh.csp_monthly_timeline_with_tu` AS t
-                WHERE t.month_year IN (
-                    DATE_SUB("2025-10-01", INTERVAL 2 MONTH),
-                    DATE_SUB("2025-10-01", INTERVAL 1 MONTH),
-                    DATE_SUB("2025-10-01", INTERVAL 0 MONTH)
-                )
-                GROUP BY t.agent_id
-                ),
-
-                -- Previous month net GTV to keep only meaningful bases
-                prev_month_data AS (
-                SELECT
-                    t.agent_id,
-                    ROUND(t.total_gtv_amt - t.cms_gtv_success, 1) AS gtv_prev
-                FROM `spicemoney-dwh.analytics_dwh.csp_monthly_timeline_with_tu` AS t
-                WHERE t.month_year = DATE_SUB("2025-10-01", INTERVAL 1 MONTH)
-                ),
-
-                -- Keep agents with prev month >= 2.5e5
-                agg_data2 AS (
-                SELECT a.*
-                FROM agg_data a
-                LEFT JOIN prev_month_data p USING (agent_id)
-                WHERE p.gtv_prev >= 250000
-                ),
-
-                -- Focus-month realized net GTV
-                focus_month_txn_data AS (
-                SELECT
-                    t.agent_id,
-                    ROUND(t.total_gtv_amt - t.cms_gtv_success, 1) AS gtv_focus
-                FROM `spicemoney-dwh.analytics_dwh.csp_monthly_timeline_with_tu` AS t
-                WHERE t.month_year = "2025-10-01"
-                ),
-
-                -- Final per-agent performance classification
-                final_data AS (
-                SELECT
-                    pd.pincode,
-                    ad.agent_id,
-                    ROUND(COALESCE(SAFE_DIVIDE(fm.gtv_focus, NULLIF(ad.gtv_max, 0)), 0), 4) AS ratio
-                FROM agg_data2 ad
-                LEFT JOIN focus_month_txn_data fm USING (agent_id)
-                JOIN pin_data pd ON pd.agent_id = ad.agent_id
-                ),
-
-                churn_data AS (
-                SELECT
-                    pincode,
-                    COUNT(DISTINCT IF(ratio <= 0.2, agent_id, NULL)) AS SP_USAGE_CHURN
-                FROM final_data
-                GROUP BY pincode
-                )
-
-        select t1.*
-        from
-        (
-                SELECT
-                t1.pincode,
-                COALESCE(t2.SP_USAGE_CHURN, 0) AS SP_USAGE_CHURN
-                FROM all_pincodes AS t1
-                LEFT JOIN churn_data AS t2
-                ON t1.pincode = t2.pincode
-        ) as t1 left join 
-        (
-            SELECT DISTINCT pincode as final_pincode, state as final_state
-            FROM `spicemoney-dwh.analytics_dwh.v_pincode_master`
-        ) as t2
-        on t1.pincode = t2.final_pincode
-        {state_clause}   -- WHERE t2.final_state = @state
-        """
-        }
-
-
-
-} ### DICT end
-
 STATES = [
     "All States",'UTTAR PRADESH',
 'TAMIL NADU',
@@ -524,67 +189,250 @@ STATES = [
 'MEGHALAYA'
 ]
 
+@st.cache_resource(show_spinner=False)
 def get_bq_client():
-    """Back-compat: return the verified, singleton BigQuery client."""
-    return BQ_CLIENT
+    """Back-compat: return the verified, singleton BigQuery client (built on first query)."""
+    return bq_healthcheck(show=SHOW_DEBUG)
 
 def normalize_pin_series(s: pd.Series) -> pd.Series:
     return s.astype(str).str.extract(r"(\d{6})", expand=False)
 
-@st.cache_data(show_spinner=False)
+# Boundaries and topologies are process-wide shared resources, not st.cache_data
+# copies: every session gets the same objects, so treat them as read-only (select,
+# merge, copy; never assign into them). `version` re-keys them after a cache rebuild.
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _shared_boundaries(path: str, simplify_m: int, version: str):
+    # Precompiled GeoParquet (boundary_store.py) when fresh, raw GeoJSON otherwise
+    from boundary_store import load_boundaries
+    return load_boundaries(path, simplify_m)
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _shared_topology(path: str, simplify_m: int, version: str):
+    # Shared-arc topology precomputed per level by boundary_store.py (None if not built)
+    from boundary_store import load_topology
+    return load_topology(path, simplify_m)
+
 def load_geojson(path: str, simplify_m: int):
-    try:
-        gdf = gpd.read_file(path, engine="pyogrio")
-    except Exception:
-        gdf = gpd.read_file(path)
-
-    # Detect PIN column
-    def _n(x): return re.sub(r"[^a-z0-9]", "", x.lower())
-    props = [c for c in gdf.columns if c != "geometry"]
-    cand = {_n(c): c for c in props}
-    pin_col = None
-    for k in ["pincode","pin","postalcode","postcode"]:
-        if k in cand: pin_col = cand[k]; break
-    if pin_col is None:
-        for c in props:
-            if gdf[c].astype(str).str.fullmatch(r"\d{6}", na=False).mean() > 0.6:
-                pin_col = c; break
-    if pin_col is None:
-        raise ValueError("Could not detect a 6-digit PIN column in GeoJSON.")
-
-    gdf[pin_col] = normalize_pin_series(gdf[pin_col])
-    gdf = gdf.dropna(subset=[pin_col])
-    if gdf.crs is None:
-        gdf = gdf.set_crs(epsg=4326, allow_override=True)
-    elif gdf.crs.to_epsg() != 4326:
-        gdf = gdf.to_crs(epsg=4326)
-    if simplify_m and simplify_m > 0:
-        g2 = gdf.to_crs(epsg=3857)
-        g2["geometry"] = g2.geometry.simplify(simplify_m, preserve_topology=True)
-        gdf = g2.to_crs(epsg=4326)
-    return gdf, pin_col
+    from boundary_store import boundary_version
+    return _shared_boundaries(path, simplify_m, boundary_version(path, simplify_m))
 
-@st.cache_data(show_spinner=False)
-def run_query_cached(sql: str, month_date: str, state_name: str) -> pd.DataFrame:
-    job_cfg = bigquery.QueryJobConfig(
+def load_topojson(path: str, simplify_m: int):
+    from boundary_store import boundary_version
+    return _shared_topology(path, simplify_m, boundary_version(path, simplify_m))
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _shared_flat(path: str, simplify_m: int, version: str):
+    # Memory-mapped flat arrays (boundary_store.write_flat): one page-cache copy for
+    # every server process on the box; None when the level has no .flat file
+    from boundary_store import load_flat
+    return load_flat(path, simplify_m)
+
+def load_boundary_rows(path: str, simplify_m: int, rows=None):
+    """(GeoDataFrame, pin_col) for `rows` (positions; all when None) of one level.
+
+    Rebuilt from the shared flat store when it exists, so a process never holds a
+    long-lived copy of the geometry; falls back to the shared in-process frame.
+    """
+    from boundary_store import boundary_version
+    flat = _shared_flat(path, simplify_m, boundary_version(path, simplify_m))
+    if flat is not None:
+        return flat.frame(rows)
+    gdf, pin_col = load_geojson(path, simplify_m)
+    return (gdf if rows is None else gdf.iloc[rows]), pin_col
+
+def load_boundary_pins(path: str, simplify_m: int):
+    """(PIN string Series, pin_col) of one level, without building any geometry when possible."""
+    from boundary_store import boundary_version
+    flat = _shared_flat(path, simplify_m, boundary_version(path, simplify_m))
+    if flat is not None:
+        return flat.pin_strings(), flat.pin_col
+    gdf, pin_col = load_geojson(path, simplify_m)
+    return gdf[pin_col], pin_col
+
+def map_topology(simplify_m: int, rows, g, pin_col: str) -> dict:
+    """Shared-arc topology of the map's rows (`g`, in order; PINs as ids): the level's, subset; built from `g` when missing or stale."""
+    from geo_encode import build_topology, subset_topology, topology_ids
+    topo = load_topojson(GEOJSON_PATH, simplify_m)
+    if topo is not None and rows is not None:
+        topo = subset_topology(topo, rows)
+    if topo is None or topology_ids(topo) != g[pin_col].tolist():
+        topo = build_topology(g.geometry.values, ids=g[pin_col].tolist())
+    return topo
+
+PINCODE_STATE_SQL = """
+SELECT DISTINCT pincode, state
+FROM `spicemoney-dwh.analytics_dwh.v_pincode_master`
+"""
+
+@st.cache_data(show_spinner=False, ttl=24 * 3600)
+def load_pincode_states() -> pd.DataFrame:
+    df = get_bq_client().query(PINCODE_STATE_SQL).result().to_dataframe(create_bqstorage_client=False, progress_bar_type=None)
+    df["pincode"] = normalize_pin_series(df["pincode"])
+    return df.dropna(subset=["pincode"])[["pincode", "state"]]
+
+# Row positions and frames belong to one build of the boundaries: `version`
+# (boundary_version) re-keys them after a rebuild, like the _shared_* loaders
+@st.cache_data(show_spinner=False, ttl=24 * 3600)
+def _state_index(path: str, simplify_m: int, version: str) -> dict:
+    # state -> row positions into the level's boundaries, from v_pincode_master
+    from boundary_store import build_state_index
+    pins, _ = load_boundary_pins(path, simplify_m)
+    return build_state_index(pins, load_pincode_states())
+
+def load_state_index(path: str, simplify_m: int) -> dict:
+    from boundary_store import boundary_version
+    return _state_index(path, simplify_m, boundary_version(path, simplify_m))
+
+@st.cache_data(show_spinner=False, ttl=24 * 3600)
+def _state_frames(path: str, version: str) -> dict:
+    # state -> {"bounds", "center", "zoom"} from the cached per-pincode framing table
+    from boundary_store import load_frame_index, build_frame_index, state_frames
+    frames = load_frame_index(path)
+    if frames is None:
+        gdf, pin_col = load_boundary_rows(path, min(SIMPLIFY_LEVELS_M))
+        frames = build_frame_index(gdf, pin_col)
+    return state_frames(frames, load_pincode_states())
+
+def load_state_frames(path: str) -> dict:
+    # the framing table is rebuilt with the finest level
+    from boundary_store import boundary_version
+    return _state_frames(path, boundary_version(path, min(SIMPLIFY_LEVELS_M)))
+
+def _query_config(state_name: str, **months):
+    # one DATE parameter per keyword (month=..., or month_a=... / month_b=...)
+    from google.cloud import bigquery
+    return bigquery.QueryJobConfig(
         query_parameters=[
-            bigquery.ScalarQueryParameter("month", "DATE", month_date),
+            *(bigquery.ScalarQueryParameter(name, "DATE", value) for name, value in months.items()),
             bigquery.ScalarQueryParameter("state", "STRING", state_name),
         ]
     )
+
+@st.cache_data(show_spinner=False)
+def run_query_cached(sql: str, month_date: str, state_name: str) -> pd.DataFrame:
+    job_cfg = _query_config(state_name, month=month_date)
     return get_bq_client().query(sql, job_config=job_cfg).result().to_dataframe(create_bqstorage_client=False, progress_bar_type=None)
 
-def run_query(kpi_key: str, month_date: str, state_name: str) -> pd.DataFrame:
-    cfg = KPI_CONFIG[kpi_key]
-    sql = cfg["sql"].format(
+@st.cache_data(show_spinner=False)
+def run_query_months_cached(sql: str, month_dates: tuple, state_name: str) -> list:
+    # Every month's job is submitted before any result is awaited: BigQuery runs them concurrently
+    client = get_bq_client()
+    jobs = [client.query(sql, job_config=_query_config(state_name, month=m)) for m in month_dates]
+    return [job.result().to_dataframe(create_bqstorage_client=False, progress_bar_type=None) for job in jobs]
+
+@st.cache_data(show_spinner=False)
+def run_queries_cached(sqls: tuple, month_date: str, state_name: str) -> list:
+    # Every query's job is submitted before any result is awaited: BigQuery runs them concurrently
+    client = get_bq_client()
+    jobs = [client.query(sql, job_config=_query_config(state_name, month=month_date)) for sql in sqls]
+    return [job.result().to_dataframe(create_bqstorage_client=False, progress_bar_type=None) for job in jobs]
+
+@st.cache_data(show_spinner=False)
+def run_delta_query_cached(sql: str, month_a: str, month_b: str, state_name: str) -> pd.DataFrame:
+    job_cfg = _query_config(state_name, month_a=month_a, month_b=month_b)
+    return get_bq_client().query(sql, job_config=job_cfg).result().to_dataframe(create_bqstorage_client=False, progress_bar_type=None)
+
+def _kpi_sql(kpi_key: str, state_name: str, key: str = "sql") -> str:
+    return KPI_CONFIG[kpi_key][key].format(
         state_clause="" if state_name == "All States" else "WHERE t2.final_state = @state"
     )
-    df = run_query_cached(sql, month_date, state_name)
+
+def _check_result(df: pd.DataFrame) -> pd.DataFrame:
     if "pincode" not in df.columns:
         raise ValueError("Result must include 'pincode'.")
     df["pincode"] = normalize_pin_series(df["pincode"])
     return df
 
+def run_query(kpi_key: str, month_date: str, state_name: str) -> pd.DataFrame:
+    return _check_result(run_query_cached(_kpi_sql(kpi_key, state_name), month_date, state_name))
+
+def run_query_months(kpi_key: str, month_dates, state_name: str) -> list:
+    """One result per month of `month_dates`, fetched as one batch of concurrent jobs."""
+    return [_check_result(df) for df in run_query_months_cached(_kpi_sql(kpi_key, state_name), tuple(month_dates), state_name)]
+
+def run_queries(kpi_keys, month_date: str, state_name: str) -> dict:
+    """KPI key -> its result for one month, for every KPI of `kpi_keys` fetched as one batch of concurrent jobs."""
+    kpi_keys = list(kpi_keys)
+    results = run_queries_cached(tuple(_kpi_sql(k, state_name) for k in kpi_keys), month_date, state_name)
+    return {k: _check_result(df) for k, df in zip(kpi_keys, results)}
+
+def kpi_values(kpi_key: str, month_date: str, state_name: str, pins: pd.Series, result: pd.DataFrame = None) -> pd.Series:
+    """The KPI's value for each map row (`pins`, in order); NaN where the query has no row.
+
+    `result` is the month's query result when already fetched (run_query_months, run_queries).
+    """
+    import pandas as pd
+    value_col = KPI_CONFIG[kpi_key]["value_col"]
+    df = run_query(kpi_key, month_date, state_name) if result is None else result
+    df[value_col] = pd.to_numeric(df[value_col], errors="coerce")
+    rows = pd.DataFrame({"pincode": pins.to_numpy()})
+    return rows.merge(df[["pincode", value_col]], on="pincode", how="left", validate="m:1")[value_col]
+
+def kpi_follows_month(kpi_key: str) -> bool:
+    """Whether the KPI's query takes the month parameter (a fixed window gives every month the same map)."""
+    return "@month" in KPI_CONFIG[kpi_key]["sql"]
+
+def kpi_delta(kpi_key: str, month_a: str, month_b: str, state_name: str, pins: pd.Series) -> dict:
+    """Per map row (`pins`, in order): the KPI in month_a ("a") and month_b ("b"), "change" (a - b) and "pct" (% of b).
+
+    One scan of both months when the KPI has a delta_sql, else its monthly query for
+    both months as one batch. NaN where a pincode has no row; "pct" is NaN where b is 0.
+    """
+    import numpy as np
+    import pandas as pd
+    if KPI_CONFIG[kpi_key].get("delta_sql"):
+        df = _check_result(run_delta_query_cached(_kpi_sql(kpi_key, state_name, "delta_sql"), month_a, month_b, state_name))
+        rows = pd.DataFrame({"pincode": pins.to_numpy()}).merge(df[["pincode", "value_a", "value_b"]], on="pincode",
+                                                                how="left", validate="m:1")
+        a = pd.to_numeric(rows["value_a"], errors="coerce").to_numpy(dtype=float)
+        b = pd.to_numeric(rows["value_b"], errors="coerce").to_numpy(dtype=float)
+    else:
+        res_a, res_b = run_query_months(kpi_key, [month_a, month_b], state_name)
+        a = kpi_values(kpi_key, month_a, state_name, pins, res_a).to_numpy(dtype=float)
+        b = kpi_values(kpi_key, month_b, state_name, pins, res_b).to_numpy(dtype=float)
+    change = a - b
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = np.where(b != 0, change / np.abs(b) * 100, np.nan)
+    return {"a": a, "b": b, "change": change, "pct": pct}
+
+def delta_texts(unit_fmt, d: dict) -> np.ndarray:
+    """Tooltip text per row of kpi_delta(): "b → a: +change (+pct%)"."""
+    import numpy as np
+    from value_format import format_column, format_fixed
+    plus = lambda x: np.where(x > 0, "+", "").astype(object)
+    return (format_column(unit_fmt, d["b"]).astype(object) + " → " + format_column(unit_fmt, d["a"]).astype(object) + ": "
+            + plus(d["change"]) + format_column(unit_fmt, d["change"]).astype(object)
+            + " (" + plus(d["pct"]) + format_fixed(d["pct"], 1, "%", missing="n/a").astype(object) + ")")
+
+def delta_scale(kpi_key: str, by: str):
+    """(diverging ColorScale, legend labels) for a KPI's change: % (DELTA_PCT_STEPS) or absolute (its delta_steps)."""
+    from color_scale import diverging_scale, diverging_labels, DIVERGING_COLORS
+    cfg = KPI_CONFIG[kpi_key]
+    steps = DELTA_PCT_STEPS if by == "%" else cfg["delta_steps"]
+    colors = DIVERGING_COLORS if cfg.get("higher_is_better", True) else DIVERGING_COLORS[::-1]
+    fmt = (lambda v: f"{v:g}%") if by == "%" else None
+    return diverging_scale(steps, colors), diverging_labels(steps, fmt)
+
+def kpi_legend(kpi_key: str, scale, labels=None, heading: str = None) -> tuple:
+    """(legend items, legend box inner HTML) for a KPI: same buckets as the fill.
+
+    `labels` / `heading` override the KPI's legend labels and "KPI • unit" heading (delta maps).
+    """
+    # Per-KPI edge formatter used ONLY for continuous/range legends
+    def _fmt_edge(v):
+        if kpi_key in ("Trxn_SMAs",  "SPs", "GROSS_ADDS","AEPS_GTV_IN_LACS", "CMS_GTV_IN_LACS"):
+            return f"{int(v)}"
+        # default (values in rupees; show in Lakhs)
+        return f"{v/100000:.0f} L"
+
+    # Grey chip, then explicit labels / counts / ranges
+    cfg = KPI_CONFIG[kpi_key]
+    items = scale.legend_items(_fmt_edge, labels or cfg.get("legend_labels"))
+    body = f"<b>{heading or kpi_key + ' • ' + cfg['unit_name']}</b><br>" + "".join(
+        f'<i style="background:{c};width:12px;height:12px;display:inline-block;margin-right:6px;opacity:0.9"></i>{t}<br>'
+        for c, t in items)
+    return items, body
+
 # =============== UI ===============
 st.set_page_config(page_title="PIN-code Level Map Generation Utility", layout="wide")
 st.title("PIN-code Level Map Generation Utility")
@@ -605,6 +453,8 @@ if "last_map_html" not in st.session_state:
     st.session_state.last_map_title = ""
 if "last_map_meta" not in st.session_state:
     st.session_state.last_map_meta = None
+if "last_map_spec" not in st.session_state:
+    st.session_state.last_map_spec = None    # what the downloads rebuild the map from: level, rows, codes, texts, legend, view
 if "pending_changes" not in st.session_state:
     st.session_state.pending_changes = True
 
@@ -614,20 +464,71 @@ def mark_changed():
 with st.sidebar:
     st.header("Controls")
     kpi_key = st.selectbox("KPI", list(KPI_CONFIG.keys()), index=0, on_change=mark_changed)
+    all_kpis = st.checkbox("All KPIs (switch on the map)", value=False, on_change=mark_changed,
+                           help="Every KPI for this month and state on one map; the KPI above is shown first.")
     month_label = st.selectbox("Month", labels, index=0, on_change=mark_changed)  # most recent first
     month_param = values[labels.index(month_label)]
+    compare_labels = st.multiselect("Compare with months", [l for l in labels if l != month_label], max_selections=3,
+                                    on_change=mark_changed, help="Side-by-side panes, one per month, panned and zoomed together.")
+    delta_label = st.selectbox("Change from month", ["—"] + [l for l in labels if l != month_label], index=0,
+                               on_change=mark_changed, help="Map the change per pincode from this month to the month above.")
+    delta_by = "%"
+    if delta_label != "—":
+        delta_by = st.selectbox("Colour change by", ["%", "Absolute"], index=0, on_change=mark_changed)
     state = st.selectbox("State", STATES, index=0, on_change=mark_changed)
+    encoding = st.selectbox("Geometry encoding", GEOMETRY_ENCODINGS, index=0, on_change=mark_changed)
+    renderer = st.selectbox("Renderer", RENDERERS, index=0, on_change=mark_changed)
+    export_fmt = st.selectbox("Download as", ["html", "html.gz", "zip"], index=0)
     clicked = st.button("Generate map", type="primary")
 
+STARTUP.report(STARTUP_BUDGET_MS, show=SHOW_DEBUG)
+
+def _map_export(spec: dict, fmt: str, name: str) -> bytes:
+    # Runs on the download thread: shared-arc topology from the boundary store, no st.* calls
+    from map_export import export_map
+    return export_map(GEOJSON_PATH, spec, fmt, name, cache_dir=MAP_CACHE_DIR)[0]
+
+def _map_image_png(spec: dict) -> bytes:
+    # Runs on the download thread: geometry straight from the boundary store, no st.* calls
+    from boundary_store import load_flat, load_boundaries, boundary_version
+    from static_map import render_static_map
+    from map_export import spec_digest
+    from map_cache import cache_key, code_version, read_entry, write_entry
+    key = cache_key({"image": spec_digest(spec), "format": "png", "code": code_version(*MAP_CODE_FILES),
+                     "geometry": boundary_version(GEOJSON_PATH, spec["simplify_m"])})
+    hit = read_entry(key, MAP_CACHE_DIR)
+    if hit is not None:
+        return hit[0]
+    flat = load_flat(GEOJSON_PATH, spec["simplify_m"])
+    if flat is not None:
+        geoms = flat.geometries(spec["rows"])
+    else:
+        gdf, _ = load_boundaries(GEOJSON_PATH, spec["simplify_m"])
+        geoms = gdf.geometry.values if spec["rows"] is None else gdf.geometry.values[spec["rows"]]
+    png = render_static_map(geoms, spec["codes"], spec["palette"], spec["legend"], spec["title"])
+    write_entry(key, png, ext="png", cache_dir=MAP_CACHE_DIR)
+    return png
+
 def render_header_and_button():
-    """Render title (left) and orange download button (right) above the map."""
+    """Render title (left) and the orange PNG / HTML download buttons (right) above the map."""
     meta   = st.session_state.last_map_meta or {"kpi": "map", "month": "", "state": ""}
     fname  = f"{meta['kpi']}_{meta['month'].replace(' ', '-')}_{meta['state'].replace(' ', '-')}.html"
     title  = st.session_state.last_map_title
 
-    left, right = st.columns([1, 0.22], vertical_alignment="center")
+    left, middle, right = st.columns([1, 0.2, 0.22], vertical_alignment="center")
     with left:
         st.markdown(title)
+    spec = st.session_state.last_map_spec
+    if spec:
+        with middle:
+            # rendered server-side (static_map.py) only when clicked
+            st.download_button(
+                "Download image (PNG)",
+                data=lambda: _map_image_png(spec),
+                file_name=fname.rsplit(".", 1)[0] + ".png",
+                mime="image/png",
+                key="dl_map_png",
+            )
     with right:
         st.markdown(
             """
@@ -644,13 +545,21 @@ def render_header_and_button():
             """,
             unsafe_allow_html=True,
         )
+        from map_export import EXPORT_FORMATS
+        mime, suffix = EXPORT_FORMATS[export_fmt]
+        html_str = st.session_state.last_map_html
         st.download_button(
             "Download this map",
-            data=st.session_state.last_map_html.encode("utf-8"),
-            file_name=fname,
-            mime="text/html",
+            # built from the map spec (geometry once, as TopoJSON) only when clicked
+            data=(lambda: _map_export(spec, export_fmt, fname)) if spec else html_str.encode("utf-8"),
+            file_name=fname if export_fmt == "html" or not spec else fname.rsplit(".", 1)[0] + suffix,
+            mime=mime if spec else "text/html",
             key="dl_map_top",
         )
+    if SHOW_DEBUG and spec:
+        from map_export import export_map, size_report
+        st.caption(size_report(export_map(GEOJSON_PATH, spec, export_fmt, fname, cache_dir=MAP_CACHE_DIR)[1],
+                               len(st.session_state.last_map_html.encode("utf-8"))))
 
 # Show persisted map (if any) when filters haven’t changed
 if st.session_state.last_map_html and not clicked and not st.session_state.pending_changes:
@@ -683,218 +592,218 @@ if st.session_state.last_map_html and not clicked and not st.session_state.pendi
 ############## OLDER VERSION ####################3
 # Generate map only on click
 if clicked:
+    import numpy as np
+    import pandas as pd
+    import folium
+    from boundary_store import pick_simplify_level, read_manifest, publish_static_geometry, boundary_version
+    from geo_encode import topojson_document, round_coordinates
+    from map_layers import (VectorTileChoropleth, value_table, RowTable, row_table, BareTopoJson, StaticGeometryLayer,
+                            SyncedViews, PaneLabel, FrameTimer, map_document, inline_geometry, compact_json)
+    from map_export import TOPOLOGY_PLACEHOLDER
+    from color_scale import compile_scale
+    from value_format import format_column
+    from map_cache import cache_key, code_version, read_entry, write_entry
+
     cfg = KPI_CONFIG[kpi_key]
     value_col = cfg["value_col"]; bins = cfg["bins"]; colors = cfg["colors"]
     unit_fmt = cfg["unit_fmt"]; unit_name = cfg["unit_name"]
 
+    # Geo: pick the pyramid level for this view
+    zoom = 5 if state == "All States" else 6
+    simplify_m = pick_simplify_level(SIMPLIFY_LEVELS_M, SHARP_TO_ZOOM.get(state, SHARP_TO_ZOOM_STATE))
+
+    # Delta map: the selected KPI's change from another month, on its own
+    delta = (delta_label, values[labels.index(delta_label)]) if delta_label != "—" else None
+    if delta and not kpi_follows_month(kpi_key):
+        st.info(f"{kpi_key}'s query does not follow the selected month, so it has no change map; drawing {month_label}.")
+        delta = None
+    if delta and (compare_labels or all_kpis):
+        st.info("The change map shows the selected KPI only; month comparison and All KPIs are off.")
+        compare_labels, all_kpis = [], False
+
+    # Month comparison: the selected KPI in one pane per month
+    if compare_labels and not kpi_follows_month(kpi_key):
+        st.info(f"{kpi_key}'s query does not follow the selected month, so every pane would be the same; drawing {month_label} only.")
+        compare_labels = []
+    compare = [(l, values[labels.index(l)]) for l in compare_labels]
+    months = [(month_label, month_param)] + compare
+    if compare and all_kpis:
+        st.info("Comparing months shows the selected KPI only.")
+        all_kpis = False
+    # The panes share one decoded topology: the static asset's or the page's TopoJSON
+    if compare and encoding in ("GeoJSON", "Vector tiles (MVT endpoint)"):
+        st.info("Comparing months needs the topology in the page or the static asset; drawing TopoJSON.")
+        encoding = "TopoJSON (shared arcs)"
+
+    # All KPIs: one layer restyled in the browser, which vector tiles cannot do
+    kpis = list(KPI_CONFIG) if all_kpis else [kpi_key]
+    if all_kpis and encoding == "Vector tiles (MVT endpoint)":
+        st.info("All KPIs needs the geometry in the page or the static asset; drawing TopoJSON.")
+        encoding = "TopoJSON (shared arcs)"
+
+    # Same inputs, same map: served from the disk cache (any session, any process, across restarts)
+    t_cache = time.perf_counter()
+    map_inputs = {"kpi": kpi_key, "config": {k: KPI_CONFIG[k] for k in kpis}, "month": month_param, "state": state, "encoding": encoding,
+                  "compare": [v for _, v in compare], "delta": delta and [delta[1], delta_by],
+                  "renderer": renderer, "geometry": boundary_version(GEOJSON_PATH, simplify_m),
+                  "code": code_version(__file__, *MAP_CODE_FILES), "debug": SHOW_DEBUG,
+                  "decimals": GEOJSON_DECIMALS, "urls": [STATIC_GEOMETRY_URL, VECTOR_TILE_URL]}
+    map_key = cache_key(map_inputs)
+    # the current month's data is still landing: its maps expire like the query caches
+    cached = read_entry(map_key, MAP_CACHE_DIR, max_age_s=24 * 3600 if values[0] in (v for _, v in months + [delta or ("", "")]) else None)
+    if cached is not None:
+        st.session_state.last_map_html = cached[0].decode("utf-8")
+        for k in ("title", "meta", "spec"):
+            st.session_state[f"last_map_{k}"] = cached[1][k]
+        st.session_state.pending_changes = False
+        if SHOW_DEBUG:
+            st.sidebar.caption(f"Map {map_key[:12]} from the disk cache in {(time.perf_counter()-t_cache)*1000:.0f} ms")
 
+if clicked and cached is None:
     with st.spinner("Generating map…"):
-        # Geo
-        gdf, pin_col = load_geojson(GEOJSON_PATH, SIMPLIFY_TOLERANCE_M)
-        # Data
-        df = run_query(kpi_key, month_param, state)
-        df[value_col] = pd.to_numeric(df[value_col], errors="coerce")
-        g = gdf.merge(df[["pincode", value_col]], left_on=pin_col, right_on="pincode",
-                      how="left", validate="m:1")
-        g["_val_fmt"] = g[value_col].apply(unit_fmt)
-
-
-        vals = g[value_col].astype(float)
-
-        if cfg.get("discrete_counts", False):
-            # edges: [-0.5, 0.5, 1.5, 2.5, ..., 5.5, +inf]
-            base  = cfg["bins"]                 # [0,1,2,3,4,5,6]
-            edges = np.r_[ -0.5, np.array(base[:-1]) + 0.5, np.inf ]
-
-            # idx ∈ {0,1,2,3,4,5,6}   (0→0, 1→1, 2→2, …, >5→6)
-            idx = np.digitize(vals.to_numpy(), edges, right=False) - 1
-
-            # mark missing separately (these will be grey, not mixed with 0)
-            missing_mask = vals.isna().to_numpy()
-
-            # clamp (safety)
-            idx[idx < 0] = 0
-            idx[idx > (len(cfg["colors"]) - 1)] = len(cfg["colors"]) - 1
-
-            g["_bucket_idx"] = idx
-            g["_is_missing"] = missing_mask
+        # Single state: only that state's polygons are built, merged, serialized and drawn
+        state_rows = None
+        if state != "All States":
+            state_rows = load_state_index(GEOJSON_PATH, simplify_m).get(state)
+            if state_rows is not None and not len(state_rows):
+                state_rows = None
+        gdf, pin_col = load_boundary_rows(GEOJSON_PATH, simplify_m, state_rows)
+        # All KPIs: every KPI's query for the month in one batch of concurrent jobs
+        batch = run_queries(kpis, month_param, state) if all_kpis else {}
+        if delta:
+            # Change from the delta month (both months in one scan), on a diverging scale
+            d = kpi_delta(kpi_key, month_param, delta[1], state, gdf[pin_col])
+            g = gdf.assign(**{value_col: d["pct" if delta_by == "%" else "change"]})
+            g["_val_fmt"] = delta_texts(unit_fmt, d)
+            scale, delta_labels = delta_scale(kpi_key, delta_by)
+            unit_name = f"{unit_name}, change from {delta[0]}"
         else:
-            # continuous KPIs: keep your existing pd.cut path if you need it
-            bucket = pd.cut(
-                vals,
-                bins=cfg["bins"],
-                labels=False,
-                right=False,
-                include_lowest=True
-            )
-            g["_bucket_idx"] = bucket.fillna(-1).astype(int).to_numpy()
-            g["_is_missing"] = bucket.isna().to_numpy()
-
-
-        # COlors
-        # colors = cfg["colors"]
-        # missing_color = "#d9d9d9"
-
-        # ---- after you've set g["_bucket_idx"] and g["_is_missing"] ----
-        colors = cfg["colors"]                 # from KPI_CONFIG
-        missing_color = "#d9d9d9"              # keep your existing grey
-
-        def color_for_bucket(idx: int) -> str:
-            """Return the fill color for a given discrete/continuous bucket index."""
-            if idx is None or idx < 0:
-                return missing_color
-            if idx >= len(colors):
-                return colors[-1]
-            return colors[idx]
-
-        # View
+            # Data (all compared months in one batch of queries)
+            results = run_query_months(kpi_key, [v for _, v in months], state) if compare else [batch.get(kpi_key)]
+            g = gdf.assign(**{value_col: kpi_values(kpi_key, month_param, state, gdf[pin_col], results[0]).to_numpy()})
+            g["_val_fmt"] = format_column(unit_fmt, g[value_col])
+            scale = compile_scale(cfg)
+
+        # Fill colour per pincode as an index into scale.palette ([grey, *colors])
+        palette = scale.palette
+        g["_c"] = scale.index(g[value_col].astype(float))
+        if delta:
+            legend_items, legend_body = kpi_legend(kpi_key, scale, delta_labels,
+                                                   f"{kpi_key} • {'% change' if delta_by == '%' else 'change'} from {delta[0]}")
+        else:
+            legend_items, legend_body = kpi_legend(kpi_key, scale)
+
+        # Colour / tooltip table per KPI over the same rows (features carry only their row `k`);
+        # with several, the map switches between them and swaps the legend body
+        tables = {}
+        for k in kpis:
+            if k == kpi_key:
+                tables[k] = row_table(g["_c"], g["_val_fmt"], palette, unit_name, legend_body if all_kpis else None)
+                continue
+            k_cfg, k_scale = KPI_CONFIG[k], compile_scale(KPI_CONFIG[k])
+            k_values = kpi_values(k, month_param, state, g[pin_col], batch[k])
+            tables[k] = row_table(k_scale.index(k_values.astype(float)), format_column(k_cfg["unit_fmt"], k_values),
+                                  k_scale.palette, k_cfg["unit_name"], kpi_legend(k, k_scale)[1])
+
+        # View: precomputed per-state frame (no geometry scan); fit_bounds frames it exactly
+        frame = None
         if state == "All States":
-            center, zoom = [22.0, 79.0], 5
+            center = [22.0, 79.0]
         else:
-            bb = g.total_bounds
-            center = [(bb[1]+bb[3])/2, (bb[0]+bb[2])/2]; zoom = 6
-
-        # color fn
-        # def color_for_value(x, edges, cols):
-        #     import math
-
-        #     # NaN / None stays gray for every KPI
-        #     if x is None or (isinstance(x, float) and np.isnan(x)):
-        #         return "#d9d9d9"
-
-        #     cfg = KPI_CONFIG[kpi_key]
-
-        #     # Only gray-out zeros for KPIs that explicitly want it
-        #     if x == 0 and cfg.get("zero_is_missing", True):
-        #         return "#d9d9d9"
-
-        #     # if x is None or (isinstance(x, float) and (math.isnan(x))) or x == 0:
-        #     #     return "#d9d9d9"
-
-        #     for hi, col in zip(edges[1:], cols):
-        #         if x <= hi: return col
-        #     return cols[-1]
-
-        def color_for_value(x, edges, cols):
-            cfg = KPI_CONFIG[kpi_key]
-
-            # NaN / None -> grey
-            if x is None or (isinstance(x, float) and np.isnan(x)):
-                return "#d9d9d9"
-
-            # ----- DISCRETE COUNTS FIX -----
-            if cfg.get("discrete_counts", False):
-                k = int(round(x)) if x is not None else -1
-                if cfg.get("zero_is_missing", False) and k == 0:
-                    return "#d9d9d9"
-                if k < 0:
-                    return "#d9d9d9"
-                # last color is the ">= last" bucket
-                return cols[-1] if k >= (len(cols) - 1) else cols[k]
-            # --------------------------------
-
-            # Continuous behaviour (unchanged)
-            if x == 0 and cfg.get("zero_is_missing", True):
-                return "#d9d9d9"
-
-            for hi, col in zip(edges[1:], cols):
-                if x <= hi:
-                    return col
-            return cols[-1]
-
+            frame = load_state_frames(GEOJSON_PATH).get(state)
+            if frame is not None:
+                center, zoom = frame["center"], frame["zoom"]
+            else:
+                bb = g.total_bounds
+                center = [(bb[1]+bb[3])/2, (bb[0]+bb[2])/2]
 
         # Folium map
-        m = folium.Map(location=center, zoom_start=zoom, tiles="cartodbpositron")
-        folium.GeoJson(
-            g[[pin_col, value_col, "_val_fmt", "geometry"]].to_json(),
-            name="choropleth",
-            style_function=lambda f: {
-                "fillColor": color_for_value(f["properties"].get(value_col, None), bins, colors),
-                "color": "black", "weight": 0.25, "fillOpacity": 0.88, "opacity": 0.7
-            },
-            highlight_function=lambda _: {"weight": 1.0, "color": "black"},
-            tooltip=folium.GeoJsonTooltip(
-                fields=[pin_col, "_val_fmt"],
-                aliases=["PIN", unit_name],
-                localize=True
-            ),
-        ).add_to(m)
-
-
-        if cfg.get("discrete_counts", False):
-            sample = pd.Series([0,1,2,3,4,5,6,10,np.nan], name="v")
-            edges = np.r_[ -0.5, np.array(cfg["bins"][:-1]) + 0.5, np.inf ]
-            print("edges:", edges.tolist())
-            print("map check:", {int(v if pd.notna(v) else -1): (np.digitize([v], edges, right=False)[0]-1)
-                                if pd.notna(v) else "missing" for v in sample})
-
-        
-
-        # -------- Legend: top-right, scrollable, never clipped --------
-        # Bind the selected KPI's config for this render
-        cfg = KPI_CONFIG[kpi_key]      # <-- kpi_key is your currently selected KPI
-
-
-        legend_items = []
-        # show only a 'missing' chip (no “0 / …”) when this KPI says zero is not missing
-        if cfg.get("zero_is_missing", True):
-            legend_items.append(("#d9d9d9", "0 / missing"))
-        else:
-            legend_items.append(( "#d9d9d9", "missing"))  # optional; remove if you don’t want it
-
-
-        # legend_items = [("#d9d9d9", "0 / missing")]
-
-        # Per-KPI edge formatter used ONLY for continuous/range legends
-        def _fmt_edge(v):
-            print("^^^^^^^^^^^^^^^^", kpi_key)
-            # keep the existing special-cases you had
-            if kpi_key == "NA":   # values are in rupees; show in Lakhs
-                return f"{v/100000:.0f} L"
-            if kpi_key in ("Trxn_SMAs",  "SPs", "GROSS_ADDS","AEPS_GTV_IN_LACS", "CMS_GTV_IN_LACS"):
-                print("&&&&&&&&&&&&&", kpi_key)
-                return f"{int(v)}"
-            # default (used by other continuous KPIs)
-            return f"{v/100000:.0f} L"
-
-        colors = cfg["colors"]
-        bins   = cfg["bins"]
-
-        # 1) If explicit legend labels are provided in the KPI config, use them verbatim
-        explicit_labels = cfg.get("legend_labels")
-        if explicit_labels:
-            # Make sure lengths match colors
-            for c, lbl in zip(colors, explicit_labels):
-                legend_items.append((c, lbl))
-
-        # 2) Else if this KPI is a discrete count (0,1,2,..., ≥N), build one label per bin
-        elif cfg.get("discrete_counts", False):
-            # Expect bins like [0,1,2,3,4,5,6,7,8] (last is the threshold for ≥)
-            # First N bins: exact integers; Last color: "≥ last"
-            for i in range(0, len(bins) - 1):
-                legend_items.append((colors[i], f"{int(bins[i])}"))
-            legend_items.append((colors[-1], f"≥ {int(bins[-1])}"))
-
-        # 3) Otherwise: continuous ranges (your original behavior)
+        m = folium.Map(location=center, zoom_start=zoom, tiles="cartodbpositron",
+                       prefer_canvas=renderer == "Canvas", width=f"{100 / len(months):g}%")
+        if SHOW_DEBUG:
+            FrameTimer(f"{renderer} / {encoding}").add_to(m)
+        if frame is not None:
+            m.fit_bounds(frame["bounds"])
+        asset_name = None
+        if encoding == "Static geometry asset (values only)":
+            asset_name = publish_static_geometry(GEOJSON_PATH, simplify_m)
+            if asset_name is None:
+                # a comparison inlines the topology (map_topology) instead
+                encoding = "TopoJSON (shared arcs)" if compare else "GeoJSON"
+                st.warning(f"No TopoJSON for this level yet (run `python boundary_store.py`); drawing {encoding} instead.")
+        if compare:
+            # Small multiples: one pane per month side by side. The geometry is sent (or
+            # fetched) once and decoded once; every pane draws the same LatLng objects
+            # and carries only its month's codes and texts (PINs are the topology's ids)
+            src = STATIC_GEOMETRY_URL + asset_name if asset_name is not None else TOPOLOGY_PLACEHOLDER
+            panes = [m]
+            for i in range(1, len(months)):
+                pane = folium.Map(location=center, zoom_start=zoom, tiles="cartodbpositron", prefer_canvas=renderer == "Canvas",
+                                  width=f"{100 / len(months):g}%", left=f"{100 * i / len(months):g}%", position="absolute")
+                if frame is not None:
+                    pane.fit_bounds(frame["bounds"])
+                m.get_root().add_child(pane)
+                panes.append(pane)
+            first = None
+            for pane, (label, month_value), result in zip(panes, months, results):
+                vals = g[value_col] if pane is m else kpi_values(kpi_key, month_value, state, g[pin_col], result)
+                layer = StaticGeometryLayer(src, rows=state_rows if asset_name is not None else None, shared_with=first)
+                layer.add_child(RowTable(None, {label: row_table(scale.index(vals.astype(float)), format_column(unit_fmt, vals),
+                                                                 palette, f"{unit_name} • {label}")}))
+                layer.add_to(pane)
+                PaneLabel(label).add_to(pane)
+                first = first or layer
+            SyncedViews(panes).add_to(panes[-1])
+        elif asset_name is not None:
+            # Geometry: one content-hashed file per level, fetched and cached by the
+            # browser; the map itself carries the tables (PINs are the asset's ids)
+            layer = StaticGeometryLayer(STATIC_GEOMETRY_URL + asset_name, rows=state_rows)
+            layer.add_child(RowTable(None, tables, selected=kpi_key))
+            layer.add_to(m)
+        elif encoding == "TopoJSON (shared arcs)":
+            # Shared borders encoded once; Leaflet decodes the topology in the browser
+            topo = map_topology(simplify_m, state_rows, g, pin_col)
+            layer = BareTopoJson(
+                topojson_document(topo, [{"k": k} for k in range(len(g))]),
+                "objects.pincodes",
+                name="choropleth",
+            )
+            layer.add_child(RowTable(g[pin_col], tables, selected=kpi_key))
+            layer.add_to(m)
+        elif encoding == "Vector tiles (MVT endpoint)":
+            # Geometry comes from cached tiles; only PIN -> (colour, text) is embedded
+            geo_version = (read_manifest(GEOJSON_PATH) or {}).get("source_sha256", "")[:12]
+            fills = np.asarray(palette, dtype=object)[g["_c"].to_numpy()]
+            VectorTileChoropleth(
+                VECTOR_TILE_URL + (f"?v={geo_version}" if geo_version else ""),
+                value_table(g[pin_col], fills, g["_val_fmt"]),
+                label=unit_name,
+                hide_unlisted=state != "All States",
+            ).add_to(m)
         else:
-            for i in range(1, len(bins)):
-                legend_items.append((colors[i-1], f"{_fmt_edge(bins[i-1])} – {_fmt_edge(bins[i])}"))
-            legend_items.append((colors[-1], f"> {_fmt_edge(bins[-1])}"))
-
-        # (your existing code that renders legend_items into legend_html continues)
-
-
-        # legend_items = [("#d9d9d9", "0 / missing")]
-        # def _fmt_edge(v):
-        #     if kpi_key == "AEPS_GTV_IN_LACS": return f"{v:.0f} L"
-        #     if kpi_key == "Trxn_SMAs": return f"{int(v)}"
-        #     return f"{v/100000:.0f} L"
-
-        # for i in range(1, len(bins)-1):
-        #     legend_items.append((colors[i-1], f"{_fmt_edge(bins[i-1])} – {_fmt_edge(bins[i])}"))
-        # legend_items.append((colors[-1], f"> {_fmt_edge(bins[-2])}"))
+            layer_gdf = g[["geometry"]].assign(k=np.arange(len(g)))
+            if GEOJSON_DECIMALS is not None:
+                layer_gdf["geometry"] = round_coordinates(layer_gdf.geometry.values, GEOJSON_DECIMALS)
+            layer_json = layer_gdf.to_json(drop_id=True)
+            if SHOW_DEBUG:
+                full = len(g[[pin_col, "_val_fmt", "_c", "geometry"]].to_json())
+                st.sidebar.caption(f"Choropleth GeoJSON: {full/1e6:.2f} MB with per-feature properties at full precision → "
+                                   f"{len(layer_json)/1e6:.2f} MB keyed by row at {GEOJSON_DECIMALS} decimals")
+            layer = folium.GeoJson(
+                layer_json,
+                name="choropleth",
+                highlight_function=lambda _: {"weight": 1.0, "color": "black"},
+            )
+            layer.add_child(RowTable(g[pin_col], tables, selected=kpi_key))
+            layer.add_to(m)
 
 
+        # -------- Legend: top-right, scrollable, never clipped --------
+        map_spec = {"simplify_m": simplify_m, "rows": state_rows, "codes": g["_c"].to_numpy(),
+                    "texts": g["_val_fmt"].tolist(), "palette": palette, "label": unit_name,
+                    "legend": legend_items, "title": f"{kpi_key} • {unit_name} • {month_label} • {state}",
+                    "view": {"center": center, "zoom": zoom, "bounds": frame["bounds"] if frame else None},
+                    "prefer_canvas": renderer == "Canvas"}
 
         legend_html = f"""
         <div id="map-legend"
@@ -913,9 +822,7 @@ if clicked:
                 max-height: 38vh;
                 overflow-y: auto;
              ">
-          <b>{kpi_key} • {unit_name}</b><br>
-          {''.join(f'<i style="background:{c};width:12px;height:12px;display:inline-block;margin-right:6px;opacity:0.9"></i>{t}<br>'
-                   for c,t in legend_items)}
+          {legend_body}
         </div>
         <style>
         @media (max-width: 700px) {{
@@ -924,16 +831,35 @@ if clicked:
         </style>
         """
         m.get_root().html.add_child(folium.Element(legend_html))
+        map_spec["legend_html"] = legend_html
+        if compare:
+            map_spec = None   # downloads rebuild a single map; a comparison downloads as the page itself
         # --------------------------------------------------------------
 
         # Save in session
-        title_md = f"### {kpi_key} • {month_label} • {state}"
-        html_str = m._repr_html_()
+        month_title = " vs ".join(l for l, _ in months + ([delta] if delta else []))
+        title_md = f"### {'All KPIs' if all_kpis else kpi_key + (' change' if delta else '')} • {month_title} • {state}"
+        t_page = time.perf_counter()
+        html_str = map_document(m)   # the document itself, not _repr_html_'s escaped iframe
+        if compare and asset_name is None:
+            # spliced in after rendering, like map_export: branca would compile megabytes of arcs as a template
+            html_str = inline_geometry(html_str, TOPOLOGY_PLACEHOLDER, compact_json(map_topology(simplify_m, state_rows, g, pin_col)))
+        if SHOW_DEBUG:
+            from html import escape
+            st.sidebar.caption(f"Map page: {len(html_str.encode())/1e6:.2f} MB in {(time.perf_counter()-t_page)*1000:.0f} ms "
+                               f"(as an escaped srcdoc iframe: {len(escape(html_str).encode())/1e6:.2f} MB)")
         st.session_state.last_map_title = title_md
         st.session_state.last_map_html  = html_str
-        st.session_state.last_map_meta  = {"kpi": kpi_key, "month": month_label, "state": state}
+        st.session_state.last_map_meta  = {"kpi": kpi_key + ("_change" if delta else ""), "month": month_title, "state": state}
+        st.session_state.last_map_spec  = map_spec
         st.session_state.pending_changes = False
+        # not when the requested encoding fell back to another
+        if encoding == map_inputs["encoding"]:
+            write_entry(map_key, html_str.encode("utf-8"),
+                        {"title": title_md, "meta": st.session_state.last_map_meta, "spec": map_spec},
+                        ext="html", cache_dir=MAP_CACHE_DIR)
 
+if clicked:
     # Header + map
     render_header_and_button()
     st_html(st.session_state.last_map_html, height=780)
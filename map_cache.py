@@ -0,0 +1,144 @@
+# On-disk cache of rendered maps and downloads
+#
+#   python map_cache.py [--dir map_cache] [--max-mb 512] [--clear]    # usage report / evict
+#
+# A generated map is fully determined by its inputs (KPI config, month, state,
+# encoding, renderer, geometry version and the code that draws it), so the app
+# hashes those into a key and keeps the finished page, and every exported
+# format, in a directory shared by all sessions and server processes:
+#
+#   <key>.<ext>   the artifact (map page, html.gz / zip export, PNG)
+#   <key>.json    what goes with it (title, map spec, size report) and its file name
+#
+# Writes are atomic (temp file + os.replace), a hit refreshes the entry's mtime,
+# and after each write the least recently used entries are deleted until the
+# directory is under its byte budget. Entries are also dropped when older than
+# the caller's max_age_s (e.g. a month whose data is still landing).
+import os, sys, json, time, hashlib, argparse
+from functools import lru_cache
+
+import numpy as np
+
+MAP_CACHE_DIR = os.environ.get("PINCODE_MAP_CACHE", "map_cache")
+MAP_CACHE_MAX_BYTES = int(float(os.environ.get("PINCODE_MAP_CACHE_MB", "512")) * 1e6)
+
+
+# ================= Keys =================
+def _plain(o):
+    # json.dumps default: numpy values, functions by name, anything else by str()
+    if isinstance(o, np.ndarray):
+        return {"__ndarray__": o.dtype.str, "data": o.tolist()}
+    if isinstance(o, np.generic):
+        return o.item()
+    if callable(o) and hasattr(o, "__name__"):
+        return o.__name__
+    return str(o)
+
+def _restore(d):
+    return np.asarray(d["data"], dtype=d["__ndarray__"]) if "__ndarray__" in d else d
+
+def cache_key(inputs: dict) -> str:
+    """Content key of everything that determines an artifact."""
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=_plain).encode()).hexdigest()
+
+@lru_cache(maxsize=8)
+def code_version(*paths: str) -> str:
+    """Digest of the source files that draw the map, plus the folium / branca versions."""
+    import folium, branca
+    h = hashlib.sha256(f"{folium.__version__}/{branca.__version__}".encode())
+    for p in paths:
+        with open(p, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+# ================= Entries =================
+def read_entry(key: str, cache_dir: str = MAP_CACHE_DIR, max_age_s: float = None):
+    """(bytes, meta) stored under `key`, or None when missing or older than max_age_s."""
+    meta_path = os.path.join(cache_dir, f"{key}.json")
+    try:
+        if max_age_s is not None and time.time() - os.path.getmtime(meta_path) > max_age_s:
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f, object_hook=_restore)
+        data_path = os.path.join(cache_dir, meta["file"])
+        with open(data_path, "rb") as f:
+            data = f.read()
+        # LRU: a hit counts as a use
+        now = time.time()
+        os.utime(data_path, (now, now))
+    except (OSError, ValueError, KeyError):
+        return None
+    return data, meta["meta"]
+
+def write_entry(key: str, data: bytes, meta: dict = None, ext: str = "bin",
+                cache_dir: str = MAP_CACHE_DIR, max_bytes: int = MAP_CACHE_MAX_BYTES) -> str:
+    """Store `data` (and JSON-able `meta`) under `key`, then evict down to max_bytes. Returns the data path."""
+    os.makedirs(cache_dir, exist_ok=True)
+    name = f"{key}.{ext}"
+    # data first: a reader only trusts entries whose .json exists
+    for path, payload in ((os.path.join(cache_dir, name), data),
+                          (os.path.join(cache_dir, f"{key}.json"),
+                           json.dumps({"file": name, "meta": meta or {}}, default=_plain).encode())):
+        tmp = f"{path}.tmp{os.getpid()}"
+        with open(tmp, "wb") as f:
+            f.write(payload)
+        os.replace(tmp, path)
+    evict(cache_dir, max_bytes)
+    return os.path.join(cache_dir, name)
+
+def _entries(cache_dir: str) -> dict:
+    """key -> [last use (newest mtime), bytes, paths]."""
+    entries = {}
+    try:
+        files = list(os.scandir(cache_dir))
+    except OSError:
+        return entries
+    for e in files:
+        if ".tmp" in e.name:
+            continue
+        try:
+            st = e.stat()
+        except OSError:
+            continue
+        ent = entries.setdefault(e.name.split(".", 1)[0], [0.0, 0, []])
+        ent[0] = max(ent[0], st.st_mtime)
+        ent[1] += st.st_size
+        ent[2].append(e.path)
+    return entries
+
+def evict(cache_dir: str = MAP_CACHE_DIR, max_bytes: int = MAP_CACHE_MAX_BYTES):
+    """Delete least recently used entries until the directory holds at most max_bytes. Returns (entries, bytes) removed."""
+    entries = _entries(cache_dir)
+    total = sum(e[1] for e in entries.values())
+    removed = [0, 0]
+    for _, size, paths in sorted(entries.values(), key=lambda e: e[0]):
+        if total <= max_bytes:
+            break
+        for p in sorted(paths, key=lambda p: not p.endswith(".json")):   # meta first: no half-visible entry
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+        total -= size
+        removed[0] += 1
+        removed[1] += size
+    return tuple(removed)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Report on / evict the rendered map cache.")
+    ap.add_argument("--dir", default=MAP_CACHE_DIR)
+    ap.add_argument("--max-mb", type=float, default=MAP_CACHE_MAX_BYTES / 1e6, help="evict down to this size")
+    ap.add_argument("--clear", action="store_true", help="delete every entry")
+    args = ap.parse_args(argv)
+
+    entries = _entries(args.dir)
+    print(f"{args.dir}: {len(entries)} entries, {sum(e[1] for e in entries.values()) / 1e6:.1f} MB")
+    n, size = evict(args.dir, 0 if args.clear else int(args.max_mb * 1e6))
+    if n:
+        print(f"evicted {n} entries, {size / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
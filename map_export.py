@@ -0,0 +1,201 @@
+# Self-contained map export
+#
+#   python map_export.py [All_India_pincode_Boundary-19312.geojson] [--level 2000] [--out map.html.gz]
+#
+# Builds the downloadable map from the map spec the app keeps per map rather
+# than from the on-screen HTML, whose folium.GeoJson layer carries full-precision
+# coordinates and per-feature properties inside an HTML-escaped srcdoc iframe.
+# The export holds the geometry once as quantized shared-arc TopoJSON (the
+# level's cached topology, subset to the map's rows) decoded in the browser,
+# one palette code and tooltip-text id per pincode, and the legend; the page
+# is rendered directly, stripped of indentation, and optionally gzipped or
+# zipped. Pages and exports are cached per spec digest, code version and
+# boundary level (and format), so other formats and repeated downloads of the
+# same map do not re-render, and a code or geometry change does.
+import io, os, sys, json, time, gzip, hashlib, zipfile, argparse, threading
+from collections import OrderedDict
+
+import numpy as np
+
+# format -> (MIME type, file suffix)
+EXPORT_FORMATS = {
+    "html": ("text/html", ".html"),
+    "html.gz": ("application/gzip", ".html.gz"),
+    "zip": ("application/zip", ".zip"),
+}
+CACHE_ENTRIES = 16
+# Modules whose code shapes an export: a change to any of them re-keys the caches
+EXPORT_CODE_FILES = [os.path.join(os.path.dirname(os.path.abspath(__file__)), f)
+                     for f in ("map_export.py", "map_layers.py", "geo_encode.py")]
+TOPOLOGY_PLACEHOLDER = "pincode-topology"
+
+_CACHE = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+
+
+# ================= Build =================
+def spec_digest(spec: dict) -> str:
+    """Content digest of a map spec: same map, same digest."""
+    h = hashlib.sha256()
+    scalars = {k: v for k, v in spec.items() if k not in ("codes", "texts", "rows")}
+    h.update(json.dumps(scalars, sort_keys=True, default=str).encode())
+    h.update(np.asarray(spec["codes"], dtype=np.uint8).tobytes())
+    h.update(b"-" if spec.get("rows") is None else np.asarray(spec["rows"], dtype=np.int64).tobytes())
+    h.update("\x00".join(map(str, spec["texts"])).encode())
+    return h.hexdigest()
+
+def load_export_topology(geojson_path: str, simplify_m: int, rows=None) -> dict:
+    """The level's shared-arc TopoJSON restricted to `rows`; built from the geometry if not cached."""
+    from boundary_store import load_topology, load_flat, load_boundaries
+    from geo_encode import build_topology, subset_topology
+
+    topo = load_topology(geojson_path, simplify_m)
+    if topo is not None:
+        return topo if rows is None else subset_topology(topo, rows)
+    flat = load_flat(geojson_path, simplify_m)
+    if flat is not None:
+        pins = flat.pins if rows is None else flat.pins[np.asarray(rows, dtype=np.int64)]
+        return build_topology(flat.geometries(rows), simplify_m=simplify_m, ids=pins.astype(str).tolist())
+    gdf, pin_col = load_boundaries(geojson_path, simplify_m)
+    if rows is not None:
+        gdf = gdf.iloc[rows]
+    return build_topology(gdf.geometry.values, simplify_m=simplify_m, ids=gdf[pin_col].tolist())
+
+def build_export_html(spec: dict, topology: dict) -> str:
+    """Full HTML document (not an iframe) for a map spec, geometry inlined once."""
+    import folium
+    from map_layers import StaticGeometryLayer, RowTable, row_table, inline_geometry, compact_json, map_document
+
+    view = spec["view"]
+    m = folium.Map(location=view["center"], zoom_start=view["zoom"], tiles="cartodbpositron",
+                   prefer_canvas=spec.get("prefer_canvas", False))
+    if view.get("bounds"):
+        m.fit_bounds(view["bounds"])
+    # rows=None: the topology already holds exactly the map's rows, in order. It is
+    # spliced in after rendering: branca compiles every rendered script as a
+    # template, which for megabytes of arcs costs more than building the page.
+    layer = StaticGeometryLayer(TOPOLOGY_PLACEHOLDER).add_to(m)
+    # PINs are the topology's ids
+    RowTable(None, {spec["label"]: row_table(spec["codes"], spec["texts"], spec["palette"], spec["label"])}).add_to(layer)
+    if spec.get("legend_html"):
+        m.get_root().html.add_child(folium.Element(spec["legend_html"]))
+    m.get_root().title = spec.get("title")
+    return inline_geometry(map_document(m), TOPOLOGY_PLACEHOLDER, compact_json(topology))
+
+def minify_html(html: str) -> str:
+    """Drop indentation, trailing spaces and blank lines (line breaks stay, so inline JS is unaffected)."""
+    return "\n".join(line.strip() for line in html.splitlines() if line.strip())
+
+def package(html: str, fmt: str = "html", name: str = "map.html") -> bytes:
+    data = html.encode("utf-8")
+    if fmt == "html":
+        return data
+    if fmt == "html.gz":
+        return gzip.compress(data, compresslevel=6, mtime=0)
+    if fmt == "zip":
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6) as z:
+            z.writestr(zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0)), data, zipfile.ZIP_DEFLATED)
+        return buf.getvalue()
+    raise ValueError(f"unknown export format {fmt!r}; expected one of {sorted(EXPORT_FORMATS)}")
+
+
+# ================= Cached export =================
+def _cache_get(key):
+    with _CACHE_LOCK:
+        hit = _CACHE.get(key)
+        if hit is not None:
+            _CACHE.move_to_end(key)
+        return hit
+
+def _cache_put(key, value):
+    with _CACHE_LOCK:
+        _CACHE[key] = value
+        while len(_CACHE) > CACHE_ENTRIES:
+            _CACHE.popitem(last=False)
+
+def export_map(geojson_path: str, spec: dict, fmt: str = "html", name: str = "map.html", cache_dir: str = None):
+    """(bytes, size report) of the self-contained export; repeated calls for the same map hit the cache.
+
+    With `cache_dir` exports are also kept on disk (map_cache), across sessions and restarts.
+    """
+    from boundary_store import boundary_version
+    from map_cache import cache_key, code_version
+    # the code and the boundary level that draw the page are inputs as much as the spec
+    page_key = cache_key({"export": spec_digest(spec), "code": code_version(*EXPORT_CODE_FILES),
+                          "geometry": boundary_version(geojson_path, spec["simplify_m"])})
+    key = cache_key({"page": page_key, "format": fmt, "name": name})
+    hit = _cache_get(key)
+    if hit is None and cache_dir:
+        from map_cache import read_entry
+        hit = read_entry(key, cache_dir)
+        if hit is not None:
+            _cache_put(key, hit)
+    if hit is not None:
+        return hit[0], dict(hit[1], cached=True)
+
+    t = time.perf_counter()
+    # the minified page is shared by every format of the same map
+    page = _cache_get(page_key)
+    if page is None:
+        html = build_export_html(spec, load_export_topology(geojson_path, spec["simplify_m"], spec.get("rows")))
+        page = (len(html.encode("utf-8")), minify_html(html))
+        _cache_put(page_key, page)
+    rendered, small = page
+    data = package(small, fmt, name)
+    report = {"format": fmt, "rendered": rendered, "minified": len(small.encode("utf-8")),
+              "bytes": len(data), "ms": (time.perf_counter() - t) * 1000, "cached": False}
+    _cache_put(key, (data, report))
+    if cache_dir:
+        from map_cache import write_entry
+        write_entry(key, data, report, ext=EXPORT_FORMATS[fmt][1].lstrip("."), cache_dir=cache_dir)
+    return data, report
+
+def size_report(report: dict, onscreen_bytes: int = None) -> str:
+    """One line: export size per stage, against the on-screen page when given."""
+    mb = lambda n: f"{n / 1e6:.2f} MB"
+    line = (f"{report['format']}: {mb(report['bytes'])} (rendered {mb(report['rendered'])}, "
+            f"minified {mb(report['minified'])}{', cached' if report['cached'] else ''})")
+    if onscreen_bytes:
+        line += f"; on-screen page {mb(onscreen_bytes)}, {onscreen_bytes / max(report['bytes'], 1):.1f}x larger"
+    return line
+
+
+def main(argv=None):
+    import folium
+    from boundary_store import load_boundaries, DEFAULT_LEVELS_M
+    from color_scale import ColorScale
+    from value_format import format_int
+
+    ap = argparse.ArgumentParser(description="Export a map (random values) in every format and report sizes.")
+    ap.add_argument("geojson", nargs="?", default="All_India_pincode_Boundary-19312.geojson")
+    ap.add_argument("--level", type=int, default=max(DEFAULT_LEVELS_M), help="simplification level (metres)")
+    ap.add_argument("--out", help="also write the export here (.html, .html.gz or .zip)")
+    args = ap.parse_args(argv)
+
+    gdf, pin_col = load_boundaries(args.geojson, args.level)
+    scale = ColorScale([0, 3, 8, 15, 20, 25, 35, 50, 100],
+                       ["#8B0000", "#B22222", "#FF0000", "#FF4500", "#FF7F00", "#FFA500", "#FFD700", "#90EE90", "#32CD32", "#006400"])
+    values = np.random.default_rng(0).integers(0, 120, len(gdf)).astype(float)
+    spec = {"simplify_m": args.level, "rows": None, "codes": scale.index(values), "texts": list(format_int(values)),
+            "palette": scale.palette, "label": "Value", "legend_html": "", "title": "Random values",
+            "view": {"center": [22.0, 79.0], "zoom": 5, "bounds": None}}
+
+    # what the app's GeoJSON encoding used to put on screen and in the download
+    g = gdf[[pin_col, "geometry"]].assign(_val_fmt=spec["texts"], _c=spec["codes"].astype(int))
+    m = folium.Map(location=[22.0, 79.0], zoom_start=5, tiles="cartodbpositron")
+    folium.GeoJson(g.to_json(), tooltip=folium.GeoJsonTooltip(fields=[pin_col, "_val_fmt"])).add_to(m)
+    onscreen = len(m._repr_html_().encode("utf-8"))
+
+    for fmt in EXPORT_FORMATS:
+        data, report = export_map(args.geojson, spec, fmt)
+        print(f"{size_report(report, onscreen)}  [{report['ms']:.0f} ms]")
+        if args.out and args.out.endswith(EXPORT_FORMATS[fmt][1]):
+            with open(args.out, "wb") as f:
+                f.write(data)
+    _, report = export_map(args.geojson, spec, "html.gz")
+    print(f"repeat html.gz: {report['cached'] and 'cache hit' or 'rebuilt'}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
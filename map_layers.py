@@ -0,0 +1,402 @@
+# Custom folium layers for the pincode choropleth
+#
+# These replace folium.GeoJson where the stock layer embeds more than the
+# browser needs. Each one is a MacroElement rendering a small Leaflet script;
+# KPI values travel as a compact PIN -> [fill colour, tooltip text] table, or
+# as per-row palette codes and tooltip text ids keyed by each feature's row,
+# over inline geometry or a geometry asset the browser fetches once.
+import json
+from html import escape
+
+import numpy as np
+from jinja2 import Template
+
+import folium
+from folium.elements import JSCSSMixin
+
+from color_scale import MISSING_COLOR
+
+BASE_STYLE = {"color": "black", "weight": 0.25, "fillOpacity": 0.88, "opacity": 0.7}
+HIGHLIGHT_STYLE = {"weight": 1.0, "color": "black"}
+
+
+def value_table(pins, fills, texts) -> dict:
+    """{pin: [fill colour, tooltip text]} — the only per-pincode data a layer ships."""
+    return {str(p): [c, t] for p, c, t in zip(pins, fills, texts)}
+
+
+class BareTopoJson(folium.TopoJson):
+    """folium.TopoJson without the per-feature `properties.style` dicts; style it with RowTable."""
+
+    def style_data(self) -> None:
+        pass
+
+
+class VectorTileChoropleth(JSCSSMixin, folium.MacroElement):
+    """Pincode polygons from an MVT endpoint (vector_tiles.py), coloured client-side.
+
+    Tiles hold only the integer PIN, so the same cached tiles serve every KPI,
+    month and state; this element carries just the value table.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        // VectorGrid 1.3 calls a helper Leaflet 1.8+ dropped
+        L.DomEvent.fakeStop = L.DomEvent.fakeStop || function () { return true; };
+        (function () {
+            var map = {{ this._parent.get_name() }};
+            var values = {{ this.values|tojson }};
+            var base = {{ this.base_style|tojson }};
+            var hideUnlisted = {{ this.hide_unlisted|tojson }};
+            function styleFor(pin) {
+                var v = values[pin];
+                if (!v) {
+                    return hideUnlisted ? {fill: false, stroke: false}
+                        : Object.assign({fill: true, fillColor: {{ this.missing_color|tojson }}}, base);
+                }
+                return Object.assign({fill: true, fillColor: v[0]}, base);
+            }
+            var layer = L.vectorGrid.protobuf({{ this.url|tojson }}, {
+                rendererFactory: L.canvas.tile,
+                interactive: true,
+                maxNativeZoom: {{ this.max_native_zoom }},
+                getFeatureId: function (f) { return f.properties.pin; },
+                vectorTileLayerStyles: {
+                    {{ this.layer_name|tojson }}: function (p) { return styleFor(p.pin); }
+                }
+            });
+            var tip = L.tooltip({direction: "top", sticky: true});
+            var hovered = null;
+            layer.on("mouseover mousemove", function (e) {
+                var pin = e.layer.properties.pin, v = values[pin];
+                if (!v && hideUnlisted) return;
+                if (hovered !== pin) {
+                    if (hovered !== null) layer.resetFeatureStyle(hovered);
+                    hovered = pin;
+                    layer.setFeatureStyle(pin, Object.assign(styleFor(pin), {{ this.highlight_style|tojson }}));
+                }
+                tip.setLatLng(e.latlng).setContent(
+                    "<b>PIN</b> " + pin + "<br><b>" + {{ this.label|tojson }} + "</b> " + (v ? v[1] : "—"));
+                map.openTooltip(tip);
+            });
+            layer.on("mouseout", function () {
+                if (hovered !== null) layer.resetFeatureStyle(hovered);
+                hovered = null;
+                map.closeTooltip(tip);
+            });
+            layer.addTo(map);
+        })();
+        {% endmacro %}
+    """)
+
+    default_js = [
+        ("leaflet_vectorgrid",
+         "https://unpkg.com/leaflet.vectorgrid@1.3.0/dist/Leaflet.VectorGrid.bundled.min.js"),
+    ]
+
+    def __init__(self, url: str, values: dict, label: str, hide_unlisted: bool = False,
+                 layer_name: str = "pincodes", max_native_zoom: int = 12,
+                 missing_color: str = MISSING_COLOR):
+        super().__init__()
+        self._name = "VectorTileChoropleth"
+        self.url = url
+        self.values = values
+        self.label = label
+        self.hide_unlisted = hide_unlisted
+        self.layer_name = layer_name
+        self.max_native_zoom = int(max_native_zoom)
+        self.missing_color = missing_color
+        self.base_style = BASE_STYLE
+        self.highlight_style = HIGHLIGHT_STYLE
+
+
+def compact_json(value) -> str:
+    """JSON without spaces, safe inside a <script> element."""
+    return json.dumps(value, separators=(",", ":")).replace("</", "<\\/")
+
+def row_codes(codes, palette) -> str:
+    """Palette indices as one character per row: chr(48 + index)."""
+    if len(palette) > 64:
+        raise ValueError("palette too large for one-character codes")
+    return (np.asarray(codes, dtype=np.uint8) + 48).tobytes().decode("ascii")
+
+def row_table(codes, texts, palette, label: str, legend_html: str = None) -> dict:
+    """One KPI's table for RowTable: codes (one character per row), distinct texts and a text id per row.
+
+    `legend_html` (the legend element's inner HTML) is swapped in when the table is picked.
+    """
+    ids = {}
+    text_ids = [ids.setdefault(t, len(ids)) for t in texts]
+    return {"codes": row_codes(codes, palette), "palette": list(palette), "texts": list(ids),
+            "textIds": text_ids, "label": label, "legend": legend_html}
+
+
+class RowTable(folium.MacroElement):
+    """Colour and tooltip tables for a GeoJson / TopoJson / StaticGeometryLayer; add it as the layer's child.
+
+    Features carry only `properties.k`, their row. Per table (row_table(), one
+    per KPI) a palette code and tooltip text id per row serve both the shared
+    style function and the tooltip, whose HTML is assembled only for the
+    polygon under the cursor; `pins` None takes the PIN from each feature's id.
+    With several tables a radio control restyles the layer and swaps the
+    legend in the browser, with no server round-trip.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function () {
+            var layer = {{ this._parent.get_name() }};
+            var tables = {{ this.tables_js }};
+            var pins = {{ this.pins_js }};
+            var base = {{ this.base_style|tojson }};
+            var t;
+            function style(f) {
+                return Object.assign({fillColor: t.palette[t.codes.charCodeAt(f.properties.k) - 48] || t.palette[0]}, base);
+            }
+            function use(name) {
+                t = tables[name];
+                layer.setStyle(style);
+                var legend = document.getElementById({{ this.legend_id|tojson }});
+                if (legend && t.legend !== null) legend.innerHTML = t.legend;
+            }
+            layer.options.style = style;   // resetStyle() after a highlight, and features added later, come back here
+            layer.bindTooltip(function (l) {
+                var k = l.feature.properties.k;
+                return "<b>PIN</b> " + (pins === null ? l.feature.id : pins[k]) + "<br><b>" + t.label + "</b> " +
+                    t.texts[t.textIds[k]];
+            }, {sticky: true});
+            {% if this.switcher %}
+            var box = L.control({position: "topleft"});
+            box.onAdd = function () {
+                var d = L.DomUtil.create("div", "leaflet-bar");
+                d.style.cssText = "background:#fff;padding:4px 8px;font:12px sans-serif";
+                Object.keys(tables).forEach(function (name) {
+                    var row = L.DomUtil.create("label", "", d);
+                    row.style.display = "block";
+                    var radio = L.DomUtil.create("input", "", row);
+                    radio.type = "radio";
+                    radio.name = {{ this.get_name()|tojson }};
+                    radio.checked = name === {{ this.selected|tojson }};
+                    radio.onchange = function () { use(name); };
+                    row.appendChild(document.createTextNode(" " + name));
+                });
+                L.DomEvent.disableClickPropagation(d);
+                return d;
+            };
+            box.addTo(layer._map);
+            {% endif %}
+            use({{ this.selected|tojson }});
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, pins, tables: dict, selected: str = None, legend_id: str = "map-legend",
+                 base_style: dict = None):
+        super().__init__()
+        self._name = "RowTable"
+        self.tables_js = compact_json(tables)
+        self.pins_js = compact_json(None if pins is None else [str(p) for p in pins])
+        self.selected = selected or next(iter(tables))
+        self.switcher = len(tables) > 1
+        self.legend_id = legend_id
+        self.base_style = base_style or BASE_STYLE
+
+
+class StaticGeometryLayer(JSCSSMixin, folium.MacroElement):
+    """Pincode polygons from a published TopoJSON asset (boundary_store.publish_static_geometry).
+
+    The browser fetches the content-hashed asset once and keeps it; the page
+    carries only the asset rows to draw (all when None). Features are keyed by
+    row and have their PIN as id; style them with a RowTable child.
+
+    The topology is decoded once into Leaflet LatLngs (`layer.geometry`, a
+    promise); a layer built with `shared_with=<first layer>` (another map pane
+    of the same page) draws its polygons from those same LatLng objects.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = L.geoJson(null, {style: {{ this.base_style|tojson }}}).addTo({{ this._parent.get_name() }});
+        (function () {
+            var layer = {{ this.get_name() }};
+            var highlight = {{ this.highlight_style|tojson }};
+            {% if this.shared_with %}
+            layer.geometry = {{ this.shared_with.get_name() }}.geometry;
+            {% else %}
+            var src = {{ this.src_js }};   // asset URL, or the topology itself (standalone copy)
+            var rows = {{ this.rows_js }};
+            layer.geometry = (typeof src === "string" ? fetch(src).then(function (r) { return r.json(); }) : Promise.resolve(src))
+                .then(function (topo) {
+                    var geoms = topo.objects[{{ this.object_name|tojson }}].geometries;
+                    var picked = rows === null ? geoms : rows.map(function (i) { return geoms[i]; });
+                    return topojson.feature(topo, {type: "GeometryCollection", geometries: picked}).features.map(function (f) {
+                        var g = f.geometry;
+                        return {id: f.id, latlngs: g && L.GeoJSON.coordsToLatLngs(g.coordinates, g.type === "Polygon" ? 1 : 2)};
+                    });
+                });
+            {% endif %}
+            layer.on("mouseover", function (e) { e.layer.setStyle(highlight); });
+            layer.on("mouseout", function (e) { layer.resetStyle(e.layer); });
+            layer.geometry.then(function (shapes) {
+                shapes.forEach(function (s, k) {
+                    if (!s.latlngs) return;
+                    var p = L.polygon(s.latlngs);   // keeps the LatLng objects, only the arrays are new
+                    p.feature = {type: "Feature", id: s.id, properties: {k: k}};
+                    p.defaultOptions = p.options;
+                    layer.resetStyle(p);
+                    layer.addLayer(p);
+                });
+            });
+        })();
+        {% endmacro %}
+    """)
+
+    default_js = [
+        ("topojson", "https://cdnjs.cloudflare.com/ajax/libs/topojson/1.6.9/topojson.min.js"),
+    ]
+
+    def __init__(self, src=None, rows=None, object_name: str = "pincodes", shared_with: "StaticGeometryLayer" = None):
+        super().__init__()
+        self._name = "StaticGeometryLayer"
+        self.src = src
+        self.shared_with = shared_with
+        # the bulky parts go in as compact JSON
+        self.src_js = compact_json(src)
+        self.rows_js = compact_json(None if rows is None else [int(i) for i in rows])
+        self.object_name = object_name
+        self.base_style = BASE_STYLE
+        self.highlight_style = HIGHLIGHT_STYLE
+
+
+class SyncedViews(folium.MacroElement):
+    """Keep several maps of one page (side-by-side panes) on the same centre and zoom; add it to the last one."""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function () {
+            var maps = [{% for m in this.maps %}{{ m.get_name() }}{{ ", " if not loop.last }}{% endfor %}];
+            var syncing = false;
+            maps.forEach(function (a) {
+                a.on("move", function () {
+                    if (syncing) return;
+                    syncing = true;
+                    maps.forEach(function (b) { if (b !== a) b.setView(a.getCenter(), a.getZoom(), {animate: false}); });
+                    syncing = false;
+                });
+            });
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, maps):
+        super().__init__()
+        self._name = "SyncedViews"
+        self.maps = list(maps)
+
+
+class PaneLabel(folium.MacroElement):
+    """A fixed caption on a map (e.g. the month of a comparison pane)."""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function () {
+            var box = L.control({position: {{ this.position|tojson }}});
+            box.onAdd = function () {
+                var d = L.DomUtil.create("div");
+                d.style.cssText = "background:rgba(255,255,255,.9);padding:3px 8px;border-radius:4px;font:bold 13px sans-serif";
+                d.textContent = {{ this.text|tojson }};
+                return d;
+            };
+            box.addTo({{ this._parent.get_name() }});
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, text: str, position: str = "bottomleft"):
+        super().__init__()
+        self._name = "PaneLabel"
+        self.text = text
+        self.position = position
+
+
+def map_document(m: folium.Map) -> str:
+    """The map's HTML document, rendered once, for st_html to embed as is.
+
+    Map._repr_html_ HTML-escapes the same document into the srcdoc of a
+    notebook iframe (sized by a 60% aspect ratio), which st_html then wraps in
+    its own iframe: every byte of inline data is escaped and parsed twice.
+    """
+    return m.get_root().render()
+
+def inline_geometry(page_html: str, src: str, topology_json: str) -> str:
+    """A page drawn by StaticGeometryLayer with its `src` string replaced by the topology JSON itself."""
+    # plain document, or folium's srcdoc iframe (HTML-escaped)
+    for quoted, inline in ((compact_json(src), topology_json), (escape(compact_json(src)), escape(topology_json))):
+        if quoted in page_html:
+            return page_html.replace(quoted, inline, 1)
+    return page_html
+
+
+class FrameTimer(folium.MacroElement):
+    """Frame-time readout for comparing renderers: rAF intervals while the map is panned, zoomed or hovered.
+
+    Shows the first paint (from the start of the outermost srcdoc frame, so
+    wrapped and direct embeds compare) and median / p95 / worst frame time and
+    the share of frames over 50 ms in a corner control; the raw numbers are
+    kept in `window.mapFirstPaint` and `window.mapFrameTimes`.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function () {
+            var map = {{ this._parent.get_name() }};
+            var samples = window.mapFrameTimes = [];
+            var origin = performance.timeOrigin, w = window, head = "";
+            try {
+                while (w.frameElement && w.frameElement.hasAttribute("srcdoc")) {
+                    origin = Math.min(origin, w.performance.timeOrigin);
+                    w = w.parent;
+                }
+            } catch (e) {}
+            var box = L.control({position: "bottomleft"});
+            box.onAdd = function () {
+                var d = L.DomUtil.create("div");
+                d.style.cssText = "background:rgba(255,255,255,.85);padding:2px 6px;font:11px monospace";
+                d.textContent = {{ this.label|tojson }} + ": loading";
+                return d;
+            };
+            box.addTo(map);
+            var busyUntil = 0, last = null;
+            function busy() { busyUntil = performance.now() + 500; }
+            map.on("movestart move zoomstart mousemove", busy);
+            function q(sorted, p) { return sorted[Math.min(sorted.length - 1, Math.floor(p * sorted.length))]; }
+            function tick(now) {
+                if (now < busyUntil) {
+                    if (last !== null) samples.push(now - last);
+                    last = now;
+                } else {
+                    last = null;
+                }
+                if (samples.length && samples.length % 30 === 0) {
+                    var s = samples.slice(-600).sort(function (a, b) { return a - b; });
+                    var slow = s.filter(function (x) { return x > 50; }).length;
+                    box.getContainer().textContent = {{ this.label|tojson }} + ": " + head + s.length + " frames, median " +
+                        q(s, .5).toFixed(1) + " ms, p95 " + q(s, .95).toFixed(1) + " ms, worst " +
+                        s[s.length - 1].toFixed(0) + " ms, >50 ms " + (100 * slow / s.length).toFixed(0) + "%";
+                }
+                requestAnimationFrame(tick);
+            }
+            requestAnimationFrame(function (now) {
+                window.mapFirstPaint = performance.timeOrigin + now - origin;
+                head = "first paint " + window.mapFirstPaint.toFixed(0) + " ms, ";
+                box.getContainer().textContent = {{ this.label|tojson }} + ": " + head + "pan / hover to measure";
+                tick(now);
+            });
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, label: str = ""):
+        super().__init__()
+        self._name = "FrameTimer"
+        self.label = label
@@ -0,0 +1,45 @@
+# Startup budget for the Streamlit apps
+#
+# Streamlit re-runs the whole script on every widget change, so anything the
+# script does before the sidebar appears is paid on every interaction, and a
+# heavy import at module top is paid before the first paint of every process.
+# The apps keep numpy / pandas / geopandas / folium / BigQuery behind the
+# "Generate map" path; StartupProbe measures script start -> sidebar rendered
+# and flags runs that blow the budget or pull a heavy module in early.
+import sys, time
+
+import streamlit as st
+
+_RUNS = 0   # script runs seen by this process (this module survives reruns)
+
+HEAVY_MODULES = ["numpy", "pandas", "pyarrow", "shapely", "geopandas", "folium", "google.cloud.bigquery"]
+
+
+class StartupProbe:
+    """Create as early as possible in the script, call .report() once the sidebar is drawn."""
+
+    def __init__(self):
+        global _RUNS
+        self.t0 = time.perf_counter()
+        self.cold = _RUNS == 0
+        _RUNS += 1
+        self.preloaded = {m for m in HEAVY_MODULES if m in sys.modules}
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.t0) * 1000
+
+    def early_imports(self) -> list:
+        """Heavy modules this run imported before the sidebar (should be empty)."""
+        return [m for m in HEAVY_MODULES if m in sys.modules and m not in self.preloaded]
+
+    def report(self, budget_ms: float, show: bool = False) -> dict:
+        ms, early = self.elapsed_ms(), self.early_imports()
+        result = {"ms": ms, "budget_ms": budget_ms, "cold": self.cold, "early_imports": early,
+                  "ok": ms <= budget_ms and not early}
+        if show:
+            st.sidebar.caption(f"Sidebar ready in {ms:.0f} ms ({'cold' if self.cold else 'warm'} run, budget {budget_ms:.0f} ms)")
+            if ms > budget_ms:
+                st.sidebar.warning(f"Startup over budget: {ms:.0f} ms > {budget_ms:.0f} ms")
+            if early:
+                st.sidebar.warning("Loaded before the sidebar: " + ", ".join(early))
+        return result
@@ -0,0 +1,106 @@
+# Headless static map images (PNG / SVG)
+#
+#   python static_map.py [All_India_pincode_Boundary-19312.geojson] [--level 2000] [--out india.png]
+#
+# Draws the pincode choropleth server-side with matplotlib (Agg / SVG
+# backends, no pyplot, no browser) for reports and thumbnails: same palette
+# codes and legend as the interactive map, Web-Mercator like the tiles. All
+# polygons of one colour become one compound Path whose vertex codes are
+# built with numpy from shapely's flat coordinate arrays, so an All-India map
+# is a single PathCollection of about a dozen paths instead of 19k patches.
+import io, sys, time, argparse
+
+import numpy as np
+import shapely
+
+EDGE_STYLE = {"edgecolor": "#000000", "linewidth": 0.1, "alpha": 0.88}
+
+
+def _mercator_y(lat: np.ndarray) -> np.ndarray:
+    lat = np.clip(lat, -85.0, 85.0)
+    return np.degrees(np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)))
+
+def colour_paths(geoms, codes, n_colours: int):
+    """One compound matplotlib Path per palette index (None where no feature has it)."""
+    from matplotlib.path import Path
+
+    parts, part_feature = shapely.get_parts(np.asarray(geoms), return_index=True)
+    # exterior CCW, holes CW: under the nonzero rule a hole wound like its shell would be
+    # filled, painting an enclaved pincode with the colour of the one around it
+    parts = shapely.orient_polygons(parts)
+    rings, ring_part = shapely.get_rings(parts, return_index=True)
+    xy, coord_ring = shapely.get_coordinates(rings, return_index=True)
+    ring_code = np.asarray(codes)[part_feature[ring_part]]
+
+    # group rings by colour, keeping each ring's vertices contiguous
+    order = np.argsort(ring_code[coord_ring], kind="stable")
+    xy, coord_ring = xy[order], coord_ring[order]
+    xy[:, 1] = _mercator_y(xy[:, 1])
+    start = np.r_[True, coord_ring[1:] != coord_ring[:-1]]
+    end = np.r_[start[1:], True]
+    kinds = np.full(len(xy), Path.LINETO, dtype=np.uint8)
+    kinds[start] = Path.MOVETO
+    kinds[end] = Path.CLOSEPOLY
+
+    bounds = np.searchsorted(ring_code[coord_ring], np.arange(n_colours + 1))
+    return [Path(xy[a:b], kinds[a:b]) if b > a else None for a, b in zip(bounds[:-1], bounds[1:])]
+
+def render_static_map(geoms, codes, palette, legend_items=(), title: str = "", fmt: str = "png",
+                      width_px: int = 1600, dpi: int = 100) -> bytes:
+    """PNG / SVG bytes of polygons `geoms` filled with `palette[codes]`, legend and title."""
+    from matplotlib.figure import Figure
+    from matplotlib.collections import PathCollection
+    from matplotlib.patches import Patch
+
+    paths = colour_paths(geoms, codes, len(palette))
+    used = [i for i, p in enumerate(paths) if p is not None]
+    xmin, ymin, xmax, ymax = shapely.total_bounds(np.asarray(geoms))
+    ymin, ymax = _mercator_y(np.array([ymin, ymax]))
+    pad = 0.02 * max(xmax - xmin, ymax - ymin, 1e-9)
+    aspect = (ymax - ymin + 2 * pad) / (xmax - xmin + 2 * pad)
+    width_in = width_px / dpi
+    fig = Figure(figsize=(width_in, min(max(width_in * aspect, 3.0), 3 * width_in)), dpi=dpi)
+    ax = fig.add_axes([0, 0, 1, 0.95 if title else 1])
+    ax.add_collection(PathCollection([paths[i] for i in used],
+                                     facecolors=[palette[i] for i in used], **EDGE_STYLE))
+    ax.set_xlim(xmin - pad, xmax + pad)
+    ax.set_ylim(ymin - pad, ymax + pad)
+    ax.set_aspect("equal")
+    ax.set_axis_off()
+    if title:
+        fig.suptitle(title, x=0.01, y=0.99, ha="left", va="top", fontsize=14, fontweight="bold")
+    if legend_items:
+        ax.legend(handles=[Patch(facecolor=c, edgecolor="#cccccc", label=t) for c, t in legend_items],
+                  loc="upper right", fontsize=9, framealpha=0.95)
+    buf = io.BytesIO()
+    fig.savefig(buf, format=fmt, dpi=dpi, facecolor="white")
+    return buf.getvalue()
+
+
+def main(argv=None):
+    from boundary_store import load_boundaries, DEFAULT_LEVELS_M
+    from color_scale import ColorScale
+
+    ap = argparse.ArgumentParser(description="Render the pincode boundaries to PNG / SVG (random values) and time it.")
+    ap.add_argument("geojson", nargs="?", default="All_India_pincode_Boundary-19312.geojson")
+    ap.add_argument("--level", type=int, default=max(DEFAULT_LEVELS_M), help="simplification level (metres)")
+    ap.add_argument("--out", default="static_map.png", help=".png or .svg")
+    ap.add_argument("--width", type=int, default=1600, help="image width in pixels")
+    args = ap.parse_args(argv)
+
+    gdf, _ = load_boundaries(args.geojson, args.level)
+    scale = ColorScale([0, 3, 8, 15, 20, 25, 35, 50, 100],
+                       ["#8B0000", "#B22222", "#FF0000", "#FF4500", "#FF7F00", "#FFA500", "#FFD700", "#90EE90", "#32CD32", "#006400"])
+    values = np.random.default_rng(0).integers(0, 120, len(gdf)).astype(float)
+    t = time.perf_counter()
+    data = render_static_map(gdf.geometry.values, scale.index(values), scale.palette, scale.legend_items(),
+                             title="Random values", fmt=args.out.rsplit(".", 1)[-1], width_px=args.width)
+    dt = time.perf_counter() - t
+    with open(args.out, "wb") as f:
+        f.write(data)
+    print(f"rendered {len(gdf):,} pincodes ({shapely.get_num_coordinates(gdf.geometry.values).sum():,} vertices) "
+          f"in {dt:.2f}s -> {args.out} ({len(data) / 1e6:.2f} MB)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
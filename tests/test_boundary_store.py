@@ -0,0 +1,153 @@
+# Boundary cache (boundary_store.py): what the writers record in the manifest,
+# concurrent writers from several processes, the checks before a file is used,
+# and flat files reading back the geometries that were written.
+import json, os, sys, time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import boundary_store as bs
+
+
+def _square(x, y, size=0.01):
+    return [[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]
+
+FEATURES = [
+    {"pincode": "110001", "geometry": {"type": "Polygon", "coordinates": [_square(77.20, 28.60)]}},
+    # polygon with a hole
+    {"pincode": "110002", "geometry": {"type": "Polygon", "coordinates": [
+        _square(77.22, 28.60, 0.03), _square(77.23, 28.61)[::-1]]}},
+    # two parts
+    {"pincode": "400001", "geometry": {"type": "MultiPolygon", "coordinates": [
+        [_square(72.83, 18.93)], [_square(72.86, 18.93)]]}},
+    {"pincode": "560001", "geometry": {"type": "Polygon", "coordinates": [_square(77.59, 12.97)]}},
+]
+
+@pytest.fixture
+def geojson(tmp_path):
+    path = tmp_path / "pins.geojson"
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": {"pincode": f["pincode"]}, "geometry": f["geometry"]} for f in FEATURES]}))
+    return str(path)
+
+def _leftovers(geojson_path):
+    return [f for f in os.listdir(bs.cache_dir_for(geojson_path)) if f.endswith((".tmp", ".lock"))]
+
+
+def test_pyramid_records_every_file(geojson):
+    manifest = bs.build_pyramid(geojson, levels=[0, 100], workers=1)
+    for key in ("0", "100"):
+        level = manifest["levels"][key]
+        assert {"sha256", "size", "mtime_ns", "features", "topojson", "flat"} <= set(level)
+    assert manifest["frames"]["rows"] == len(FEATURES) and manifest["ingest"]["features_out"] == len(FEATURES)
+    assert bs.read_manifest(geojson) == manifest
+    assert not _leftovers(geojson)
+
+def test_rewriting_a_level_keeps_its_topology_and_flat_entries(geojson):
+    bs.build_pyramid(geojson, levels=[100], workers=1)
+    gdf, pin_col = bs.load_raw_boundaries(geojson, 100)
+    level = bs.write_artifact(geojson, gdf, pin_col, 100)["levels"]["100"]
+    assert "topojson" in level and "flat" in level
+    assert bs.load_topology(geojson, 100) is not None and bs.load_flat(geojson, 100) is not None
+
+def test_runtime_fallback_keeps_a_level_built_meanwhile(geojson):
+    bs.build_pyramid(geojson, levels=[100], workers=1)
+    before = bs.read_manifest(geojson)["levels"]["100"]
+    gdf, pin_col = bs.load_raw_boundaries(geojson, 100)
+    after = bs.write_artifact(geojson, gdf, pin_col, 100, keep_existing=True)["levels"]["100"]
+    assert after == before
+    assert not _leftovers(geojson)
+
+def _write_level(args):
+    geojson_path, simplify_m = args
+    gdf, pin_col = bs.load_raw_boundaries(geojson_path, simplify_m)
+    for _ in range(5):
+        bs.write_artifact(geojson_path, gdf, pin_col, simplify_m)
+        bs.write_flat(geojson_path, gdf, pin_col, simplify_m)
+    return simplify_m
+
+def test_concurrent_writers_lose_no_level(geojson):
+    levels = [0, 50, 100, 200, 500, 1000]
+    with ProcessPoolExecutor(max_workers=len(levels)) as ex:
+        assert sorted(ex.map(_write_level, [(geojson, l) for l in levels])) == levels
+    manifest = bs.read_manifest(geojson)
+    assert sorted(manifest["levels"], key=int) == [str(l) for l in levels]
+    assert all("flat" in manifest["levels"][str(l)] for l in levels)
+    assert all(bs.load_flat(geojson, l) is not None and bs.load_artifact(geojson, l) is not None for l in levels)
+    assert not _leftovers(geojson)
+
+@pytest.mark.parametrize("kind", ["artifact", "flat", "topology", "frames"])
+def test_a_file_changed_after_it_was_recorded_is_not_used(geojson, kind):
+    bs.build_pyramid(geojson, levels=[100], workers=1)
+    path = {"artifact": bs.artifact_path_for(geojson, 100), "flat": bs.flat_path_for(geojson, 100),
+            "topology": bs.topology_path_for(geojson, 100), "frames": bs.frames_path_for(geojson)}[kind]
+    load = {"artifact": lambda: bs.load_artifact(geojson, 100), "flat": lambda: bs.load_flat(geojson, 100),
+            "topology": lambda: bs.load_topology(geojson, 100), "frames": lambda: bs.load_frame_index(geojson)}[kind]
+    assert load() is not None
+    data = bytearray(open(path, "rb").read())
+    data[len(data) // 2] ^= 0xFF
+    open(path, "wb").write(bytes(data))
+    assert load() is None
+
+def test_a_file_copied_unchanged_is_still_used(geojson):
+    bs.build_pyramid(geojson, levels=[100], workers=1)
+    path = bs.flat_path_for(geojson, 100)
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 10**9))   # new mtime, same bytes (e.g. a copied deploy)
+    assert bs.load_flat(geojson, 100) is not None
+
+def test_a_stale_lock_is_taken_over_and_a_held_one_times_out(geojson):
+    os.makedirs(bs.cache_dir_for(geojson), exist_ok=True)
+    lock = bs.manifest_path_for(geojson) + ".lock"
+    open(lock, "w").close()
+    with pytest.raises(TimeoutError):
+        with bs.manifest_lock(geojson, timeout_s=0.2):
+            pass
+    os.utime(lock, (time.time() - 60, time.time() - 60))
+    with bs.manifest_lock(geojson, timeout_s=0.2):
+        assert os.path.exists(lock)
+    assert not os.path.exists(lock)
+
+
+# ================= Flat files =================
+def _flat_level(geojson, simplify_m=0, keep=None):
+    gdf, pin_col = bs.load_raw_boundaries(geojson, simplify_m)
+    if keep is not None:
+        gdf = gdf[gdf[pin_col].isin(keep)]
+    bs.write_artifact(geojson, gdf, pin_col, simplify_m)
+    bs.write_flat(geojson, gdf, pin_col, simplify_m)
+    return gdf, pin_col, bs.load_flat(geojson, simplify_m)
+
+def _assert_same_geometries(got, want):
+    assert len(got) == len(want)
+    for g, w in zip(got, want):
+        assert g.geom_type == w.geom_type and g.equals(w)
+
+@pytest.mark.parametrize("rows", [None, [0], [1], [2], [3, 0], [2, 1, 3], [2, 2], []],
+                         ids=["all", "square", "hole", "multi", "reordered", "mixed", "repeated", "none"])
+def test_flat_round_trip_gives_the_written_geometries(geojson, rows):
+    gdf, pin_col, flat = _flat_level(geojson)
+    assert len(flat) == len(gdf)
+    want = gdf if rows is None else gdf.iloc[rows]
+    _assert_same_geometries(flat.geometries(rows), want.geometry.values)
+    got, got_pin_col = flat.frame(rows)
+    assert got_pin_col == pin_col
+    assert list(got[pin_col]) == list(want[pin_col])
+    assert list(got.index) == [int(p) for p in want[pin_col]]
+    _assert_same_geometries(got.geometry.values, want.geometry.values)
+
+def test_flat_round_trip_without_multipolygons(geojson):
+    # only Polygons: shapely's ragged layout has no part level, write_flat adds one per feature
+    gdf, pin_col, flat = _flat_level(geojson, keep=["110001", "110002", "560001"])
+    assert (gdf.geometry.geom_type == "Polygon").all()
+    _assert_same_geometries(flat.geometries(), gdf.geometry.values)
+    _assert_same_geometries(flat.geometries([2, 1]), gdf.geometry.values[[2, 1]])
+    assert list(flat.pin_strings()) == list(gdf[pin_col])
+
+def test_take_ragged_lays_sub_ranges_end_to_end():
+    offsets = np.array([0, 2, 2, 5, 6])           # ranges [0, 2), [2, 2), [2, 5), [5, 6)
+    new, children = bs._take_ragged(offsets, np.array([2, 1, 0, 2]))
+    assert list(new) == [0, 3, 3, 5, 8]
+    assert list(children) == [2, 3, 4, 0, 1, 2, 3, 4]
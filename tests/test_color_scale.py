@@ -0,0 +1,111 @@
+# Colour engine (color_scale.py) against the per-feature rule it replaced and
+# against what each legend promises, for the KPI_CONFIG the apps actually use:
+# kpi_config.py (map_app_v2) and the copy inside map_app_v1.py.
+import os, ast, sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from color_scale import (ColorScale, MISSING_COLOR, DIVERGING_COLORS, compile_scale,
+                         diverging_scale, diverging_labels)
+from kpi_config import KPI_CONFIG
+
+BUCKET_FIELDS = ("bins", "colors", "discrete_counts", "zero_is_missing", "legend_labels")
+
+
+def _app_kpi_config(filename: str) -> dict:
+    """Bucketing fields of the KPI_CONFIG literal in an app script (read, not imported: it is a Streamlit page)."""
+    with open(os.path.join(ROOT, filename), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and getattr(node.targets[0], "id", None) == "KPI_CONFIG":
+            return {ast.literal_eval(k): {ast.literal_eval(fk): ast.literal_eval(fv) for fk, fv in zip(v.keys, v.values)
+                                          if isinstance(fk, ast.Constant) and fk.value in BUCKET_FIELDS}
+                    for k, v in zip(node.value.keys, node.value.values)}
+    raise LookupError(f"no KPI_CONFIG in {filename}")
+
+CONFIGS = [(f"v2:{k}", cfg) for k, cfg in KPI_CONFIG.items()] + \
+          [(f"v1:{k}", cfg) for k, cfg in _app_kpi_config("map_app_v1.py").items()]
+
+
+def _ref_color_for_value(x, cfg):
+    """The per-feature rule the apps used before (color_for_value)."""
+    edges, cols = cfg["bins"], cfg["colors"]
+    if x is None or (isinstance(x, float) and np.isnan(x)):
+        return MISSING_COLOR
+    if cfg.get("discrete_counts", False):
+        k = int(round(x))
+        if cfg.get("zero_is_missing", False) and k == 0:
+            return MISSING_COLOR
+        if k < 0:
+            return MISSING_COLOR
+        return cols[-1] if k >= (len(cols) - 1) else cols[k]
+    if x == 0 and cfg.get("zero_is_missing", True):
+        return MISSING_COLOR
+    for hi, col in zip(edges[1:], cols):
+        if x <= hi:
+            return col
+    return cols[-1]
+
+def _legend_probes(scale: ColorScale, labels):
+    """(value, expected colour, legend label) pairs the legend promises."""
+    bins, colors = scale.bins, scale.colors
+    probes = [(float("nan"), MISSING_COLOR, "missing")]
+    if scale.zero_is_missing:
+        probes.append((0.0, MISSING_COLOR, "0 / missing"))
+    if labels:
+        for c, lbl in zip(colors, labels):
+            t = lbl.replace("≥", ">=").replace(" ", "")
+            if t.startswith(">="):
+                probes += [(float(t[2:]), c, lbl), (float(t[2:]) + 10, c, lbl)]
+            elif t.startswith(">"):
+                probes += [(float(t[1:]) + 1, c, lbl), (float(t[1:]) + 10, c, lbl)]
+            else:
+                probes.append((float(t), c, lbl))
+    elif scale.discrete:
+        probes += [(bins[i], colors[i], f"{int(bins[i])}") for i in range(len(bins) - 1)]
+        probes += [(bins[-1], colors[-1], "≥ last"), (bins[-1] + 10, colors[-1], "≥ last")]
+    else:
+        for i in range(1, len(bins)):
+            lo, hi = bins[i - 1], bins[i]
+            probes += [((lo + hi) / 2, colors[i - 1], f"{lo:g} – {hi:g}"), (hi, colors[i - 1], f"{lo:g} – {hi:g}")]
+        probes.append((bins[-1] + 1, colors[-1], f"> {bins[-1]:g}"))
+    return probes
+
+
+@pytest.mark.parametrize("name,cfg", CONFIGS, ids=[n for n, _ in CONFIGS])
+def test_matches_per_feature_rule(name, cfg):
+    scale = compile_scale(cfg)
+    rng = np.random.default_rng(0)
+    top = max(cfg["bins"]) * 1.5 + 5
+    x = np.r_[rng.uniform(-2, top, 20_000), np.round(rng.uniform(-2, top, 5_000)),
+              np.asarray(cfg["bins"], dtype=float), np.asarray(cfg["bins"], dtype=float) + 0.5,
+              [np.nan, 0.0, -0.0, -0.4, -0.5, -0.6, 1e12]]
+    expected = np.array([_ref_color_for_value(v, cfg) for v in x.tolist()], dtype=object)
+    bad = x[scale.fills(x) != expected]
+    assert not len(bad), f"{name}: {len(bad)} values coloured differently, e.g. {bad[:5].tolist()}"
+
+@pytest.mark.parametrize("name,cfg", CONFIGS, ids=[n for n, _ in CONFIGS])
+def test_legend_matches_fill(name, cfg):
+    scale = compile_scale(cfg)
+    labels = cfg.get("legend_labels")
+    probes = _legend_probes(scale, labels)
+    got = scale.fills([v for v, _, _ in probes])
+    off = sorted({lbl for (v, c, lbl), g in zip(probes, got) if g != c})
+    if labels:
+        assert len(labels) == len(scale.colors), f"{name}: {len(labels)} legend_labels for {len(scale.colors)} colours"
+    assert not off, f"{name}: legend disagrees with the fill at {', '.join(off)}"
+
+def test_diverging_scale():
+    steps = [2, 10, 25, 50]
+    scale = diverging_scale(steps)
+    probes = [(-80, 0), (-50, 0), (-30, 1), (-25, 1), (-10, 2), (-5, 3), (-2, 3), (-1, 4), (0, 4), (2, 4),
+              (5, 5), (10, 5), (20, 6), (25, 6), (40, 7), (50, 7), (51, 8)]
+    assert [scale.fills([v])[0] for v, _ in probes] == [DIVERGING_COLORS[i] for _, i in probes]
+    assert scale.index([np.nan])[0] == 0
+    assert len(diverging_labels(steps)) == len(DIVERGING_COLORS)
+    with pytest.raises(ValueError):
+        diverging_scale([0, 1, 2, 3])
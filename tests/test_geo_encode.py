@@ -0,0 +1,149 @@
+# Geometry encodings (geo_encode.py): shared-arc TopoJSON decodes back to the
+# input, neighbours share one arc and stay gap-free when simplified, subsets
+# keep only their arcs, and rounding drops what collapses.
+import os, sys
+
+import numpy as np
+import pytest
+import shapely
+from shapely.geometry import MultiPolygon, Point, Polygon
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geo_encode import build_topology, round_coordinates, subset_topology, topojson_document, topology_ids
+
+
+def _box(x0, y0, x1, y1):
+    return [(x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0)]
+
+def _wavy_pair(n=200):
+    """Two polygons split by one finely wiggled border."""
+    ys = np.linspace(0, 1, n)
+    border = [(0.5 + 0.01 * np.sin(40 * y), y) for y in ys]
+    left = Polygon([(0, 0)] + border + [(0, 1)])
+    right = Polygon(border + [(1, 1), (1, 0)])
+    return [left, right]
+
+# neighbours, a polygon with a hole, a two-part multipolygon and an island
+GEOMS = [
+    Polygon(_box(77.0, 28.0, 77.1, 28.1)),
+    Polygon(_box(77.1, 28.0, 77.2, 28.1)),
+    Polygon(_box(77.2, 28.0, 77.5, 28.3), [_box(77.3, 28.1, 77.4, 28.2)[::-1]]),
+    MultiPolygon([Polygon(_box(77.6, 28.0, 77.7, 28.1)), Polygon(_box(77.8, 28.0, 77.9, 28.1))]),
+    Polygon(_box(78.0, 28.5, 78.05, 28.55)),
+]
+IDS = ["110001", "110002", "110003", "110004", "110005"]
+
+
+def decode(topology: dict, object_name: str = "pincodes") -> list:
+    """Shapely geometries of a TopoJSON object (what topojson-client does in the browser)."""
+    (sx, sy), (tx, ty) = topology["transform"]["scale"], topology["transform"]["translate"]
+    arcs = [np.cumsum(np.asarray(a, dtype=float), axis=0) * [sx, sy] + [tx, ty] for a in topology["arcs"]]
+    def ring(refs):
+        pts = [arcs[r] if r >= 0 else arcs[~r][::-1] for r in refs]
+        return np.vstack([pts[0]] + [p[1:] for p in pts[1:]])
+    def polygon(rings):
+        return Polygon(ring(rings[0]), [ring(r) for r in rings[1:]])
+    out = []
+    for g in topology["objects"][object_name]["geometries"]:
+        if g["type"] == "Polygon":
+            out.append(polygon(g["arcs"]))
+        elif g["type"] == "MultiPolygon":
+            out.append(MultiPolygon([polygon(p) for p in g["arcs"]]))
+        else:
+            out.append(None)
+    return out
+
+def _refs(topology: dict) -> list:
+    def rings(g):
+        return g["arcs"] if g["type"] == "Polygon" else [r for p in g["arcs"] for r in p] if g["type"] else []
+    return [r for g in topology["objects"]["pincodes"]["geometries"] for ring in rings(g) for r in ring]
+
+
+# ================= build_topology =================
+def test_topology_decodes_to_the_input():
+    topo = build_topology(GEOMS, ids=IDS)
+    step = max(topo["transform"]["scale"])
+    assert topology_ids(topo) == IDS
+    for got, want in zip(decode(topo), GEOMS):
+        assert shapely.get_type_id(got) == shapely.get_type_id(want)
+        assert got.is_valid
+        assert shapely.hausdorff_distance(got, want) <= step
+        assert abs(got.area - want.area) <= 1e-3 * want.area
+
+def test_neighbours_share_one_arc():
+    topo = build_topology(GEOMS[:2])
+    a, b = [{r if r >= 0 else ~r for ring in g["arcs"] for r in ring} for g in topo["objects"]["pincodes"]["geometries"]]
+    shared = a & b
+    assert len(shared) == 1
+    # one polygon walks the shared arc forwards, the other backwards
+    refs = _refs(topo)
+    arc = shared.pop()
+    assert arc in refs and ~arc in refs
+    # every arc is stored once: the shared edge is not repeated
+    assert len(topo["arcs"]) == len({r if r >= 0 else ~r for r in refs})
+
+def test_simplified_neighbours_stay_gap_free():
+    pair = _wavy_pair()
+    topo = build_topology(pair, simplify_m=500)
+    left, right = decode(topo)
+    points = lambda t: sum(len(a) for a in t["arcs"])
+    assert points(topo) < points(build_topology(pair)) / 2          # the border was simplified ...
+    assert left.intersection(right).area == pytest.approx(0, abs=1e-9)   # ... without overlaps
+    union = left.union(right)
+    assert union.geom_type == "Polygon" and not list(union.interiors)   # ... or gaps
+    assert union.area == pytest.approx(1.0, rel=1e-3)
+
+def test_degenerate_geometry_becomes_null():
+    tiny = Polygon(_box(77.0, 28.0, 77.0 + 1e-9, 28.0 + 1e-9))
+    topo = build_topology([GEOMS[0], tiny, Point(77, 28)], ids=["a", "b", "c"])
+    types = [g["type"] for g in topo["objects"]["pincodes"]["geometries"]]
+    assert types == ["Polygon", None, None]
+    assert topology_ids(topo) == ["a", "b", "c"]
+
+
+# ================= subset_topology / topojson_document =================
+@pytest.mark.parametrize("positions", [[0], [1, 2], [4, 3, 0], []])
+def test_subset_keeps_geometries_and_only_their_arcs(positions):
+    topo = build_topology(GEOMS, ids=IDS)
+    sub = subset_topology(topo, positions)
+    assert topology_ids(sub) == [IDS[i] for i in positions]
+    full = decode(topo)
+    for got, i in zip(decode(sub), positions):
+        assert got.equals(full[i])
+    refs = _refs(sub)
+    used = {r if r >= 0 else ~r for r in refs}
+    assert used == set(range(len(sub["arcs"])))       # renumbered, nothing unreferenced
+
+def test_document_attaches_properties_without_touching_the_topology():
+    topo = build_topology(GEOMS, ids=IDS)
+    before = repr(topo)
+    doc = topojson_document(topo, [{"k": i} for i in range(len(GEOMS))])
+    geoms = doc["objects"]["pincodes"]["geometries"]
+    assert [g["properties"] for g in geoms] == [{"k": i} for i in range(len(GEOMS))]
+    assert all("id" not in g for g in geoms)
+    assert repr(topo) == before
+
+
+# ================= round_coordinates =================
+def test_rounding_keeps_shapes_at_the_precision():
+    out = round_coordinates(GEOMS, 3)
+    for got, want in zip(out, GEOMS):
+        coords = shapely.get_coordinates(got)
+        assert np.array_equal(coords, np.round(coords, 3))
+        assert shapely.hausdorff_distance(got, want) <= 0.5e-3 * np.sqrt(2)
+        assert shapely.get_type_id(got) == shapely.get_type_id(want)
+
+def test_rounding_drops_what_collapses():
+    hole_collapses = Polygon(_box(0, 0, 1, 1), [_box(0.5, 0.5, 0.5001, 0.5001)[::-1]])
+    part_collapses = MultiPolygon([Polygon(_box(0, 0, 1, 1)), Polygon(_box(3, 3, 3.0001, 3.0001))])
+    all_collapses = Polygon(_box(5, 5, 5.0001, 5.0001))
+    out = round_coordinates([hole_collapses, part_collapses, all_collapses, Point(1, 1)], 2)
+    assert out[0].geom_type == "Polygon" and not list(out[0].interiors)
+    assert out[1].geom_type == "Polygon" and out[1].equals(Polygon(_box(0, 0, 1, 1)))
+    assert out[2] is None and out[3] is None
+
+def test_rounding_removes_consecutive_duplicates():
+    dense = Polygon([(0, 0), (0.5, 0.0001), (1, 0), (1, 1), (0.0001, 1), (0, 1), (0, 0)])
+    coords = shapely.get_coordinates(round_coordinates([dense], 2)[0])
+    assert not (coords[1:] == coords[:-1]).all(axis=1).any()
@@ -0,0 +1,98 @@
+# Rendered map cache (map_cache.py): entries round-trip, the directory is
+# evicted down to its byte budget least recently used first, and old entries expire.
+import os, sys, time
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from map_cache import _entries, cache_key, evict, read_entry, write_entry
+
+KB = 1000
+
+
+def _put(cache_dir, key, size, used_s_ago, max_bytes=10**9):
+    """An entry of `size` data bytes, last used `used_s_ago` seconds ago."""
+    path = write_entry(key, b"x" * size, {"k": key}, ext="html", cache_dir=cache_dir, max_bytes=max_bytes)
+    t = time.time() - used_s_ago
+    for p in (path, os.path.join(cache_dir, f"{key}.json")):
+        os.utime(p, (t, t))
+
+def _keys(cache_dir):
+    return sorted(_entries(cache_dir))
+
+def _bytes(cache_dir):
+    return sum(e[1] for e in _entries(cache_dir).values())
+
+
+def test_entry_round_trip(tmp_path):
+    meta = {"title": "Gross adds", "bins": np.array([0.0, 2.5, 8.0]), "n": np.int64(3)}
+    path = write_entry("k1", b"<html/>", meta, ext="html", cache_dir=str(tmp_path))
+    assert path == str(tmp_path / "k1.html")
+    data, got = read_entry("k1", cache_dir=str(tmp_path))
+    assert data == b"<html/>"
+    assert got["title"] == "Gross adds" and got["n"] == 3
+    assert got["bins"].dtype == np.float64 and list(got["bins"]) == [0.0, 2.5, 8.0]
+    assert read_entry("missing", cache_dir=str(tmp_path)) is None
+    assert not [f for f in os.listdir(tmp_path) if ".tmp" in f]
+
+def test_key_ignores_dict_order():
+    assert cache_key({"a": 1, "b": [1, 2]}) == cache_key({"b": [1, 2], "a": 1})
+    assert cache_key({"a": 1}) != cache_key({"a": 2})
+
+def test_eviction_keeps_the_directory_under_budget(tmp_path):
+    d = str(tmp_path)
+    for i, key in enumerate("abcde"):
+        _put(d, key, 10 * KB, used_s_ago=100 - i)
+    total = _bytes(d)
+    per_entry = total / 5
+    n, size = evict(d, max_bytes=int(2.5 * per_entry))
+    assert n == 3 and size == total - _bytes(d)
+    assert _bytes(d) <= 2.5 * per_entry
+    assert _keys(d) == ["d", "e"]                 # the two most recently used survive
+
+def test_eviction_order_follows_the_last_use(tmp_path):
+    d = str(tmp_path)
+    for key, ago in (("a", 40), ("b", 30), ("c", 20)):
+        _put(d, key, 10 * KB, used_s_ago=ago)
+    assert read_entry("a", cache_dir=d) is not None   # a hit makes "a" the newest
+    per_entry = _bytes(d) / 3
+    evict(d, max_bytes=int(2 * per_entry))
+    assert _keys(d) == ["a", "c"]
+    evict(d, max_bytes=int(per_entry))
+    assert _keys(d) == ["a"]
+
+def test_a_write_evicts_older_entries_not_itself(tmp_path):
+    d = str(tmp_path)
+    _put(d, "old", 30 * KB, used_s_ago=60)
+    _put(d, "mid", 30 * KB, used_s_ago=30)
+    write_entry("new", b"x" * 30 * KB, ext="html", cache_dir=d, max_bytes=70 * KB)
+    assert _keys(d) == ["mid", "new"]
+    assert read_entry("new", cache_dir=d)[0] == b"x" * 30 * KB
+    assert read_entry("old", cache_dir=d) is None
+    # an entry bigger than the whole budget does not survive its own write
+    write_entry("huge", b"x" * 100 * KB, ext="html", cache_dir=d, max_bytes=70 * KB)
+    assert _keys(d) == []
+
+def test_eviction_removes_the_whole_entry_and_skips_temp_files(tmp_path):
+    d = str(tmp_path)
+    _put(d, "a", 10 * KB, used_s_ago=20)
+    _put(d, "b", 10 * KB, used_s_ago=10)
+    (tmp_path / "c.html.tmp123").write_bytes(b"x" * 50 * KB)      # another process mid-write
+    evict(d, max_bytes=int(_bytes(d) / 2))
+    assert sorted(os.listdir(d)) == ["b.html", "b.json", "c.html.tmp123"]
+
+def test_entries_expire_after_max_age(tmp_path):
+    d = str(tmp_path)
+    _put(d, "a", KB, used_s_ago=120)
+    assert read_entry("a", cache_dir=d, max_age_s=60) is None
+    assert read_entry("a", cache_dir=d, max_age_s=300) is not None
+    assert read_entry("a", cache_dir=d) is not None
+
+@pytest.mark.parametrize("missing", ["json", "html"])
+def test_a_half_written_entry_is_a_miss(tmp_path, missing):
+    d = str(tmp_path)
+    _put(d, "a", KB, used_s_ago=0)
+    os.remove(tmp_path / f"a.{missing}")
+    assert read_entry("a", cache_dir=d) is None
@@ -0,0 +1,62 @@
+# Vectorized formatters (value_format.py): every KPI_CONFIG formatter declares
+# its twin, the twin renders identically, and undeclared formatters run per value.
+import ast, gc, math, os, sys, weakref
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from value_format import VECTORIZED, format_column, kpi_values, sample_values
+from kpi_config import KPI_CONFIG
+
+
+def _app_formatters(filename: str) -> list:
+    """The fmt_* functions of an app script with their `vectorized` declarations (read, not imported: Streamlit page)."""
+    import pandas as pd
+    with open(os.path.join(ROOT, filename), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    def is_fmt(node):
+        if isinstance(node, ast.FunctionDef):
+            return node.name.startswith("fmt_")
+        return (isinstance(node, ast.Assign) and isinstance(node.targets[0], ast.Attribute)
+                and getattr(node.targets[0].value, "id", "").startswith("fmt_"))
+    ns = {"pd": pd, "math": math}
+    exec(compile(ast.Module([n for n in tree.body if is_fmt(n)], []), filename, "exec"), ns)
+    return [(f"{filename}:{k}", v) for k, v in ns.items() if k.startswith("fmt_")]
+
+FORMATTERS = [(f"kpi_config.py:{f.__name__}", f) for f in {cfg["unit_fmt"] for cfg in KPI_CONFIG.values()}] + \
+             _app_formatters("map_app.py") + _app_formatters("map_app_v1.py")
+FORMATTERS.sort(key=lambda item: item[0])
+
+
+@pytest.mark.parametrize("name,fmt", FORMATTERS, ids=[n for n, _ in FORMATTERS])
+def test_kpi_formatter_declares_identical_twin(name, fmt):
+    assert fmt.vectorized in VECTORIZED
+    for values in (kpi_values(fmt.__name__, 20_000), sample_values(20_000)):
+        expected = np.array([fmt(v) for v in values.tolist()], dtype=object)
+        assert (format_column(fmt, values) == expected).all()
+
+def test_undeclared_formatter_runs_per_value():
+    def fmt_int(x):   # same name as the KPI formatter, no twin declared
+        return "n/a" if x != x else f"{int(x)}"
+    assert list(format_column(fmt_int, [1234.0, np.nan])) == ["1234", "n/a"]
+
+def test_unknown_twin_is_an_error():
+    def fmt_odd(x):
+        return str(x)
+    fmt_odd.vectorized = "format_odd"
+    with pytest.raises(KeyError):
+        format_column(fmt_odd, [1.0])
+
+def test_formatters_are_not_retained():
+    # the apps define their formatters anew on every rerun: nothing may hold on to them
+    def fmt_int(x):
+        return f"{int(x):,}"
+    fmt_int.vectorized = "format_int"
+    ref = weakref.ref(fmt_int)
+    format_column(fmt_int, [1.0, 2.0])
+    del fmt_int
+    gc.collect()
+    assert ref() is None
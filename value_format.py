@@ -0,0 +1,205 @@
+# Vectorized tooltip value formatting
+#
+#   python value_format.py [--rows 19000 200000]     # equality check + micro-benchmark
+#
+# Array-in, string-array-out twins of the apps' KPI formatters (fmt_int,
+# fmt_lakh_value, fmt_lakh_from_rupees, fmt_int_or_dash) with identical output.
+# Columns are factorized first (KPI values repeat a lot: counts, rounded
+# amounts), then each distinct value is rendered once: digits, thousands
+# separators, sign and suffix are laid out in a code-point matrix with integer
+# arithmetic and viewed as fixed-width strings, so no Python runs per value.
+# The few values that cannot be rendered exactly that way (non-finite, beyond
+# 2**52, or within float error of a rounding tie) go through the scalar rule.
+import sys, time, argparse
+
+import numpy as np
+import pandas as pd
+
+EXACT_LIMIT = 2.0 ** 52      # float64 integers are exact below this
+
+
+# ================= Rendering =================
+POW10 = 10 ** np.arange(19, dtype=np.int64)
+
+def _digits(values: np.ndarray, count: int) -> np.ndarray:
+    """(n, count) uint8 decimal digits of non-negative int64 `values`, least significant first."""
+    out = np.empty((len(values), max(count, 1)), dtype=np.uint8)
+    rest = values.copy()
+    for k in range(out.shape[1]):
+        out[:, k] = rest % 10
+        rest //= 10
+    return out
+
+def _render(units: np.ndarray, neg: np.ndarray, frac: np.ndarray = None, ndec: int = 0,
+            suffix: str = "", thousands: bool = True) -> np.ndarray:
+    """Strings for magnitudes `units` (int64 >= 0): [-]digits[,ddd][.frac][suffix]."""
+    n = len(units)
+    if n == 0:
+        return np.empty(0, dtype=object)
+    ndig = np.searchsorted(POW10, units, side="right").clip(1)
+    head = (neg + ndig + ((ndig - 1) // 3 if thousands else 0)).astype(np.int16)
+    tail = np.array([ord(c) for c in ("." + "0" * ndec if ndec else "") + suffix], dtype=np.uint32)
+    width = int(head.max()) + len(tail)
+
+    # p: character position counted leftwards from the last integer digit (0);
+    # q = -1 - p: position counted rightwards after the integer part
+    p = head[:, None] - 1 - np.arange(width, dtype=np.int16)[None, :]
+    digits = _digits(units, int(ndig.max()))
+    k = (p - p // 4 if thousands else p).clip(0, digits.shape[1] - 1)
+    out = np.take_along_axis(digits, k, axis=1).astype(np.uint32) + ord("0")
+    if thousands:
+        out = np.where(p % 4 == 3, ord(","), out)
+    out = np.where(neg[:, None] & (p == head[:, None] - 1), ord("-"), out)
+    q = -1 - p
+    if len(tail):
+        after = tail[q.clip(0, len(tail) - 1)]
+        if ndec:
+            fd = _digits(frac, ndec)[:, ::-1]
+            fd = np.take_along_axis(fd, (q - 1).clip(0, ndec - 1), axis=1) + np.uint32(ord("0"))
+            after = np.where((q >= 1) & (q <= ndec), fd, after)
+        out = np.where(q >= 0, np.where(q < len(tail), after, 0), out)
+    else:
+        out = np.where(q >= 0, 0, out)
+    return np.ascontiguousarray(out, dtype=np.uint32).view(np.dtype(f"U{width}")).ravel().astype(object)
+
+def _distinct(values):
+    """(codes into uniques with -1 for missing, distinct values as float64, distinct originals)."""
+    s = pd.Series(values)
+    codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    originals = pd.Series(uniques)
+    return codes, originals.to_numpy(dtype=float, na_value=np.nan), originals
+
+def _expand(rendered: np.ndarray, codes: np.ndarray, missing: str) -> np.ndarray:
+    out = np.empty(len(codes), dtype=object)
+    out[:] = np.append(rendered, missing)[codes]     # code -1 picks `missing`
+    return out
+
+def _fill(out: np.ndarray, mask: np.ndarray, original: pd.Series, fn):
+    idx = np.flatnonzero(mask)
+    out[idx] = [fn(v) for v in original.iloc[idx].tolist()]
+    return out
+
+
+# ================= Formatters =================
+def format_int(values, missing: str = "—") -> np.ndarray:
+    """fmt_int: truncate toward zero, thousands separators, `missing` for None / NaN."""
+    codes, x, original = _distinct(values)
+    t = np.trunc(x)
+    slow = ~(np.abs(t) < EXACT_LIMIT)
+    t = np.where(slow, 0, t)
+    out = _fill(_render(np.abs(t).astype(np.int64), t < 0), slow, original, lambda v: f"{int(v):,}")
+    return _expand(out, codes, missing)
+
+def format_fixed(values, ndec: int = 2, suffix: str = " L", divisor: float = None,
+                 missing: str = "—") -> np.ndarray:
+    """f"{x:,.<ndec>f}<suffix>" (of x / divisor when given), `missing` for None / NaN."""
+    codes, x, original = _distinct(values)
+    if divisor is not None:
+        x = x / divisor
+    scaled = x * 10 ** ndec
+    r = np.rint(scaled)
+    # Python rounds the exact binary value; near a tie the scaled product may not
+    # tell which side that is, so those values take the scalar path
+    tie = np.abs(np.abs(scaled - np.floor(scaled)) - 0.5) <= 8 * np.finfo(float).eps * np.abs(scaled)
+    slow = ~(np.abs(r) < EXACT_LIMIT) | tie
+    r = np.where(slow, 0, r)
+    mag = np.abs(r).astype(np.int64)
+    out = _render(mag // 10 ** ndec, np.signbit(x) & ~slow, mag % 10 ** ndec, ndec, suffix)
+    spec = f",.{ndec}f"
+    scalar = (lambda v: f"{v / divisor:{spec}}{suffix}") if divisor is not None else (lambda v: f"{v:{spec}}{suffix}")
+    out = _expand(_fill(out, slow, original, scalar), codes, missing)
+    # factorize folds -0.0 into 0.0, but Python prints it as "-0.00"
+    full = pd.Series(values).to_numpy(dtype=float, na_value=np.nan)
+    out[(full == 0) & np.signbit(full)] = scalar(-0.0)
+    return out
+
+def format_rounded_int(values, missing: str = "0") -> np.ndarray:
+    """fmt_int_or_dash: round half to even, no separators, `missing` for None / NaN."""
+    codes, x, original = _distinct(values)
+    r = np.rint(x)
+    slow = ~(np.abs(r) < EXACT_LIMIT)
+    r = np.where(slow, 0, r)
+    out = _render(np.abs(r).astype(np.int64), r < 0, thousands=False)
+    return _expand(_fill(out, slow, original, lambda v: f"{int(round(v))}"), codes, missing)
+
+def format_lakh_value(values) -> np.ndarray:
+    return format_fixed(values)
+
+def format_lakh_from_rupees(values) -> np.ndarray:
+    return format_fixed(values, divisor=100000)
+
+
+# The apps' KPI_CONFIG formatters name their twin here in a `vectorized`
+# attribute (fmt_int.vectorized = "format_int"); the twin's output is identical
+VECTORIZED = {
+    "format_int": format_int,
+    "format_lakh_value": format_lakh_value,
+    "format_lakh_from_rupees": format_lakh_from_rupees,
+    "format_rounded_int": format_rounded_int,
+}
+
+def format_column(fmt, values) -> np.ndarray:
+    """`fmt` applied to every value: through the twin it declares (`fmt.vectorized`), else per value."""
+    twin = getattr(fmt, "vectorized", None)
+    if twin is not None:
+        return VECTORIZED[twin](values)
+    return np.array([fmt(v) for v in pd.Series(values).tolist()], dtype=object)
+
+
+# ================= Check / benchmark =================
+def sample_values(n: int, seed: int = 0) -> pd.Series:
+    """Stress column: counts, lakh amounts, rupees, negatives, NaN and rounding ties."""
+    rng = np.random.default_rng(seed)
+    kind = rng.integers(0, 5, n)
+    v = np.select(
+        [kind == 0, kind == 1, kind == 2, kind == 3],
+        [rng.integers(0, 60, n), np.round(rng.exponential(40, n), 3), rng.exponential(2e6, n),
+         rng.integers(0, 8, n) + 0.5],
+        rng.normal(0, 1e4, n))
+    v[rng.random(n) < 0.05] = np.nan
+    v[:12] = [0, -0.0, -0.001, 0.005, 0.125, 2.5, -2.5, 999.995, 1e16, -1234567.891, 0.285, 1.005]
+    return pd.Series(v)
+
+def kpi_values(name: str, n: int, seed: int = 0) -> pd.Series:
+    """A column shaped like the KPIs that use formatter `name` (after the left merge: NaN gaps)."""
+    rng = np.random.default_rng(seed)
+    v = {
+        "fmt_int": lambda: rng.integers(0, 400, n).astype(float),
+        "fmt_int_or_dash": lambda: rng.integers(0, 12, n).astype(float),
+        "fmt_lakh_value": lambda: np.round(rng.exponential(40, n), 2),
+        "fmt_lakh_from_rupees": lambda: np.round(rng.exponential(2e6, n)),
+    }[name]()
+    v[rng.random(n) < 0.05] = np.nan
+    return pd.Series(v)
+
+def _best_of(fn, repeat: int = 3):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t)
+    return best, result
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Check and time the vectorized KPI formatters.")
+    ap.add_argument("--rows", type=int, nargs="+", default=[19_000, 200_000])
+    args = ap.parse_args(argv)
+
+    import kpi_config      # the formatters the app uses, each with its declared twin
+    ok = True
+    for n in args.rows:
+        for name in ("fmt_int", "fmt_lakh_value", "fmt_lakh_from_rupees", "fmt_int_or_dash"):
+            fmt = getattr(kpi_config, name)
+            for label, values in (("kpi-like", kpi_values(name, n)), ("stress", sample_values(n))):
+                t_apply, expected = _best_of(lambda: values.apply(fmt).to_numpy(dtype=object))
+                t_vec, got = _best_of(lambda: format_column(fmt, values))
+                same = bool((got == expected).all())
+                ok &= same
+                print(f"{n:>8,} rows  {name:<21} {label:<9} apply {t_apply * 1e3:7.1f} ms"
+                      f"  vectorized {t_vec * 1e3:6.1f} ms  x{t_apply / max(t_vec, 1e-9):5.1f}"
+                      f"  {'identical' if same else 'MISMATCH'}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
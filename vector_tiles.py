@@ -0,0 +1,235 @@
+# Pincode boundaries as Mapbox Vector Tiles
+#
+#   python vector_tiles.py serve [--port 8765]                                  # local tile endpoint
+#   python vector_tiles.py build --out static/tiles [--minzoom 4 --maxzoom 10]   # tile archive
+#
+# Instead of embedding all boundary geometry inline in every folium document,
+# the map can load `/tiles/{z}/{x}/{y}.pbf` for the viewport only. Each tile
+# carries one layer ("pincodes") whose features hold just the integer PIN;
+# KPI values are joined in the browser (map_layers.VectorTileChoropleth), so
+# switching KPI or month never re-sends geometry.
+import os, sys, argparse, functools
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import shapely
+
+from boundary_store import load_boundaries, pick_simplify_level, DEFAULT_LEVELS_M
+
+LAYER_NAME = "pincodes"
+EXTENT = 4096
+BUFFER = 64                      # tile units of overlap, hides seams at tile edges
+WORLD_M = 20037508.342789244     # half the EPSG:3857 world width
+
+
+# ================= Protobuf primitives =================
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return bytes(out)
+
+def _zigzag(n: int) -> int:
+    return (n << 1) ^ (n >> 63)
+
+def _key(field: int, wire: int) -> bytes:
+    return _varint((field << 3) | wire)
+
+def _len_field(field: int, payload: bytes) -> bytes:
+    return _key(field, 2) + _varint(len(payload)) + payload
+
+def _packed(field: int, values) -> bytes:
+    return _len_field(field, b"".join(_varint(v) for v in values))
+
+
+# ================= Geometry encoding =================
+def _ring_commands(ring, cursor):
+    """MoveTo + LineTo* + ClosePath for one ring of integer tile coordinates."""
+    cmds = []
+    x, y = int(ring[0][0]), int(ring[0][1])
+    cmds += [(1 & 0x7) | (1 << 3), _zigzag(x - cursor[0]), _zigzag(y - cursor[1])]
+    cursor = (x, y)
+    rest = ring[1:-1]
+    cmds.append((2 & 0x7) | (len(rest) << 3))
+    for px, py in rest:
+        px, py = int(px), int(py)
+        cmds += [_zigzag(px - cursor[0]), _zigzag(py - cursor[1])]
+        cursor = (px, py)
+    cmds.append((7 & 0x7) | (1 << 3))
+    return cmds, cursor
+
+def _clean_ring(coords):
+    """Drop repeated vertices; None if the ring no longer encloses any area."""
+    keep = np.r_[True, (coords[1:] != coords[:-1]).any(axis=1)]
+    coords = coords[keep]
+    if len(coords) < 4:
+        return None
+    x, y = coords[:, 0], coords[:, 1]
+    area2 = np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1])
+    return (coords, area2) if area2 != 0 else None
+
+def encode_polygon(geom, to_tile) -> list:
+    """Command stream for a (Multi)Polygon already in EPSG:3857.
+
+    MVT wants exterior rings with a positive shoelace area in (y-down) tile
+    coordinates and holes with a negative one; rings are reversed as needed.
+    """
+    cmds, cursor = [], (0, 0)
+    for poly in shapely.get_parts(geom):
+        rings = [poly.exterior, *poly.interiors]
+        for i, ring in enumerate(rings):
+            cleaned = _clean_ring(to_tile(np.asarray(ring.coords)))
+            if cleaned is None:
+                if i == 0: break    # exterior vanished: skip the part
+                continue
+            coords, area2 = cleaned
+            if (area2 > 0) != (i == 0):
+                coords = coords[::-1]
+            c, cursor = _ring_commands(coords, cursor)
+            cmds += c
+    return cmds
+
+def encode_tile(features, layer_name: str = LAYER_NAME, extent: int = EXTENT) -> bytes:
+    """features: iterable of (int_id, command_list). Each gets a single `pin` tag."""
+    keys = _len_field(3, b"pin")
+    feats, values = [], []
+    for fid, cmds in features:
+        if not cmds:
+            continue
+        body = _key(1, 0) + _varint(fid) + _packed(2, [0, len(values)]) \
+            + _key(3, 0) + _varint(3) + _packed(4, cmds)
+        feats.append(_len_field(2, body))
+        values.append(_len_field(4, _key(5, 0) + _varint(fid)))   # Value.uint_value
+    if not feats:
+        return b""
+    layer = _key(15, 0) + _varint(2) + _len_field(1, layer_name.encode()) \
+        + b"".join(feats) + keys + b"".join(values) + _key(5, 0) + _varint(extent)
+    return _len_field(3, layer)
+
+
+# ================= Tile source =================
+def tile_bounds(z: int, x: int, y: int):
+    size = 2 * WORLD_M / (2 ** z)
+    minx = -WORLD_M + x * size
+    maxy = WORLD_M - y * size
+    return minx, maxy - size, minx + size, maxy
+
+class TileSource:
+    """Cuts MVT tiles on demand from the cached boundary pyramid.
+
+    Each zoom uses the pyramid level pick_simplify_level() would choose for it,
+    then simplifies once more to half a tile pixel after clipping.
+    """
+
+    def __init__(self, geojson_path: str, levels=DEFAULT_LEVELS_M, cache_size: int = 4096):
+        self.geojson_path = geojson_path
+        self.levels = list(levels)
+        self._levels = {}
+        self.tile = functools.lru_cache(maxsize=cache_size)(self._tile)
+
+    def _level(self, simplify_m: int):
+        if simplify_m not in self._levels:
+            gdf, pin_col = load_boundaries(self.geojson_path, simplify_m)
+            geoms = gdf.to_crs(epsg=3857).geometry.values
+            pins = gdf[pin_col].astype(int).to_numpy()
+            self._levels[simplify_m] = (np.asarray(geoms), pins, shapely.STRtree(geoms))
+        return self._levels[simplify_m]
+
+    def _tile(self, z: int, x: int, y: int) -> bytes:
+        geoms, pins, tree = self._level(pick_simplify_level(self.levels, z))
+        minx, miny, maxx, maxy = tile_bounds(z, x, y)
+        size = maxx - minx
+        pad = size * BUFFER / EXTENT
+        hits = tree.query(shapely.box(minx - pad, miny - pad, maxx + pad, maxy + pad))
+        if len(hits) == 0:
+            return b""
+        clipped = shapely.clip_by_rect(geoms[hits], minx - pad, miny - pad, maxx + pad, maxy + pad)
+        clipped = shapely.simplify(clipped, size / 256 / 2, preserve_topology=True)
+        scale = EXTENT / size
+        to_tile = lambda c: np.rint(np.c_[(c[:, 0] - minx) * scale, (maxy - c[:, 1]) * scale]).astype(np.int64)
+        feats = ((int(pins[i]), encode_polygon(g, to_tile))
+                 for i, g in zip(hits, clipped) if not shapely.is_empty(g))
+        return encode_tile(feats)
+
+
+# ================= Serving / export =================
+def make_handler(source: TileSource, max_age: int = 86400):
+    class TileHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = self.path.split("?")[0].strip("/").split("/")
+            try:
+                assert len(parts) == 4 and parts[0] == "tiles" and parts[3].endswith(".pbf")
+                z, x, y = int(parts[1]), int(parts[2]), int(parts[3][:-4])
+                assert 0 <= z <= 22 and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+            except (AssertionError, ValueError):
+                self.send_error(404)
+                return
+            data = source.tile(z, x, y)
+            self.send_response(200 if data else 204)
+            self.send_header("Content-Type", "application/x-protobuf")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Cache-Control", f"public, max-age={max_age}")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+    return TileHandler
+
+def serve(geojson_path: str, host: str = "127.0.0.1", port: int = 8765):
+    server = ThreadingHTTPServer((host, port), make_handler(TileSource(geojson_path)))
+    print(f"serving pincode tiles on http://{host}:{port}/tiles/{{z}}/{{x}}/{{y}}.pbf")
+    server.serve_forever()
+
+def export_tiles(geojson_path: str, out_dir: str, minzoom: int = 4, maxzoom: int = 10) -> int:
+    """Write every non-empty tile over the boundary extent to out_dir/{z}/{x}/{y}.pbf."""
+    source = TileSource(geojson_path, cache_size=0)
+    gdf, _ = load_boundaries(geojson_path, min(source.levels))
+    bx0, by0, bx1, by1 = gdf.to_crs(epsg=3857).total_bounds
+    written = 0
+    for z in range(minzoom, maxzoom + 1):
+        size = 2 * WORLD_M / (2 ** z)
+        x0, x1 = int((bx0 + WORLD_M) // size), int((bx1 + WORLD_M) // size)
+        y0, y1 = int((WORLD_M - by1) // size), int((WORLD_M - by0) // size)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                data = source.tile(z, x, y)
+                if not data:
+                    continue
+                path = os.path.join(out_dir, str(z), str(x), f"{y}.pbf")
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(data)
+                written += 1
+    return written
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Pincode boundary vector tiles.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("serve", help="run a local tile endpoint")
+    s.add_argument("geojson", nargs="?", default="All_India_pincode_Boundary-19312.geojson")
+    s.add_argument("--host", default="127.0.0.1")
+    s.add_argument("--port", type=int, default=8765)
+    b = sub.add_parser("build", help="write a {z}/{x}/{y}.pbf tile archive")
+    b.add_argument("geojson", nargs="?", default="All_India_pincode_Boundary-19312.geojson")
+    b.add_argument("--out", default=os.path.join("static", "tiles"))
+    b.add_argument("--minzoom", type=int, default=4)
+    b.add_argument("--maxzoom", type=int, default=10)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "serve":
+        serve(args.geojson, args.host, args.port)
+    else:
+        n = export_tiles(args.geojson, args.out, args.minzoom, args.maxzoom)
+        print(f"wrote {n} tiles to {args.out}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())